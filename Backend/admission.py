@@ -0,0 +1,141 @@
+import os
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from starlette.responses import JSONResponse
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_LIMITS, ADMISSION_REJECTED, register_stats
+
+# Richieste contemporanee ammesse (lavoro in corso sul database); 0 = nessun limite
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "200"))
+# Valore di Retry-After (secondi) nelle risposte 503 per sovraccarico
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+# Percorsi esclusi dal limite globale (le sonde devono rispondere anche sotto carico)
+ADMISSION_EXEMPT_PATHS = frozenset(
+    p.strip() for p in os.getenv("ADMISSION_EXEMPT_PATHS", "/,/health,/health/live,/health/ready").split(",") if p.strip()
+)
+
+# Rate limit per utente (token bucket sul 'sub' del token): richieste al secondo e burst; 0 = disattivato
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+# Utenti di cui si tiene il bucket in memoria (LRU): un bucket rimosso riparte pieno
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+
+
+class RateLimiter:
+    """
+    Token bucket per utente.
+
+    Ogni utente ha un bucket di `burst` gettoni che si ricarica di `rate`
+    gettoni al secondo; ogni richiesta ne consuma uno. Il bucket è
+    ricalcolato solo quando l'utente fa una richiesta (nessun timer) e i
+    bucket sono tenuti in un OrderedDict limitato a `maxusers` voci.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: int = RATE_LIMIT_BURST, maxusers: int = RATE_LIMIT_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.maxusers = maxusers
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()  # sub -> [gettoni, ultimo aggiornamento]
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def acquire(self, key: Hashable) -> Optional[float]:
+        """Consuma un gettone: None se la richiesta è ammessa, altrimenti i secondi da attendere"""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            if len(self._buckets) > self.maxusers:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return None
+
+        self.rejected += 1
+        ADMISSION_REJECTED.labels("rate_limit").inc()
+        return (1 - bucket[0]) / self.rate
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._buckets),
+            "evictions": self.evictions,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "rate": self.rate,
+            "burst": self.burst,
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    """Valore di Retry-After: secondi interi, arrotondati per eccesso"""
+    return str(max(1, math.ceil(seconds)))
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI che limita le richieste in corso a `max_in_flight`.
+
+    Oltre il limite la richiesta non viene accodata: riceve subito un 503
+    con Retry-After, così sotto picco di traffico la latenza delle richieste
+    ammesse resta limitata invece di crescere con la coda. Sonde e
+    preflight CORS sono esclusi.
+    """
+
+    def __init__(self, app, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, retry_after: int = ADMISSION_RETRY_AFTER):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+        ADMISSION_LIMITS.labels("max_in_flight").set(max_in_flight)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.max_in_flight <= 0
+            or scope["method"] == "OPTIONS"
+            or scope["path"] in ADMISSION_EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= self.max_in_flight:
+            ADMISSION_REJECTED.labels("overload").inc()
+            response = JSONResponse(
+                {"detail": "Server sovraccarico, riprovare più tardi"},
+                status_code=503,
+                headers={"Retry-After": retry_after_header(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        ADMISSION_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.dec()
+
+
+rate_limiter = RateLimiter()
+register_stats("rate_limit", rate_limiter.stats)
+ADMISSION_LIMITS.labels("rate_per_second").set(RATE_LIMIT_PER_SECOND)
+ADMISSION_LIMITS.labels("burst").set(RATE_LIMIT_BURST)
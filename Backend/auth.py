@@ -1,9 +1,19 @@
 import os
-import httpx
+import time
+import logging
+import hashlib
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
+from jose.backends.base import Key
 from typing import Optional
+from cache import TTLCache
+from jwks import JWKSManager
+from logging_config import get_logger, AUTH_DEBUG_TOKENS
+from metrics import AUTH_VERIFY_DURATION, register_stats
+from admission import rate_limiter, retry_after_header
+
+logger = get_logger("auth")
 
 # Configurazione Keycloak
 KEYCLOAK_URL = os.getenv("KEYCLOAK_URL", "http://keycloak:8080")
@@ -13,13 +23,26 @@ KEYCLOAK_CLIENT_ID = os.getenv("KEYCLOAK_CLIENT_ID", "bookslibrary-frontend")
 # URL per ottenere le chiavi pubbliche di Keycloak
 KEYCLOAK_CERTS_URL = f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/certs"
 
-# Cache per le chiavi pubbliche
-public_keys_cache = None
+# Gestione delle chiavi pubbliche (JWKS) con refresh in background
+JWKS_TTL = float(os.getenv("JWKS_TTL", "3600"))
+JWKS_MIN_REFETCH_INTERVAL = float(os.getenv("JWKS_MIN_REFETCH_INTERVAL", "30"))
+jwks_manager = JWKSManager(
+    KEYCLOAK_CERTS_URL,
+    ttl=JWKS_TTL,
+    min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL
+)
+
+# Cache dei token già verificati (chiave: digest SHA-256 del token)
+# Ogni voce scade al più tardi all'expiration ('exp') del token
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+register_stats("token", token_cache.stats)
 
 security = HTTPBearer()
 
 
-async def get_public_keys():
+async def get_public_keys() -> dict:
     """
     Ottiene le chiavi pubbliche da Keycloak per validare i token JWT.
     
@@ -27,37 +50,29 @@ async def get_public_keys():
     Queste chiavi pubbliche vengono usate per verificare che i token siano stati
     firmati da Keycloak con la corrispondente chiave privata.
     
-    Il JWKS viene cachato per evitare richieste ripetute a Keycloak.
+    Il JWKS è gestito da jwks_manager (vedi jwks.JWKSManager), che lo tiene in
+    cache e lo aggiorna periodicamente in background.
     """
-    global public_keys_cache
+    keys = await jwks_manager.get_keys()
     
-    if public_keys_cache is None:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(KEYCLOAK_CERTS_URL)
-                response.raise_for_status()
-                jwks = response.json()
-                public_keys_cache = jwks
-                print(f"✅ Chiavi pubbliche ottenute da Keycloak: {len(jwks.get('keys', []))} chiavi disponibili")
-        except Exception as e:
-            print(f"Errore nel recupero delle chiavi pubbliche: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Impossibile recuperare le chiavi di validazione"
-            )
+    if not keys:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Impossibile recuperare le chiavi di validazione"
+        )
     
-    return public_keys_cache
+    return jwks_manager.jwks
 
 
-def get_public_key(token: str, jwks: dict):
+async def get_public_key(token: str) -> Optional[Key]:
     """
     Ottiene la chiave pubblica appropriata per validare il token.
     
     Ogni token JWT contiene un 'kid' (Key ID) nell'header che identifica
     quale chiave pubblica è stata usata per firmarlo. Questa funzione:
     1. Estrae il 'kid' dall'header del token
-    2. Cerca la chiave corrispondente nel JWKS ottenuto da Keycloak
-    3. Restituisce la chiave pubblica RSA per la validazione
+    2. Cerca la chiave corrispondente nell'indice del jwks_manager
+    3. Restituisce la chiave pubblica (già costruita) per la validazione
     """
     try:
         # Decodifica l'header del token per ottenere il kid (key ID)
@@ -65,23 +80,19 @@ def get_public_key(token: str, jwks: dict):
         kid = unverified_header.get("kid")
         
         if not kid:
-            print("⚠️ Token senza 'kid' nell'header")
+            logger.warning("Token senza 'kid' nell'header")
             return None
         
-        # Trova la chiave corrispondente nel JWKS
-        for key in jwks.get("keys", []):
-            if key.get("kid") == kid:
-                print(f"✅ Chiave pubblica trovata per kid: {kid}")
-                return key
-        
-        print(f"⚠️ Nessuna chiave pubblica trovata per kid: {kid}")
-        return None
-    except Exception as e:
-        print(f"Errore nel recupero della chiave pubblica: {e}")
+        key = await jwks_manager.get_key(kid)
+        if key is None:
+            logger.warning("Nessuna chiave pubblica trovata per kid", extra={"kid": kid})
+        return key
+    except JWTError as e:
+        logger.warning("Errore nel recupero della chiave pubblica: %s", e)
         return None
 
 
-async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+async def decode_token(token: str) -> dict:
     """
     Verifica e decodifica il token JWT di Keycloak.
     
@@ -95,14 +106,12 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     solo Keycloak (che possiede la chiave privata) può creare token con
     una firma valida.
     """
-    token = credentials.credentials
-    
     try:
-        # Ottieni le chiavi pubbliche
-        jwks = await get_public_keys()
+        # Verifica che il JWKS sia disponibile (503 se Keycloak non è raggiungibile)
+        await get_public_keys()
         
         # Ottieni la chiave pubblica appropriata
-        public_key = get_public_key(token, jwks)
+        public_key = await get_public_key(token)
         
         if not public_key:
             raise HTTPException(
@@ -110,30 +119,17 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
                 detail="Chiave di validazione non trovata"
             )
         
-        # Costruisci la chiave pubblica in formato PEM
-        from cryptography.hazmat.primitives.asymmetric import rsa
-        from cryptography.hazmat.backends import default_backend
-        from cryptography.hazmat.primitives import serialization
-        import base64
-        
-        # Estrai i componenti della chiave RSA
-        n = int.from_bytes(base64.urlsafe_b64decode(public_key["n"] + "=="), "big")
-        e = int.from_bytes(base64.urlsafe_b64decode(public_key["e"] + "=="), "big")
-        
-        # Costruisci la chiave RSA
-        public_key_obj = rsa.RSAPublicNumbers(e, n).public_key(default_backend())
-        pem_key = public_key_obj.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        
-        # Decodifica il token senza validazione per vedere il contenuto
-        unverified_payload = jwt.get_unverified_claims(token)
-        print(f"Token payload (non verificato): {unverified_payload}")
-        print(f"Audience nel token: {unverified_payload.get('aud')}")
-        print(f"Issuer nel token: {unverified_payload.get('iss')}")
-        print(f"Expected audience: {KEYCLOAK_CLIENT_ID}")
-        print(f"Expected issuer: {KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}")
+        # Traccia di debug (solo se abilitata): audience/issuer attesi e presenti nel token,
+        # senza mai scrivere nei log il payload completo
+        if AUTH_DEBUG_TOKENS and logger.isEnabledFor(logging.DEBUG):
+            unverified_payload = jwt.get_unverified_claims(token)
+            logger.debug("Claim del token (non verificati)", extra={
+                "aud": unverified_payload.get("aud"),
+                "iss": unverified_payload.get("iss"),
+                "exp": unverified_payload.get("exp"),
+                "expected_aud": KEYCLOAK_CLIENT_ID,
+                "expected_iss": f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}"
+            })
         
         # Valida e decodifica il token
         # Per i client pubblici, l'audience potrebbe essere una lista o il client ID
@@ -141,55 +137,55 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         try:
             payload = jwt.decode(
                 token,
-                pem_key,
+                public_key,
                 algorithms=["RS256"],
                 audience=KEYCLOAK_CLIENT_ID,
                 issuer=f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}",
                 options={"verify_aud": True, "verify_iss": True}
             )
         except JWTError as aud_error:
-            print(f"Errore validazione audience/issuer: {aud_error}")
+            logger.debug("Errore validazione audience/issuer: %s", aud_error)
             # Prova senza validazione dell'audience (per client pubblici)
             try:
                 payload = jwt.decode(
                     token,
-                    pem_key,
+                    public_key,
                     algorithms=["RS256"],
                     issuer=f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}",
                     options={"verify_aud": False, "verify_iss": True}
                 )
-                print("Token validato senza controllo audience")
+                logger.debug("Token validato senza controllo audience")
             except JWTError as iss_error:
-                print(f"Errore validazione issuer: {iss_error}")
+                logger.debug("Errore validazione issuer: %s", iss_error)
                 # Prova solo con la firma
                 payload = jwt.decode(
                     token,
-                    pem_key,
+                    public_key,
                     algorithms=["RS256"],
                     options={"verify_signature": True, "verify_aud": False, "verify_iss": False, "verify_exp": True}
                 )
-                print("Token validato solo con firma ed expiration")
+                logger.debug("Token validato solo con firma ed expiration")
         
         return payload
         
+    except HTTPException:
+        raise
     except JWTError as e:
-        print(f"Errore validazione JWT: {e}")
+        logger.info("Errore validazione JWT: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token non valido o scaduto"
         )
     except Exception as e:
-        print(f"Errore generico nella validazione: {e}")
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Errore generico nella validazione: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Errore nella validazione del token"
         )
 
 
-async def get_current_user(token_data: dict = Depends(verify_token)) -> dict:
-    """Ottiene i dati dell'utente corrente dal token"""
+def build_user(token_data: dict) -> dict:
+    """Costruisce i dati dell'utente a partire dai claim del token"""
     return {
         "username": token_data.get("preferred_username") or token_data.get("sub"),
         "email": token_data.get("email"),
@@ -199,6 +195,74 @@ async def get_current_user(token_data: dict = Depends(verify_token)) -> dict:
     }
 
 
+async def get_verified_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """
+    Restituisce la voce di cache del token verificato: {"payload": ..., "user": ...}.
+    
+    Se il token è già stato verificato (ed è ancora valido) i claim e i ruoli
+    vengono letti dalla cache, evitando la ricostruzione della chiave RSA e
+    la decodifica JWT. Altrimenti il token viene verificato con decode_token
+    e salvato in cache fino al suo 'exp' (al massimo TOKEN_CACHE_TTL secondi).
+    """
+    token = credentials.credentials
+    cache_key = hashlib.sha256(token.encode()).digest()
+    
+    entry = token_cache.get(cache_key)
+    if entry is not None:
+        enforce_rate_limit(entry, cache_key)
+        return entry
+    
+    start = time.perf_counter()
+    try:
+        payload = await decode_token(token)
+    except HTTPException:
+        AUTH_VERIFY_DURATION.labels("rejected").observe(time.perf_counter() - start)
+        raise
+    AUTH_VERIFY_DURATION.labels("ok").observe(time.perf_counter() - start)
+    
+    entry = {"payload": payload, "user": build_user(payload)}
+    
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)) and exp > time.time():
+        token_cache.set(cache_key, entry, expires_at=exp)
+    elif exp is None:
+        token_cache.set(cache_key, entry)
+    
+    enforce_rate_limit(entry, cache_key)
+    return entry
+
+
+def enforce_rate_limit(entry: dict, token_digest: bytes) -> None:
+    """
+    Rate limit per utente (token bucket sul 'sub'): oltre la soglia risponde 429 con Retry-After.
+    
+    I token senza 'sub' hanno un bucket per token (il digest SHA-256), così
+    non condividono tutti lo stesso bucket.
+    """
+    attesa = rate_limiter.acquire(entry["user"]["sub"] or token_digest)
+    if attesa is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Troppe richieste, riprovare più tardi",
+            headers={"Retry-After": retry_after_header(attesa)}
+        )
+
+
+async def verify_token(entry: dict = Depends(get_verified_token)) -> dict:
+    """Verifica il token JWT di Keycloak e restituisce i claim (vedi decode_token)"""
+    return entry["payload"]
+
+
+def get_token_cache_stats() -> dict:
+    """Restituisce i contatori della cache dei token verificati"""
+    return token_cache.stats()
+
+
+async def get_current_user(entry: dict = Depends(get_verified_token)) -> dict:
+    """Ottiene i dati dell'utente corrente dal token"""
+    return dict(entry["user"])
+
+
 def get_user_roles(token_data: dict) -> list:
     """
     Estrae i ruoli dell'utente dal token JWT.
@@ -235,8 +299,9 @@ def require_role(required_role: str):
     ):
         ...
     """
-    async def role_checker(token_data: dict = Depends(verify_token)) -> dict:
-        user_roles = get_user_roles(token_data)
+    async def role_checker(entry: dict = Depends(get_verified_token)) -> dict:
+        user = entry["user"]
+        user_roles = user["roles"]
         
         if required_role not in user_roles:
             raise HTTPException(
@@ -244,13 +309,7 @@ def require_role(required_role: str):
                 detail=f"Operazione non consentita. Ruolo richiesto: {required_role}"
             )
         
-        return {
-            "username": token_data.get("preferred_username") or token_data.get("sub"),
-            "email": token_data.get("email"),
-            "name": token_data.get("name"),
-            "sub": token_data.get("sub"),
-            "roles": user_roles
-        }
+        return dict(user)
     
     return role_checker
 
@@ -268,8 +327,9 @@ def require_any_role(*required_roles: str):
     ):
         ...
     """
-    async def role_checker(token_data: dict = Depends(verify_token)) -> dict:
-        user_roles = get_user_roles(token_data)
+    async def role_checker(entry: dict = Depends(get_verified_token)) -> dict:
+        user = entry["user"]
+        user_roles = user["roles"]
         
         if not any(role in user_roles for role in required_roles):
             raise HTTPException(
@@ -277,13 +337,7 @@ def require_any_role(*required_roles: str):
                 detail=f"Operazione non consentita. Ruoli richiesti: {', '.join(required_roles)}"
             )
         
-        return {
-            "username": token_data.get("preferred_username") or token_data.get("sub"),
-            "email": token_data.get("email"),
-            "name": token_data.get("name"),
-            "sub": token_data.get("sub"),
-            "roles": user_roles
-        }
+        return dict(user)
     
     return role_checker
 
@@ -0,0 +1,165 @@
+"""
+Benchmark di /libri/search a concorrenza crescente, prima e dopo una modifica.
+
+Usa le stesse parti di loadtest.py (catalogo sintetico, Keycloak finto,
+backend uvicorn in un sottoprocesso, client httpx) e misura solo lo
+scenario "search" dell'endpoint HTTP, ai livelli di --concurrency
+(default 50, 200, 1000 client).
+
+Con --before <ref git> lo stesso benchmark viene eseguito anche sul backend
+di quella revisione (estratta in un git worktree temporaneo), sullo stesso
+catalogo: ad esempio il commit precedente al passaggio dal bridge a thread
+(ThreadPoolExecutor con 4 worker) al driver asyncio Motor. Il risultato è
+una tabella Markdown con throughput e latenze p50/p95 di entrambe le
+revisioni, da riportare nel messaggio di commit o in una PR.
+
+Uso (da Backend/, con un mongod raggiungibile):
+    python benchmarks/bench_search_concurrency.py --mongodb-url mongodb://localhost:27017 \\
+        --catalog-size 10000 --concurrency 50 200 1000 --before <commit>
+
+Il database indicato da --db-name viene svuotato e ripopolato: il database
+dell'applicazione (MONGODB_DB_NAME) non è accettato. I risultati grezzi in
+JSON vanno in benchmarks/results/ (escluso da git, come quelli di loadtest.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pymongo import MongoClient
+
+from catalog import seed_collection
+from stub_keycloak import StubKeycloak
+from loadtest import (
+    BACKEND_DIR, REALM, CLIENT_ID, scenario_search, free_port, git_commit, start_backend, run_scenario
+)
+
+
+def resolve_ref(ref: str) -> str:
+    return subprocess.check_output(["git", "rev-parse", "--short", ref], cwd=BACKEND_DIR).decode().strip()
+
+
+def checkout_backend(ref: str, directory: str) -> str:
+    """Estrae la revisione `ref` in un worktree temporaneo e restituisce la sua cartella Backend"""
+    subprocess.check_call(
+        ["git", "worktree", "add", "--detach", directory, ref],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL
+    )
+    return os.path.join(directory, "Backend")
+
+
+def remove_worktree(directory: str) -> None:
+    subprocess.call(
+        ["git", "worktree", "remove", "--force", directory],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def measure(args, stub: StubKeycloak, token: str, backend_dir: str) -> List[dict]:
+    """Esegue lo scenario search a ogni livello di concorrenza su un backend avviato da `backend_dir`"""
+    port = free_port()
+    backend = start_backend(args, stub, port, backend_dir=backend_dir)
+    risultati = []
+    try:
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_scenario(
+                f"http://127.0.0.1:{port}", token, scenario_search, [],
+                concurrency, args.duration, args.warmup, args.seed
+            ))
+            risultati.append({"concurrency": concurrency, **result})
+            lat = result["latency_ms"]
+            print(f"  c={concurrency:<5} {result['throughput_rps']:>9.1f} req/s  "
+                  f"p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms  "
+                  f"errori={sum(result['errors'].values())}", flush=True)
+    finally:
+        backend.terminate()
+        backend.wait(timeout=30)
+    return risultati
+
+
+def markdown_table(revisioni: dict) -> str:
+    """Tabella con una riga per livello di concorrenza e le colonne di ogni revisione"""
+    nomi = list(revisioni)
+    intestazione = "| client | " + " | ".join(f"{n} req/s | {n} p50 ms | {n} p95 ms" for n in nomi) + " |"
+    righe = [intestazione, "|---:|" + "---:|" * (3 * len(nomi))]
+    for i, riga in enumerate(revisioni[nomi[0]]):
+        celle = []
+        for nome in nomi:
+            r = revisioni[nome][i]
+            celle += [f"{r['throughput_rps']:.1f}", f"{r['latency_ms']['p50']:.1f}", f"{r['latency_ms']['p95']:.1f}"]
+        righe.append(f"| {riga['concurrency']} | " + " | ".join(celle) + " |")
+    return "\n".join(righe)
+
+
+def main(args) -> None:
+    mongo = MongoClient(args.mongodb_url)
+    print(f"Popolamento catalogo: {args.catalog_size} libri...", flush=True)
+    seed_collection(mongo[args.db_name].libri, args.catalog_size, seed=args.seed)
+    mongo.close()
+
+    stub = StubKeycloak(REALM, CLIENT_ID).start()
+    token = stub.token(roles=("user",), ttl=24 * 3600)
+
+    revisioni = {}
+    worktree: Optional[str] = None
+    try:
+        if args.before:
+            before = resolve_ref(args.before)
+            worktree = tempfile.mkdtemp(prefix="bench-before-")
+            os.rmdir(worktree)
+            print(f"Prima ({before}):", flush=True)
+            revisioni[f"prima {before}"] = measure(args, stub, token, checkout_backend(before, worktree))
+        after = git_commit()
+        print(f"Dopo ({after}):", flush=True)
+        revisioni[f"dopo {after}"] = measure(args, stub, token, BACKEND_DIR)
+    finally:
+        if worktree:
+            remove_worktree(worktree)
+        stub.stop()
+
+    tabella = markdown_table(revisioni)
+    print()
+    print(tabella)
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "catalog_size": args.catalog_size,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+        },
+        "revisioni": revisioni,
+        "tabella": tabella,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRisultati scritti in {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="bookslibrary_bench", help="Database di benchmark (viene svuotato)")
+    parser.add_argument("--catalog-size", type=int, default=10000, help="Libri sintetici nel catalogo")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--before", help="Revisione git da misurare come riferimento (es. il commit precedente alla modifica)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Secondi misurati per livello di concorrenza")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Secondi di warm-up non misurati")
+    parser.add_argument("--seed", type=int, default=42, help="Seed per catalogo e richieste")
+    parser.add_argument("--startup-timeout", type=float, default=600.0, help="Attesa massima per l'avvio del backend")
+    parser.add_argument(
+        "--output",
+        default=os.path.join(BACKEND_DIR, "benchmarks", "results", f"search-{datetime.now():%Y%m%d-%H%M%S}.json")
+    )
+    args = parser.parse_args()
+    if args.db_name == os.getenv("MONGODB_DB_NAME"):
+        parser.error(f"--db-name {args.db_name} è il database dell'applicazione, che verrebbe svuotato")
+    main(args)
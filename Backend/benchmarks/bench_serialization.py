@@ -0,0 +1,123 @@
+"""
+Micro-benchmark della serializzazione delle risposte dei libri.
+
+Confronta, su una pagina di documenti MongoDB sintetici:
+- "pydantic": il percorso precedente (convert_objectid, default dei campi,
+  copia in filter_libro_for_user, LibroResponse(**...), poi validazione e
+  serializzazione del response_model come fa FastAPI, infine json.dumps);
+- "orjson": serialization.dumps_libri, dai documenti grezzi ai bytes JSON.
+
+Verifica anche che i due percorsi producano lo stesso JSON.
+
+Uso (da Backend/):
+    python benchmarks/bench_serialization.py --docs 1000 --rounds 50
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import LibroResponse  # noqa: E402
+from database import convert_objectid  # noqa: E402
+from serialization import dumps_libri  # noqa: E402
+
+
+def filter_libro_for_user(libro_dict: dict, is_admin: bool) -> dict:
+    """Copia del filtro precedente di routes/libri.py"""
+    libro_filtered = libro_dict.copy()
+    if not is_admin:
+        libro_filtered.pop("affittato_da", None)
+    return libro_filtered
+
+
+def make_docs(count: int) -> List[dict]:
+    """Documenti come restituiti da MongoDB (ObjectId, datetime naive, campi a volte mancanti)"""
+    base = datetime(2024, 1, 1, 10, 30)
+    docs = []
+    for i in range(count):
+        doc = {
+            "_id": ObjectId(),
+            "titolo": f"Libro di prova numero {i}",
+            "language": "it",
+            "authors": [f"Autore {i % 100}", "Coautore"],
+            "publisher": f"Editore {i % 20}",
+            "isbn_10": f"{i:010d}",
+            "pageCount": 100 + i % 400,
+            "thumbnail": f"http://books.example/{i}.jpg",
+            "publishedDate": "2001-05-01",
+            "categories": ["Romanzo"],
+        }
+        if i % 3:
+            doc.update({
+                "prenotazione": False,
+                "affittato_da": "Mario Rossi",
+                "data_concessione": base + timedelta(days=i % 30),
+                "data_restituzione": base + timedelta(days=30 + i % 30, milliseconds=123),
+                "stato_libro": "ottimo",
+            })
+        docs.append(doc)
+    return docs
+
+
+def pydantic_path(docs: List[dict], is_admin: bool, adapter: TypeAdapter) -> bytes:
+    libri = []
+    for libro in docs:
+        libro = convert_objectid(libro)
+        libro["id"] = libro["_id"]
+        if "prenotazione" not in libro:
+            libro["prenotazione"] = True
+        if "stato_libro" not in libro:
+            libro["stato_libro"] = "buono"
+        libri.append(LibroResponse(**filter_libro_for_user(libro, is_admin)))
+
+    # Passi eseguiti da FastAPI per un response_model List[LibroResponse]
+    content = [libro.model_dump(by_alias=True) for libro in libri]
+    validated = adapter.validate_python(content)
+    data = adapter.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def orjson_path(docs: List[dict], is_admin: bool, adapter: TypeAdapter) -> bytes:
+    return dumps_libri(docs, is_admin)
+
+
+def bench(name, func, docs, is_admin, rounds, adapter) -> float:
+    # Il percorso Pydantic modifica i documenti: ogni round lavora su una copia preparata prima
+    batches = [copy.deepcopy(docs) for _ in range(rounds)]
+    start = time.perf_counter()
+    for batch in batches:
+        func(batch, is_admin, adapter)
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{name:<10} {elapsed * 1000:>9.2f} ms per pagina ({len(docs)} libri)")
+    return elapsed
+
+
+def main(args) -> None:
+    adapter = TypeAdapter(List[LibroResponse])
+    docs = make_docs(args.docs)
+
+    for is_admin in (True, False):
+        old = json.loads(pydantic_path(copy.deepcopy(docs), is_admin, adapter))
+        new = json.loads(orjson_path(copy.deepcopy(docs), is_admin, adapter))
+        assert old == new, "I due percorsi producono JSON diversi"
+
+        print(f"--- utente {'admin' if is_admin else 'non admin'} ---")
+        slow = bench("pydantic", pydantic_path, docs, is_admin, args.rounds, adapter)
+        fast = bench("orjson", orjson_path, docs, is_admin, args.rounds, adapter)
+        print(f"speedup    {slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000, help="Libri per pagina")
+    parser.add_argument("--rounds", type=int, default=50, help="Ripetizioni per misura")
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+"""
+Generatore di cataloghi sintetici per i benchmark.
+
+I libri sono deterministici a parità di seed, con una distribuzione
+realistica di lingue, categorie ed editori e una parte di libri in prestito
+(alcuni scaduti), così da esercitare anche le query sui prestiti.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+# Documento delle statistiche del catalogo (STATS_COLLECTION / STATS_ID in catalog_stats.py)
+STATS_COLLECTION = "statistiche"
+STATS_ID = "libri"
+
+WORDS = [
+    "rosa", "nome", "mare", "notte", "città", "storia", "guerra", "pace", "amore", "viaggio",
+    "giardino", "luna", "sole", "tempo", "memoria", "silenzio", "fiume", "montagna", "isola", "vento",
+    "ombra", "luce", "casa", "strada", "sogno", "inverno", "estate", "cuore", "segreto", "porta",
+]
+LANGUAGES = ["it", "it", "it", "en", "en", "fr", "de", "es"]
+CATEGORIES = ["Romanzo", "Saggio", "Storia", "Poesia", "Fantascienza", "Giallo", "Biografia", "Filosofia"]
+STATI = ["pessimo", "discreto", "buono", "buono", "ottimo"]
+BORROWERS = [f"Utente {i}" for i in range(200)]
+
+
+def make_libro(i: int, rng: random.Random, now: datetime) -> dict:
+    """Crea il documento sintetico numero `i`"""
+    titolo = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).capitalize()
+    libro = {
+        "titolo": f"{titolo} {i}",
+        "language": rng.choice(LANGUAGES),
+        "authors": [f"Autore {rng.randint(0, 5000)}"],
+        "publisher": f"Editore {rng.randint(0, 300)}",
+        "isbn_10": f"{i:010d}",
+        "pageCount": rng.randint(80, 900),
+        "thumbnail": None,
+        "publishedDate": str(rng.randint(1900, 2024)),
+        "categories": [rng.choice(CATEGORIES)],
+        "prenotazione": True,
+        "affittato_da": None,
+        "data_restituzione": None,
+        "data_concessione": None,
+        "stato_libro": rng.choice(STATI),
+    }
+    if rng.random() < 0.3:
+        concessione = now - timedelta(days=rng.randint(0, 60))
+        libro.update({
+            "prenotazione": False,
+            "affittato_da": rng.choice(BORROWERS),
+            "data_concessione": concessione,
+            "data_restituzione": concessione + timedelta(days=30),
+        })
+    return libro
+
+
+def iter_batches(count: int, batch_size: int = 10000, seed: int = 42) -> Iterator[List[dict]]:
+    """Genera `count` libri sintetici a blocchi di `batch_size`"""
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    batch = []
+    for i in range(count):
+        batch.append(make_libro(i, rng, now))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_collection(collection, count: int, batch_size: int = 10000, seed: int = 42) -> None:
+    """
+    Svuota la collection (pymongo sincrono) e la popola con `count` libri
+    sintetici. Il documento delle statistiche del catalogo viene eliminato:
+    il backend lo ricalcola alla prima lettura, invece di riportare i
+    conteggi del catalogo precedente.
+    """
+    collection.delete_many({})
+    for batch in iter_batches(count, batch_size, seed):
+        collection.insert_many(batch, ordered=False)
+    collection.database[STATS_COLLECTION].delete_one({"_id": STATS_ID})
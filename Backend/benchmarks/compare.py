@@ -0,0 +1,61 @@
+"""
+Confronta due file di risultati di benchmarks/loadtest.py.
+
+Per ogni combinazione (catalogo, scenario, concorrenza) presente in entrambi
+mostra throughput e latenze p50/p95/p99 con la variazione percentuale.
+Con --fail-on-regression PCT esce con codice 1 se il p95 peggiora (o il
+throughput cala) oltre la soglia indicata.
+
+Uso (da Backend/):
+    python benchmarks/compare.py results/prima.json results/dopo.json --fail-on-regression 10
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r["catalog_size"], r["scenario"], r["concurrency"]): r for r in report["results"]}
+
+
+def delta(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main(args) -> int:
+    before = load(args.before)
+    after = load(args.after)
+    regressions = 0
+
+    print(f"{'catalogo':>9} {'scenario':<12} {'c':>5} {'req/s':>18} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        cells = []
+        for getter in (
+            lambda r: r["throughput_rps"],
+            lambda r: r["latency_ms"]["p50"],
+            lambda r: r["latency_ms"]["p95"],
+            lambda r: r["latency_ms"]["p99"],
+        ):
+            cells.append(f"{getter(new):>9.1f} ({delta(getter(old), getter(new)):+5.0f}%)")
+        print(f"{key[0]:>9} {key[1]:<12} {key[2]:>5} " + " ".join(cells))
+
+        if args.fail_on_regression is not None:
+            if (delta(old["latency_ms"]["p95"], new["latency_ms"]["p95"]) > args.fail_on_regression
+                    or delta(old["throughput_rps"], new["throughput_rps"]) < -args.fail_on_regression):
+                regressions += 1
+
+    if regressions:
+        print(f"{regressions} regressioni oltre il {args.fail_on_regression}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-on-regression", type=float, default=None, metavar="PCT")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,278 @@
+"""
+Load test riproducibile dell'API BooksLibrary.
+
+Per ogni dimensione di catalogo richiesta:
+1. popola il database di benchmark con libri sintetici (benchmarks/catalog.py);
+2. avvia il backend (uvicorn main:app) in un sottoprocesso, collegato al
+   mongod locale e a un Keycloak finto (benchmarks/stub_keycloak.py) che
+   espone il JWKS e firma i token;
+3. esegue ogni scenario a ogni livello di concorrenza per una durata fissa,
+   dopo un breve warm-up non misurato;
+4. scrive i risultati (throughput, latenze p50/p95/p99, errori) in un file
+   JSON confrontabile tra esecuzioni con benchmarks/compare.py.
+
+Serve un mongod raggiungibile (es. `docker run -p 27017:27017 mongo:7`);
+il database indicato da --db-name viene svuotato e ripopolato, per cui il
+database dell'applicazione (MONGODB_DB_NAME) non è accettato.
+
+Uso (da Backend/):
+    python benchmarks/loadtest.py --mongodb-url mongodb://localhost:27017 \\
+        --catalog-sizes 1000 100000 1000000 --concurrency 10 50 200 --duration 20
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+from pymongo import MongoClient
+
+from catalog import WORDS, LANGUAGES, STATI, make_libro, seed_collection
+from stub_keycloak import StubKeycloak
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REALM = "BooksLibrary"
+CLIENT_ID = "bookslibrary-frontend"
+
+# Ogni scenario restituisce (metodo, percorso, body JSON) per la prossima richiesta
+Scenario = Callable[[random.Random, List[str]], Tuple[str, str, dict]]
+
+
+def scenario_search(rng, ids):
+    return "GET", f"/libri/search?q={rng.choice(WORDS)}", None
+
+
+def scenario_get(rng, ids):
+    return "GET", f"/libri/{rng.choice(ids)}", None
+
+
+def scenario_update(rng, ids):
+    return "PUT", f"/libri/{rng.choice(ids)}", {"stato_libro": rng.choice(STATI), "language": rng.choice(LANGUAGES)}
+
+
+# Numeri (e quindi ISBN) dei libri creati: unici per tutta l'esecuzione, in ogni fase e livello
+# di concorrenza, e fuori dall'intervallo del catalogo iniziale, altrimenti l'indice univoco
+# su isbn_10 rifiuterebbe con 409 i libri già creati dal warmup o dal livello precedente
+CREATE_SEQUENCE = itertools.count(10**9)
+
+
+def scenario_create(rng, ids):
+    libro = make_libro(next(CREATE_SEQUENCE), rng, datetime.utcnow())
+    for campo in ("data_concessione", "data_restituzione"):
+        if libro[campo]:
+            libro[campo] = libro[campo].isoformat()
+    return "POST", "/libri", libro
+
+
+def scenario_stats(rng, ids):
+    return "GET", "/admin/stats", None
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "search": scenario_search,
+    "get": scenario_get,
+    "update": scenario_update,
+    "create": scenario_create,
+    "admin_stats": scenario_stats,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Percentile nearest-rank su una lista ordinata"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def start_backend(args, stub: StubKeycloak, port: int, backend_dir: str = BACKEND_DIR) -> subprocess.Popen:
+    """Avvia il backend di `backend_dir` in un sottoprocesso e attende che risponda"""
+    env = {
+        **os.environ,
+        "MONGODB_URL": args.mongodb_url,
+        "MONGODB_DB_NAME": args.db_name,
+        "KEYCLOAK_URL": stub.url,
+        "KEYCLOAK_REALM": REALM,
+        "KEYCLOAK_CLIENT_ID": CLIENT_ID,
+        "LOG_LEVEL": "WARNING",
+        # Tutte le richieste usano lo stesso utente: il rate limit per utente falserebbe le misure
+        "RATE_LIMIT_PER_SECOND": os.getenv("RATE_LIMIT_PER_SECOND", "0"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=backend_dir,
+        env=env
+    )
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Il backend è terminato durante l'avvio")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Il backend non ha risposto entro il timeout di avvio")
+
+
+async def run_scenario(
+    base_url: str,
+    token: str,
+    scenario: Scenario,
+    ids: List[str],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int
+) -> dict:
+    """Esegue uno scenario con `concurrency` client per `duration` secondi"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30.0) as client:
+
+        async def worker(worker_id: int, stop_at: float, record: bool):
+            rng = random.Random(seed * 1000 + worker_id)
+            while time.perf_counter() < stop_at:
+                method, path, body = scenario(rng, ids)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - start
+                if not record:
+                    continue
+                if isinstance(status, int) and status < 400:
+                    latencies.append(elapsed)
+                else:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+
+        if warmup > 0:
+            stop_at = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(i, stop_at, False) for i in range(concurrency)))
+
+        started = time.perf_counter()
+        stop_at = started + duration
+        await asyncio.gather(*(worker(i, stop_at, True) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def main(args) -> None:
+    stub = StubKeycloak(REALM, CLIENT_ID).start()
+    token = stub.token(roles=("admin", "user"), ttl=24 * 3600)
+    mongo = MongoClient(args.mongodb_url)
+    collection = mongo[args.db_name].libri
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+
+    for size in args.catalog_sizes:
+        print(f"Popolamento catalogo: {size} libri...", flush=True)
+        seed_collection(collection, size, seed=args.seed)
+        ids = [str(doc["_id"]) for doc in collection.aggregate([
+            {"$sample": {"size": min(size, 5000)}},
+            {"$project": {"_id": 1}}
+        ])]
+
+        port = free_port()
+        backend = start_backend(args, stub, port)
+        try:
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = asyncio.run(run_scenario(
+                        f"http://127.0.0.1:{port}", token, SCENARIOS[name], ids,
+                        concurrency, args.duration, args.warmup, args.seed
+                    ))
+                    result = {"catalog_size": size, "scenario": name, "concurrency": concurrency, **result}
+                    report["results"].append(result)
+                    lat = result["latency_ms"]
+                    print(f"{size:>9} {name:<12} c={concurrency:<5} {result['throughput_rps']:>9.1f} req/s  "
+                          f"p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms  "
+                          f"errori={sum(result['errors'].values())}", flush=True)
+        finally:
+            backend.terminate()
+            backend.wait(timeout=30)
+
+    stub.stop()
+    mongo.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Risultati scritti in {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", default=os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="bookslibrary_bench", help="Database di benchmark (viene svuotato)")
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=20.0, help="Secondi misurati per scenario e concorrenza")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Secondi di warm-up non misurati")
+    parser.add_argument("--seed", type=int, default=42, help="Seed per catalogo e richieste")
+    parser.add_argument("--startup-timeout", type=float, default=600.0, help="Attesa massima per l'avvio del backend")
+    parser.add_argument(
+        "--output",
+        default=os.path.join(BACKEND_DIR, "benchmarks", "results", f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    )
+    args = parser.parse_args()
+    if args.db_name == os.getenv("MONGODB_DB_NAME"):
+        parser.error(f"--db-name {args.db_name} è il database dell'applicazione, che verrebbe svuotato")
+    main(args)
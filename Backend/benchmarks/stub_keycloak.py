@@ -0,0 +1,82 @@
+"""
+Keycloak finto per i benchmark: espone un JWKS su HTTP locale e firma token
+RS256 con la chiave corrispondente, con gli stessi claim usati da auth.py
+(iss, aud, exp, realm_access.roles, preferred_username).
+"""
+import base64
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+
+def _b64(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+class StubKeycloak:
+    """Issuer di token e server JWKS in un thread, in ascolto su 127.0.0.1"""
+
+    def __init__(self, realm: str, client_id: str, port: int = 0):
+        self.realm = realm
+        self.client_id = client_id
+        self.kid = uuid.uuid4().hex
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._pem = self._key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        numbers = self._key.public_key().public_numbers()
+        jwks = {"keys": [{
+            "kid": self.kid, "kty": "RSA", "alg": "RS256", "use": "sig",
+            "n": _b64(numbers.n), "e": _b64(numbers.e)
+        }]}
+        body = json.dumps(jwks).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Valore da usare come KEYCLOAK_URL per il backend"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "StubKeycloak":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+    def token(self, username: str = "bench", roles: Iterable[str] = ("admin",), ttl: int = 3600) -> str:
+        """Firma un access token valido per `ttl` secondi"""
+        now = int(time.time())
+        claims = {
+            "sub": str(uuid.uuid5(uuid.NAMESPACE_DNS, username)),
+            "preferred_username": username,
+            "iss": f"{self.url}/realms/{self.realm}",
+            "aud": self.client_id,
+            "iat": now,
+            "exp": now + ttl,
+            "realm_access": {"roles": list(roles)},
+        }
+        return jwt.encode(claims, self._pem, algorithm="RS256", headers={"kid": self.kid})
@@ -0,0 +1,132 @@
+import csv
+import json
+from typing import AsyncIterator, Optional, Tuple
+
+from pydantic import ValidationError
+
+from models import LibroCreate
+from database import normalize_libro_dates
+from serialization import VERSION_FIELD
+
+# Formati accettati dall'import massivo (header Content-Type)
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+CSV_CONTENT_TYPES = ("text/csv", "application/csv")
+
+# Nel CSV i campi lista (authors, categories) sono separati da ';'
+CSV_LIST_FIELDS = ("authors", "categories")
+CSV_LIST_SEPARATOR = ";"
+
+
+class ImportRowError(ValueError):
+    """Riga dell'import non valida"""
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Divide il body in streaming in righe, senza caricarlo tutto in memoria.
+    Restituisce coppie (numero_riga, riga), saltando le righe vuote.
+    """
+    buffer = b""
+    numero = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *righe, buffer = buffer.split(b"\n")
+        for riga in righe:
+            numero += 1
+            if riga.strip():
+                yield numero, riga
+    if buffer.strip():
+        yield numero + 1, buffer
+
+
+def decode_line(numero: int, riga: bytes) -> str:
+    """Decodifica una riga UTF-8 (ignorando l'eventuale BOM iniziale del file)"""
+    try:
+        return riga.decode("utf-8-sig" if numero == 1 else "utf-8").strip()
+    except UnicodeDecodeError:
+        raise ImportRowError("Codifica non valida: il file deve essere in UTF-8")
+
+
+def parse_ndjson_line(testo: str) -> dict:
+    """Converte una riga NDJSON in un record"""
+    try:
+        record = json.loads(testo)
+    except json.JSONDecodeError as e:
+        raise ImportRowError(f"JSON non valido: {e}")
+    if not isinstance(record, dict):
+        raise ImportRowError("Ogni riga deve essere un oggetto JSON")
+    return record
+
+
+def parse_csv_line(testo: str, header: list) -> dict:
+    """
+    Converte una riga CSV in un record usando l'intestazione.
+    Le celle vuote sono ignorate; authors e categories sono liste separate da ';'.
+    I valori su più righe (a capo dentro le virgolette) non sono supportati.
+    """
+    valori = next(csv.reader([testo]))
+    if len(valori) != len(header):
+        raise ImportRowError(f"Attese {len(header)} colonne, trovate {len(valori)}")
+
+    record = {}
+    for campo, valore in zip(header, valori):
+        valore = valore.strip()
+        if not valore:
+            continue
+        if campo in CSV_LIST_FIELDS:
+            record[campo] = [v.strip() for v in valore.split(CSV_LIST_SEPARATOR) if v.strip()]
+        else:
+            record[campo] = valore
+    return record
+
+
+def parse_csv_header(testo: str) -> list:
+    """Legge l'intestazione del CSV (nomi dei campi di LibroCreate)"""
+    header = [campo.strip() for campo in next(csv.reader([testo]))]
+    sconosciuti = [campo for campo in header if campo not in LibroCreate.model_fields]
+    if sconosciuti:
+        raise ImportRowError(f"Colonne sconosciute: {', '.join(sconosciuti)}")
+    return header
+
+
+def build_libro_document(record: dict) -> dict:
+    """Valida un record come LibroCreate e lo prepara per MongoDB (come crea_libro)"""
+    try:
+        libro = LibroCreate(**record)
+    except ValidationError as e:
+        errori = "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+        )
+        raise ImportRowError(errori)
+    documento = normalize_libro_dates(libro.model_dump())
+    documento[VERSION_FIELD] = 1
+    return documento
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes],
+    formato: str
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Legge i record dal body in streaming nel formato indicato ("ndjson" o "csv").
+    Restituisce triple (numero_riga, documento, errore): esattamente uno tra
+    documento ed errore è valorizzato.
+    """
+    header = None
+    async for numero, riga in iter_lines(chunks):
+        try:
+            testo = decode_line(numero, riga)
+            if formato == "csv":
+                if header is None:
+                    header = parse_csv_header(testo)
+                    continue
+                record = parse_csv_line(testo, header)
+            else:
+                record = parse_ndjson_line(testo)
+            yield numero, build_libro_document(record), None
+        except ImportRowError as e:
+            if formato == "csv" and header is None:
+                # Senza intestazione valida nessuna riga è interpretabile
+                raise
+            yield numero, None, str(e)
+
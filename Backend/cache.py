@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Cache in-process limitata (LRU) con scadenza per singola voce.
+
+    Ogni voce ha una propria scadenza assoluta (timestamp epoch): alla lettura
+    le voci scadute vengono scartate. Quando la cache è piena (numero di voci
+    oppure, se `maxbytes` è indicato, dimensione totale dichiarata con `size`)
+    vengono rimosse le voci usate meno di recente.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, maxbytes: Optional[int] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Restituisce il valore associato alla chiave, oppure None se assente o scaduto"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, size = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.bytes -= size
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None, size: int = 0) -> None:
+        """
+        Inserisce una voce nella cache.
+
+        La scadenza effettiva è il minimo tra `expires_at` (se indicato) e
+        il TTL configurato per la cache. `size` è la dimensione in byte della
+        voce, usata solo se la cache ha un limite `maxbytes`: una voce più
+        grande dell'intero limite non viene memorizzata.
+        """
+        if self.maxbytes is not None and size > self.maxbytes:
+            return
+
+        max_expiry = time.time() + self.ttl
+        if expires_at is None or expires_at > max_expiry:
+            expires_at = max_expiry
+
+        self.pop(key)
+        self._data[key] = (value, expires_at, size)
+        self.bytes += size
+
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """Rimuove una voce dalla cache, se presente"""
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self) -> None:
+        """Svuota la cache mantenendo i contatori"""
+        self._data.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Restituisce i contatori della cache"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "bytes": self.bytes,
+            "maxbytes": self.maxbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
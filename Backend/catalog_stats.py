@@ -0,0 +1,239 @@
+import os
+import asyncio
+from collections import Counter
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+from urllib.parse import unquote
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from logging_config import get_logger
+
+logger = get_logger("catalog_stats")
+
+# Documento materializzato con le statistiche del catalogo
+STATS_COLLECTION = "statistiche"
+STATS_ID = "libri"
+
+# Intervallo (secondi) tra due riconciliazioni complete; 0 = disattivata
+CATALOG_STATS_RECONCILE_INTERVAL = float(os.getenv("CATALOG_STATS_RECONCILE_INTERVAL", "3600"))
+# Tentativi di una riconciliazione se il documento cambia durante l'aggregazione
+CATALOG_STATS_RECONCILE_ATTEMPTS = int(os.getenv("CATALOG_STATS_RECONCILE_ATTEMPTS", "3"))
+
+# Contatore incrementato da ogni aggiornamento incrementale: la riconciliazione
+# sostituisce il documento solo se nessun aggiornamento è arrivato nel frattempo
+GENERATION_FIELD = "generazione"
+
+# Suddivisioni mantenute nel documento: nome -> campo del libro
+BREAKDOWNS = {
+    "per_stato": "stato_libro",
+    "per_prenotazione": "prenotazione",
+    "per_lingua": "language",
+    "per_categoria": "categories",
+}
+# Campi del libro che influenzano le statistiche (proiezione per le letture "prima" della modifica)
+STATS_FIELDS = {campo: 1 for campo in BREAKDOWNS.values()}
+
+DISPONIBILE = "disponibile"
+NON_DISPONIBILE = "non_disponibile"
+SCONOSCIUTA = "sconosciuta"
+
+
+def escape_key(value) -> str:
+    """Rende un valore utilizzabile come nome di campo MongoDB ('.' e '$' iniziale non sono ammessi)"""
+    chiave = str(value).replace("%", "%25").replace(".", "%2E")
+    if chiave.startswith("$"):
+        chiave = "%24" + chiave[1:]
+    return chiave
+
+
+def bucket(breakdown: str, value) -> str:
+    """Chiave della suddivisione per un valore del campo (stessi default usati nelle risposte)"""
+    if isinstance(value, Enum):
+        value = value.value
+    if breakdown == "per_prenotazione":
+        return NON_DISPONIBILE if value is False else DISPONIBILE
+    if breakdown == "per_stato" and not value:
+        return "buono"
+    if value is None or value == "":
+        return SCONOSCIUTA
+    return escape_key(value)
+
+
+def libro_contributions(libro: Optional[dict]) -> Counter:
+    """Contributo di un libro al documento delle statistiche, come percorsi per $inc"""
+    contributi = Counter()
+    if not libro:
+        return contributi
+    contributi["totale"] += 1
+    for breakdown, campo in BREAKDOWNS.items():
+        valore = libro.get(campo)
+        if breakdown == "per_categoria":
+            categorie = valore if isinstance(valore, list) else ([valore] if valore else [])
+            for categoria in categorie:
+                contributi[f"{breakdown}.{bucket(breakdown, categoria)}"] += 1
+        else:
+            contributi[f"{breakdown}.{bucket(breakdown, valore)}"] += 1
+    return contributi
+
+
+def stats_delta(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Differenza tra i contributi di un libro prima e dopo una scrittura (solo voci non nulle)"""
+    delta = libro_contributions(after)
+    delta.subtract(libro_contributions(before))
+    return {percorso: n for percorso, n in delta.items() if n}
+
+
+def format_stats(doc: dict) -> dict:
+    """Converte il documento materializzato nella risposta di /admin/stats"""
+    risultato = {"totale": doc.get("totale", 0)}
+    for breakdown in BREAKDOWNS:
+        risultato[breakdown] = {
+            unquote(chiave): n for chiave, n in sorted(doc.get(breakdown, {}).items()) if n > 0
+        }
+    risultato["in_prestito"] = risultato["per_prenotazione"].get(NON_DISPONIBILE, 0)
+    risultato["aggiornato_il"] = doc.get("aggiornato_il")
+    risultato["riconciliato_il"] = doc.get("riconciliato_il")
+    return risultato
+
+
+class CatalogStats:
+    """
+    Statistiche del catalogo mantenute in modo incrementale.
+
+    Ogni scrittura sui libri applica con $inc la differenza tra il libro
+    prima e dopo la modifica al documento STATS_ID, quindi leggere le
+    statistiche costa una find_one. L'aggiornamento non è nella stessa
+    transazione della scrittura: una riconciliazione periodica ricalcola il
+    documento con un'aggregazione completa e corregge eventuali scostamenti.
+
+    Ogni $inc incrementa anche GENERATION_FIELD. La riconciliazione legge la
+    generazione prima dell'aggregazione e sostituisce il documento solo se è
+    rimasta la stessa: un aggiornamento arrivato durante l'aggregazione (che
+    potrebbe non averlo visto) non viene sovrascritto, e l'aggregazione viene
+    ripetuta, fino a CATALOG_STATS_RECONCILE_ATTEMPTS volte.
+    """
+
+    def __init__(self, interval: float = CATALOG_STATS_RECONCILE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Avvia la riconciliazione periodica in background"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._reconcile_loop(db))
+
+    async def close(self) -> None:
+        """Ferma la riconciliazione periodica"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _reconcile_loop(self, db: AsyncIOMotorDatabase) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile(db)
+            except Exception as e:
+                logger.warning("Errore nella riconciliazione delle statistiche: %s", e)
+
+    async def reconcile(self, db: AsyncIOMotorDatabase) -> dict:
+        """
+        Ricalcola il documento delle statistiche da zero con un'aggregazione
+        $facet e lo sostituisce se nel frattempo non è stato aggiornato.
+        Se cambia a ogni tentativo restituisce il documento incrementale corrente.
+        """
+        async with self._lock:
+            for _ in range(CATALOG_STATS_RECONCILE_ATTEMPTS):
+                attuale = await db[STATS_COLLECTION].find_one({"_id": STATS_ID}, {GENERATION_FIELD: 1})
+                doc = await self._aggregate(db)
+
+                if attuale is None:
+                    doc[GENERATION_FIELD] = 0
+                    try:
+                        await db[STATS_COLLECTION].insert_one(doc)
+                        return doc
+                    except DuplicateKeyError:
+                        continue
+
+                # {campo: None} corrisponde anche ai documenti creati prima del contatore
+                generazione = attuale.get(GENERATION_FIELD)
+                doc[GENERATION_FIELD] = generazione or 0
+                risultato = await db[STATS_COLLECTION].replace_one(
+                    {"_id": STATS_ID, GENERATION_FIELD: generazione}, doc
+                )
+                if risultato.matched_count:
+                    return doc
+
+            logger.warning(
+                "Riconciliazione delle statistiche rinviata: documento aggiornato durante %d tentativi",
+                CATALOG_STATS_RECONCILE_ATTEMPTS
+            )
+            return await db[STATS_COLLECTION].find_one({"_id": STATS_ID}) or doc
+
+    async def _aggregate(self, db: AsyncIOMotorDatabase) -> dict:
+        """Documento delle statistiche calcolato con una sola aggregazione sulla collection libri"""
+        pipeline = [{"$facet": {
+            "totale": [{"$count": "n"}],
+            "per_stato": [{"$group": {"_id": "$stato_libro", "n": {"$sum": 1}}}],
+            "per_prenotazione": [{"$group": {"_id": "$prenotazione", "n": {"$sum": 1}}}],
+            "per_lingua": [{"$group": {"_id": "$language", "n": {"$sum": 1}}}],
+            "per_categoria": [
+                {"$unwind": "$categories"},
+                {"$group": {"_id": "$categories", "n": {"$sum": 1}}}
+            ],
+        }}]
+        risultato = (await db.libri.aggregate(pipeline).to_list(length=1))[0]
+
+        now = datetime.utcnow()
+        doc = {
+            "_id": STATS_ID,
+            "totale": risultato["totale"][0]["n"] if risultato["totale"] else 0,
+            "aggiornato_il": now,
+            "riconciliato_il": now,
+        }
+        # I valori grezzi vengono ricondotti alle stesse chiavi usate dagli aggiornamenti incrementali
+        for breakdown in BREAKDOWNS:
+            conteggi = Counter()
+            for gruppo in risultato[breakdown]:
+                conteggi[bucket(breakdown, gruppo["_id"])] += gruppo["n"]
+            doc[breakdown] = dict(conteggi)
+        return doc
+
+    async def apply(self, db: AsyncIOMotorDatabase, before: Optional[dict], after: Optional[dict]) -> None:
+        """
+        Aggiorna le statistiche dopo una scrittura (before=None per un inserimento,
+        after=None per una cancellazione). Gli errori vengono solo registrati:
+        la scrittura sul libro è già avvenuta e la riconciliazione correggerà il conteggio.
+        """
+        await self.apply_delta(db, stats_delta(before, after))
+
+    async def apply_delta(self, db: AsyncIOMotorDatabase, delta: dict) -> None:
+        """Applica una differenza già calcolata (es. somma dei contributi di un import)"""
+        if not delta:
+            return
+        try:
+            # Senza upsert: se il documento manca verrà creato completo dalla prima lettura
+            await db[STATS_COLLECTION].update_one(
+                {"_id": STATS_ID},
+                {"$inc": {**delta, GENERATION_FIELD: 1}, "$set": {"aggiornato_il": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.warning("Errore nell'aggiornamento delle statistiche: %s", e)
+
+    async def read(self, db: AsyncIOMotorDatabase) -> dict:
+        """Legge le statistiche (O(1)); al primo accesso il documento viene calcolato"""
+        doc = await db[STATS_COLLECTION].find_one({"_id": STATS_ID})
+        if doc is None:
+            doc = await self.reconcile(db)
+        return format_stats(doc)
+
+
+catalog_stats = CatalogStats()
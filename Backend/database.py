@@ -1,19 +1,51 @@
 import os
-from pymongo import MongoClient
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from datetime import datetime
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
+from google_books import google_books_client
+from catalog_stats import catalog_stats
+from indexes import index_manager
+from suggest import suggest_index
+from jobs import job_manager
+from readiness import readiness_prober
+from auth import jwks_manager
+from logging_config import get_logger
+from metrics import MongoCommandMetrics, MongoPoolMetrics
+
+logger = get_logger("database")
+
 # Configurazione MongoDB
 MONGODB_URL = os.getenv("MONGODB_URL")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME")
 
-# Client MongoDB globale
-mongo_client: MongoClient = None
-database = None
-executor = ThreadPoolExecutor(max_workers=4)
+# Dimensione del pool di connessioni e timeout (in millisecondi)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "10000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "0"))  # 0 = nessun timeout
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "0"))  # 0 = nessun timeout
+
+# Connessioni aperte all'avvio, così le prime richieste non pagano l'handshake
+MONGODB_WARMUP_CONNECTIONS = int(os.getenv("MONGODB_WARMUP_CONNECTIONS", "10"))
+
+# Client MongoDB globale (driver asyncio nativo: nessun thread pool intermedio)
+mongo_client: AsyncIOMotorClient = None
+database: AsyncIOMotorDatabase = None
+
+
+async def warm_up_pool(client: AsyncIOMotorClient, connections: int):
+    """
+    Apre `connections` connessioni del pool con ping concorrenti: ogni comando
+    in corso occupa una connessione diversa, che al termine resta nel pool.
+    """
+    connections = min(connections, MONGODB_MAX_POOL_SIZE)
+    if connections > 0:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
 
 
 def get_database():
@@ -21,11 +53,6 @@ def get_database():
     return database
 
 
-def get_executor():
-    """Restituisce l'executor per operazioni asincrone"""
-    return executor
-
-
 def get_mongo_client():
     """Restituisce il client MongoDB"""
     return mongo_client
@@ -37,22 +64,61 @@ async def lifespan_manager(app):
     global mongo_client, database
     
     # Startup: connetti a MongoDB
-    mongo_client = MongoClient(MONGODB_URL)
+    mongo_client = AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS or None,
+        waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS or None,
+        event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()]
+    )
     database = mongo_client[MONGODB_DB_NAME]
     
-    # Verifica connessione
-    try:
-        mongo_client.admin.command('ping')
-        print("✅ Connesso a MongoDB con successo!")
-    except Exception as e:
-        print(f"❌ Errore connessione MongoDB: {e}")
+    # Verifica connessione e warm-up del pool, in parallelo al primo fetch del JWKS
+    warmup, jwks_ok = await asyncio.gather(
+        warm_up_pool(mongo_client, MONGODB_WARMUP_CONNECTIONS),
+        jwks_manager.refresh(),
+        return_exceptions=True
+    )
+    if isinstance(warmup, Exception):
+        logger.error("Errore connessione MongoDB: %s", warmup)
+    else:
+        logger.info("Connesso a MongoDB con successo")
+    if jwks_ok is not True:
+        logger.warning("Chiavi pubbliche non disponibili all'avvio: verranno richieste al primo token")
+    
+    # Stato di readiness (MongoDB e JWKS) verificato in background per /health/ready
+    await readiness_prober.start(mongo_client, jwks_manager)
+    
+    # Indici del registro costruiti in background (stato in /db/info)
+    await index_manager.start(database)
+    
+    # Client HTTP condiviso per il proxy Google Books
+    await google_books_client.start()
+    
+    # Riconciliazione periodica delle statistiche del catalogo
+    await catalog_stats.start(database)
+    
+    # Indice in memoria per /libri/suggest, costruito in background
+    await suggest_index.start(database)
+    
+    # Job amministrativi in background (cancellazione massiva, reindicizzazione)
+    await job_manager.start(database)
     
     yield
     
     # Shutdown: chiudi connessione
+    await job_manager.close()
+    await suggest_index.close()
+    await catalog_stats.close()
+    await index_manager.close()
+    await google_books_client.close()
+    await readiness_prober.close()
     if mongo_client:
         mongo_client.close()
-        print("🔌 Connessione MongoDB chiusa")
+        logger.info("Connessione MongoDB chiusa")
 
 
 def convert_objectid(doc):
@@ -71,3 +137,21 @@ def convert_objectid(doc):
                 pass
     return doc
 
+
+def normalize_libro_dates(libro_dict: dict) -> dict:
+    """
+    Converte in datetime (per MongoDB) le date del prestito ricevute come stringa.
+    Gestisce il formato datetime-local (YYYY-MM-DDTHH:mm) e ISO 8601 con 'Z';
+    se la conversione fallisce il campo viene rimosso.
+    """
+    for campo in ("data_restituzione", "data_concessione"):
+        valore = libro_dict.get(campo)
+        if valore and isinstance(valore, str):
+            try:
+                if 'T' in valore:
+                    libro_dict[campo] = datetime.fromisoformat(valore)
+                else:
+                    libro_dict[campo] = datetime.fromisoformat(valore.replace('Z', '+00:00'))
+            except ValueError:
+                libro_dict.pop(campo, None)
+    return libro_dict
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+from cache import TTLCache
+from metrics import GOOGLE_BOOKS_DURATION, register_stats
+
+# Configurazione del proxy verso Google Books (l'URL è configurabile per i test con server stub)
+GOOGLE_BOOKS_API_URL = os.getenv("GOOGLE_BOOKS_API_URL", "https://www.googleapis.com/books/v1/volumes")
+GOOGLE_BOOKS_TIMEOUT = float(os.getenv("GOOGLE_BOOKS_TIMEOUT", "30"))
+GOOGLE_BOOKS_MAX_CONNECTIONS = int(os.getenv("GOOGLE_BOOKS_MAX_CONNECTIONS", "20"))
+GOOGLE_BOOKS_MAX_KEEPALIVE = int(os.getenv("GOOGLE_BOOKS_MAX_KEEPALIVE", "10"))
+GOOGLE_BOOKS_CACHE_SIZE = int(os.getenv("GOOGLE_BOOKS_CACHE_SIZE", "512"))
+GOOGLE_BOOKS_CACHE_TTL = float(os.getenv("GOOGLE_BOOKS_CACHE_TTL", "600"))
+
+
+def normalize_query(q: str) -> str:
+    """
+    Chiave di cache e delle richieste in corso per una query: solo gli spazi
+    sono normalizzati, perché operatori (intitle:, isbn:) e frasi esatte di
+    Google Books distinguono le maiuscole.
+    """
+    return " ".join(q.split())
+
+
+class GoogleBooksClient:
+    """
+    Proxy verso Google Books API.
+
+    - Un solo httpx.AsyncClient condiviso (keep-alive, HTTP/2, limiti sulle
+      connessioni), aperto e chiuso da lifespan_manager.
+    - Cache TTL+LRU delle risposte, con chiave la query normalizzata (a
+      Google Books viene inviata la query originale).
+    - Le richieste identiche concorrenti vengono unificate: una sola chiamata
+      a Google Books, il cui risultato è condiviso da tutti i chiamanti.
+    """
+
+    def __init__(self, base_url: str = GOOGLE_BOOKS_API_URL):
+        self.base_url = base_url
+        self.client: Optional[httpx.AsyncClient] = None
+        self.cache = TTLCache(maxsize=GOOGLE_BOOKS_CACHE_SIZE, ttl=GOOGLE_BOOKS_CACHE_TTL)
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        """Apre il client HTTP condiviso"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                http2=True,
+                timeout=GOOGLE_BOOKS_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=GOOGLE_BOOKS_MAX_CONNECTIONS,
+                    max_keepalive_connections=GOOGLE_BOOKS_MAX_KEEPALIVE
+                )
+            )
+
+    async def close(self) -> None:
+        """Chiude il client HTTP condiviso"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _fetch(self, key: str, q: str) -> dict:
+        """Esegue la chiamata a Google Books con la query `q` e salva la risposta in cache sotto `key`"""
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            self.upstream_calls += 1
+            response = await self.client.get(self.base_url, params={"q": q})
+            response.raise_for_status()
+            data = response.json()
+            self.cache.set(key, data)
+            outcome = "ok"
+            return data
+        finally:
+            GOOGLE_BOOKS_DURATION.labels(outcome).observe(time.perf_counter() - start)
+            self._inflight.pop(key, None)
+
+    async def search(self, q: str) -> dict:
+        """Cerca su Google Books, usando la cache e unificando le richieste in corso"""
+        key = normalize_query(q)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if self.client is None:
+            await self.start()
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, q))
+            # Evita l'avviso "exception never retrieved" se tutti i chiamanti sono stati cancellati
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+
+        # shield: la cancellazione di un chiamante non interrompe la richiesta condivisa
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Restituisce i contatori della cache e delle chiamate a Google Books"""
+        return {
+            **self.cache.stats(),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
+
+
+google_books_client = GoogleBooksClient()
+register_stats("google_books", google_books_client.stats)
@@ -0,0 +1,292 @@
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, TEXT, IndexModel
+
+from logging_config import get_logger
+
+logger = get_logger("indexes")
+
+# Giorni di conservazione dei job terminati (indice TTL su terminato_il)
+JOBS_RETENTION_DAYS = int(os.getenv("JOBS_RETENTION_DAYS", "30"))
+
+# Registro dichiarativo degli indici: collection -> indici attesi.
+# All'avvio ogni indice mancante viene creato e ogni indice con lo stesso
+# nome ma una definizione diversa viene ricreato (vedi IndexManager.replace);
+# gli altri non vengono toccati.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "libri": [
+        # /libri/search: indice testuale pesato. La lingua dei documenti non viene
+        # usata per lo stemming (default_language "none" e language_override su un
+        # campo inesistente), perché 'language' contiene valori liberi che MongoDB rifiuterebbe
+        IndexModel(
+            [("titolo", TEXT), ("authors", TEXT), ("categories", TEXT), ("publisher", TEXT)],
+            name="libri_text",
+            weights={"titolo": 10, "authors": 5, "categories": 3, "publisher": 2},
+            default_language="none",
+            language_override="lingua_indice_testo"
+        ),
+        # ISBN univoco solo se valorizzato: i libri senza ISBN hanno isbn_10 a null,
+        # che un indice sparse indicizzerebbe comunque (e più null sarebbero duplicati)
+        IndexModel(
+            [("isbn_10", ASCENDING)],
+            name="isbn_10",
+            unique=True,
+            partialFilterExpression={"isbn_10": {"$gt": ""}}
+        ),
+        IndexModel([("authors", ASCENDING)], name="authors"),
+        IndexModel([("categories", ASCENDING)], name="categories"),
+        IndexModel([("language", ASCENDING)], name="language"),
+        # Ordinamento e uguaglianza sul titolo senza distinzione tra maiuscole e minuscole
+        IndexModel(
+            [("titolo", ASCENDING)],
+            name="titolo_it",
+            collation={"locale": "it", "strength": 2}
+        ),
+        # /admin/prestiti: filtro, intervallo di date e ordinamento (data_restituzione, _id) sull'indice
+        IndexModel(
+            [("prenotazione", ASCENDING), ("data_restituzione", ASCENDING), ("_id", ASCENDING)],
+            name="prenotazione_data_restituzione"
+        ),
+        IndexModel(
+            [("affittato_da", ASCENDING), ("data_restituzione", ASCENDING), ("_id", ASCENDING)],
+            name="affittato_da_data_restituzione"
+        ),
+    ],
+    "jobs": [
+        # Al più un job attivo per tipo: il campo 'attivo' esiste solo finché il job non termina
+        IndexModel(
+            [("tipo", ASCENDING)],
+            name="tipo_attivo",
+            unique=True,
+            partialFilterExpression={"attivo": True}
+        ),
+        IndexModel(
+            [("terminato_il", ASCENDING)],
+            name="terminato_il_ttl",
+            expireAfterSeconds=JOBS_RETENTION_DAYS * 24 * 3600
+        ),
+    ],
+}
+
+# Stati di un indice del registro
+STATO_IN_ATTESA = "in_attesa"
+STATO_IN_COSTRUZIONE = "in_costruzione"
+STATO_PRONTO = "pronto"
+STATO_ERRORE = "errore"
+
+# Suffisso dell'indice temporaneo che sostituisce quello in ricostruzione
+TEMP_INDEX_SUFFIX = "_sostituto"
+
+# Opzioni confrontate per decidere se un indice esistente corrisponde alla definizione
+COMPARED_OPTIONS = (
+    "unique", "sparse", "partialFilterExpression", "default_language", "language_override", "expireAfterSeconds"
+)
+
+
+def index_matches(existing: dict, expected: dict) -> bool:
+    """True se l'indice esistente (da index_information) corrisponde alla definizione attesa"""
+    if "weights" in expected:
+        # Gli indici testuali sono salvati con chiavi interne (_fts, _ftsx): si confrontano i pesi
+        if dict(existing.get("weights", {})) != expected["weights"]:
+            return False
+    elif list(existing["key"]) != list(expected["key"].items()):
+        return False
+
+    for option in COMPARED_OPTIONS:
+        if option in ("unique", "sparse"):
+            if bool(existing.get(option)) != bool(expected.get(option)):
+                return False
+        elif option in expected and existing.get(option) != expected[option]:
+            return False
+
+    # Il server completa la collation con i valori di default: si confrontano solo i campi dichiarati
+    collation = existing.get("collation", {})
+    return all(collation.get(k) == v for k, v in expected.get("collation", {}).items())
+
+
+def is_text_index(spec: dict) -> bool:
+    return any(direction == TEXT for direction in spec["key"].values())
+
+
+def standin_model(spec: dict) -> IndexModel:
+    """
+    Indice temporaneo che serve le query durante la ricostruzione di `spec`:
+    stesse chiavi (più _id, o senza l'ultima chiave se _id c'è già) e stessa
+    collation, senza altre opzioni. La chiave diversa gli permette di
+    coesistere sia con il vecchio sia con il nuovo indice, che MongoDB
+    rifiuterebbe se avessero la stessa definizione con un altro nome.
+    """
+    keys = list(spec["key"].items())
+    keys = keys + [("_id", ASCENDING)] if "_id" not in spec["key"] else keys[:-1]
+    options = {"collation": spec["collation"]} if "collation" in spec else {}
+    return IndexModel(keys, name=spec["name"] + TEMP_INDEX_SUFFIX, **options)
+
+
+async def find_duplicate(collection, spec: dict) -> Optional[dict]:
+    """Una combinazione di valori ripetuta tra i documenti coperti da un indice univoco, oppure None"""
+    campi = list(spec["key"])
+    pipeline = [
+        {"$match": spec.get("partialFilterExpression", {})},
+        {"$group": {"_id": {f"k{i}": f"${campo}" for i, campo in enumerate(campi)}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$limit": 1},
+    ]
+    options = {"collation": spec["collation"]} if "collation" in spec else {}
+    duplicati = await collection.aggregate(pipeline, allowDiskUse=True, **options).to_list(length=1)
+    if not duplicati:
+        return None
+    return {campo: duplicati[0]["_id"].get(f"k{i}") for i, campo in enumerate(campi)}
+
+
+class IndexManager:
+    """
+    Applica il registro INDEXES in modo idempotente.
+
+    La costruzione avviene in un task in background avviato da
+    lifespan_manager: l'API è subito disponibile e lo stato di ogni indice
+    (in attesa, in costruzione, pronto, errore) è esposto da /db/info.
+    """
+
+    def __init__(self, indexes: Dict[str, List[IndexModel]] = INDEXES):
+        self.indexes = indexes
+        self.state: Dict[str, Dict[str, dict]] = {
+            collection: {model.document["name"]: {"stato": STATO_IN_ATTESA} for model in models}
+            for collection, models in indexes.items()
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Avvia l'applicazione del registro in background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.apply(db))
+
+    async def close(self) -> None:
+        """Interrompe l'attesa delle costruzioni in corso (quelle già avviate proseguono sul server)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def apply(self, db: AsyncIOMotorDatabase) -> None:
+        """Crea o ricrea gli indici che non corrispondono al registro"""
+        for collection, models in self.indexes.items():
+            existing = await self.existing(db, collection)
+            if existing is None:
+                continue
+            for model in models:
+                await self.apply_one(db, collection, model, existing)
+
+    async def existing(self, db: AsyncIOMotorDatabase, collection: str) -> Optional[dict]:
+        """Indici presenti su una collection, oppure None (con lo stato in errore) se non leggibili"""
+        try:
+            return await db[collection].index_information()
+        except Exception as e:
+            logger.warning("Impossibile leggere gli indici di %s: %s", collection, e)
+            for stato in self.state[collection].values():
+                stato.update({"stato": STATO_ERRORE, "errore": str(e)})
+            return None
+
+    async def apply_one(
+        self,
+        db: AsyncIOMotorDatabase,
+        collection: str,
+        model: IndexModel,
+        existing: dict,
+        force: bool = False
+    ) -> None:
+        """
+        Crea un indice del registro, ricreandolo se la definizione è cambiata
+        (o anche se corrisponde, con force=True, tranne l'indice testuale).
+        Gli errori finiscono nello stato dell'indice.
+        """
+        spec = model.document
+        name = spec["name"]
+        stato = self.state[collection][name]
+        if name in existing and index_matches(existing[name], spec):
+            if not force or is_text_index(spec):
+                # L'indice testuale non viene mai eliminato se corrisponde: è l'unico
+                # della collection e senza di esso la ricerca testuale fallisce
+                stato["stato"] = STATO_PRONTO
+                return
+
+        stato["stato"] = STATO_IN_COSTRUZIONE
+        try:
+            if name in existing:
+                logger.info("Indice %s.%s da ricostruire: viene ricreato", collection, name)
+                await self.replace(db[collection], model, existing)
+            else:
+                await db[collection].create_indexes([model])
+                # Indice temporaneo rimasto da una sostituzione interrotta
+                temp_name = name + TEMP_INDEX_SUFFIX
+                if temp_name in existing:
+                    await db[collection].drop_index(temp_name)
+            stato["stato"] = STATO_PRONTO
+            stato.pop("errore", None)
+            logger.info("Indice %s.%s creato", collection, name)
+        except Exception as e:
+            stato.update({"stato": STATO_ERRORE, "errore": str(e)})
+            logger.warning("Errore nella creazione dell'indice %s.%s: %s", collection, name, e)
+
+    async def replace(self, collection, model: IndexModel, existing: dict) -> None:
+        """
+        Sostituisce un indice esistente con la definizione di `model` (stesso nome).
+
+        MongoDB non permette di rinominare un indice né di averne due con la
+        stessa definizione, per cui il vecchio indice viene eliminato solo
+        quando le stesse query sono già coperte da un indice temporaneo
+        (standin_model), rimosso dopo la costruzione del nuovo:
+        1. per un indice univoco si verifica prima che non ci siano duplicati,
+           altrimenti la costruzione fallirebbe dopo l'eliminazione;
+        2. si costruisce l'indice temporaneo;
+        3. si elimina il vecchio indice e si costruisce il nuovo;
+        4. si elimina l'indice temporaneo.
+        Se il passo 3 fallisce l'indice temporaneo resta in uso. L'indice
+        testuale fa eccezione (una collection ne ammette uno solo): viene
+        eliminato e ricostruito, e nel frattempo la ricerca testuale non è disponibile.
+        """
+        spec = model.document
+        name = spec["name"]
+        if is_text_index(spec):
+            await collection.drop_index(name)
+            await collection.create_indexes([model])
+            return
+
+        if spec.get("unique"):
+            duplicato = await find_duplicate(collection, spec)
+            if duplicato is not None:
+                raise ValueError(f"valori duplicati {duplicato}: l'indice esistente non viene modificato")
+
+        sostituto = standin_model(spec)
+        temp_name = sostituto.document["name"]
+        # Un indice temporaneo rimasto da un tentativo precedente viene riutilizzato
+        if temp_name not in existing:
+            await collection.create_indexes([sostituto])
+        await collection.drop_index(name)
+        try:
+            await collection.create_indexes([model])
+        except Exception as e:
+            raise RuntimeError(f"{e} (resta in uso l'indice temporaneo {temp_name})") from e
+        await collection.drop_index(temp_name)
+
+    async def status(self, db: AsyncIOMotorDatabase) -> Dict[str, dict]:
+        """Stato degli indici del registro, più quelli presenti sul database ma non dichiarati"""
+        risultato = {}
+        for collection, indici in self.state.items():
+            try:
+                esistenti = set(await db[collection].index_information())
+            except Exception:
+                esistenti = set()
+            risultato[collection] = {
+                "registro": {name: dict(stato) for name, stato in indici.items()},
+                "non_gestiti": sorted(esistenti - set(indici) - {"_id_"}),
+            }
+        return risultato
+
+
+index_manager = IndexManager()
@@ -0,0 +1,249 @@
+import os
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from logging_config import get_logger
+
+logger = get_logger("jobs")
+
+# Collection con lo stato dei job (conservati per JOBS_RETENTION_DAYS dopo la fine, vedi indexes.py)
+JOBS_COLLECTION = "jobs"
+
+# Documenti elaborati da ogni batch e pausa (secondi) tra due batch
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "1000"))
+JOB_THROTTLE_SECONDS = float(os.getenv("JOB_THROTTLE_SECONDS", "0.05"))
+# Un job attivo che non viene aggiornato da questi secondi è considerato interrotto
+# (es. il worker che lo eseguiva è stato riavviato)
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+# Intervallo (secondi) con cui il worker che esegue un job ne rinnova aggiornato_il,
+# anche durante un passo lungo senza progresso (es. la creazione di un indice)
+JOB_HEARTBEAT_SECONDS = min(float(os.getenv("JOB_HEARTBEAT_SECONDS", "30")), JOB_STALE_SECONDS / 3)
+
+# Stati di un job
+STATO_IN_CODA = "in_coda"
+STATO_IN_ESECUZIONE = "in_esecuzione"
+STATO_COMPLETATO = "completato"
+STATO_ANNULLATO = "annullato"
+STATO_ERRORE = "errore"
+STATO_INTERROTTO = "interrotto"
+
+# Identifica il processo che esegue un job
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobCancelled(Exception):
+    """Sollevata da JobContext.progress quando è stato richiesto l'annullamento"""
+
+
+class JobConflict(Exception):
+    """Esiste già un job attivo dello stesso tipo"""
+
+    def __init__(self, job: Optional[dict]):
+        self.job = job
+        super().__init__(str(job["_id"]) if job else "")
+
+
+class JobContext:
+    """Passato all'handler di un job: database, parametri e aggiornamento del progresso"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, job: dict):
+        self.db = db
+        self.job_id = job["_id"]
+        self.parametri = job.get("parametri", {})
+
+    async def progress(self, elaborati: int, totale: Optional[int] = None, **extra) -> None:
+        """
+        Salva il progresso e controlla, con la stessa scrittura, se è stato
+        richiesto l'annullamento (anche da un altro worker): in tal caso solleva
+        JobCancelled. Va chiamata tra un batch e l'altro.
+        """
+        campi = {"progresso.elaborati": elaborati, "aggiornato_il": datetime.utcnow()}
+        if totale is not None:
+            campi["progresso.totale"] = totale
+        for chiave, valore in extra.items():
+            campi[f"progresso.{chiave}"] = valore
+        job = await self.db[JOBS_COLLECTION].find_one_and_update(
+            {"_id": self.job_id},
+            {"$set": campi},
+            projection={"annulla_richiesto": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if job and job.get("annulla_richiesto"):
+            raise JobCancelled()
+
+    async def throttle(self) -> None:
+        """Pausa tra due batch, per lasciare spazio alle richieste dell'API"""
+        await asyncio.sleep(JOB_THROTTLE_SECONDS)
+
+
+JobHandler = Callable[[JobContext], Awaitable[Optional[dict]]]
+
+
+def format_job(job: dict) -> dict:
+    """Converte un documento della collection jobs nella risposta delle API"""
+    risultato = {k: v for k, v in job.items() if k not in ("_id", "attivo")}
+    risultato["id"] = str(job["_id"])
+    return risultato
+
+
+class JobManager:
+    """
+    Esegue in background le operazioni amministrative lunghe.
+
+    Ogni job è un documento della collection jobs (tipo, stato, parametri,
+    progresso, risultato, timestamp) ed è eseguito da un task asyncio del
+    worker che lo ha ricevuto: l'handler lavora a batch, chiamando
+    JobContext.progress e JobContext.throttle tra un batch e l'altro, per cui
+    nessuna richiesta HTTP resta in attesa e le altre richieste continuano a
+    essere servite. Un indice univoco parziale su (tipo, attivo) garantisce
+    al più un job attivo per tipo anche con più worker.
+
+    Finché il job è in esecuzione un heartbeat rinnova aggiornato_il ogni
+    JOB_HEARTBEAT_SECONDS: solo un job il cui worker si è fermato supera
+    JOB_STALE_SECONDS senza aggiornamenti e viene segnato come interrotto.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, JobHandler] = {}
+        self._tasks: Dict[ObjectId, asyncio.Task] = {}
+
+    def register(self, tipo: str, handler: JobHandler) -> None:
+        self.handlers[tipo] = handler
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Segna come interrotti i job rimasti attivi dopo un riavvio"""
+        try:
+            await self._expire_stale(db)
+        except Exception as e:
+            logger.warning("Impossibile verificare i job interrotti: %s", e)
+
+    async def close(self) -> None:
+        """Interrompe i job in esecuzione in questo worker (restano nello stato 'interrotto')"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _expire_stale(self, db: AsyncIOMotorDatabase) -> None:
+        limite = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        query = {"attivo": True, "aggiornato_il": {"$lt": limite}, "_id": {"$nin": list(self._tasks)}}
+        async for job in db[JOBS_COLLECTION].find(query, {"tipo": 1}):
+            logger.warning("Job %s (%s) interrotto: nessun aggiornamento dal worker", job["_id"], job["tipo"])
+            await self._finish(db, job["_id"], STATO_INTERROTTO)
+
+    async def submit(self, db: AsyncIOMotorDatabase, tipo: str, parametri: dict, utente: str) -> dict:
+        """Crea un job e ne avvia l'esecuzione. Solleva JobConflict se uno dello stesso tipo è attivo"""
+        if tipo not in self.handlers:
+            raise ValueError(f"Tipo di job sconosciuto: {tipo}")
+
+        await self._expire_stale(db)
+        now = datetime.utcnow()
+        job = {
+            "_id": ObjectId(),
+            "tipo": tipo,
+            "stato": STATO_IN_CODA,
+            "attivo": True,
+            "parametri": parametri,
+            "progresso": {"elaborati": 0, "totale": None},
+            "risultato": None,
+            "errore": None,
+            "annulla_richiesto": False,
+            "creato_da": utente,
+            "worker": WORKER_ID,
+            "creato_il": now,
+            "aggiornato_il": now,
+            "avviato_il": None,
+            "terminato_il": None,
+        }
+        try:
+            await db[JOBS_COLLECTION].insert_one(job)
+        except DuplicateKeyError:
+            raise JobConflict(await db[JOBS_COLLECTION].find_one({"tipo": tipo, "attivo": True}))
+
+        self._tasks[job["_id"]] = asyncio.create_task(self._run(db, job))
+        return job
+
+    async def _heartbeat(self, db: AsyncIOMotorDatabase, job_id: ObjectId, task: asyncio.Task) -> None:
+        """
+        Rinnova aggiornato_il del job finché `task` lo esegue. Se il job non è
+        più attivo (segnato come interrotto da un altro worker) il task viene
+        annullato, perché il suo slot può essere già stato preso da un nuovo job.
+        """
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                risultato = await db[JOBS_COLLECTION].update_one(
+                    {"_id": job_id, "attivo": True},
+                    {"$set": {"aggiornato_il": datetime.utcnow()}}
+                )
+            except Exception as e:
+                logger.warning("Heartbeat del job %s non salvato: %s", job_id, e)
+                continue
+            if risultato.matched_count == 0:
+                logger.warning("Job %s non più attivo: esecuzione interrotta", job_id)
+                task.cancel()
+                return
+
+    async def _run(self, db: AsyncIOMotorDatabase, job: dict) -> None:
+        job_id = job["_id"]
+        heartbeat = asyncio.create_task(self._heartbeat(db, job_id, asyncio.current_task()))
+        try:
+            await db[JOBS_COLLECTION].update_one(
+                {"_id": job_id},
+                {"$set": {"stato": STATO_IN_ESECUZIONE, "avviato_il": datetime.utcnow(), "aggiornato_il": datetime.utcnow()}}
+            )
+            logger.info("Job %s (%s) avviato", job_id, job["tipo"])
+            risultato = await self.handlers[job["tipo"]](JobContext(db, job))
+            await self._finish(db, job_id, STATO_COMPLETATO, risultato=risultato)
+            logger.info("Job %s (%s) completato", job_id, job["tipo"])
+        except JobCancelled:
+            await self._finish(db, job_id, STATO_ANNULLATO)
+            logger.info("Job %s (%s) annullato", job_id, job["tipo"])
+        except asyncio.CancelledError:
+            await self._finish(db, job_id, STATO_INTERROTTO)
+            raise
+        except Exception as e:
+            logger.error("Errore nel job %s (%s): %s", job_id, job["tipo"], e)
+            await self._finish(db, job_id, STATO_ERRORE, errore=str(e))
+        finally:
+            heartbeat.cancel()
+            self._tasks.pop(job_id, None)
+
+    async def _finish(self, db: AsyncIOMotorDatabase, job_id: ObjectId, stato: str, **campi) -> None:
+        now = datetime.utcnow()
+        try:
+            await db[JOBS_COLLECTION].update_one(
+                {"_id": job_id},
+                {"$set": {"stato": stato, "aggiornato_il": now, "terminato_il": now, **campi}, "$unset": {"attivo": ""}}
+            )
+        except Exception as e:
+            logger.warning("Impossibile salvare lo stato finale del job %s: %s", job_id, e)
+
+    async def get(self, db: AsyncIOMotorDatabase, job_id: ObjectId) -> Optional[dict]:
+        return await db[JOBS_COLLECTION].find_one({"_id": job_id})
+
+    async def recent(self, db: AsyncIOMotorDatabase, limit: int, tipo: Optional[str] = None) -> List[dict]:
+        """Job più recenti per primi"""
+        query = {"tipo": tipo} if tipo else {}
+        return await db[JOBS_COLLECTION].find(query).sort("_id", -1).limit(limit).to_list(length=None)
+
+    async def cancel(self, db: AsyncIOMotorDatabase, job_id: ObjectId) -> Optional[dict]:
+        """
+        Richiede l'annullamento di un job attivo: l'handler si ferma al batch
+        successivo. Restituisce il job aggiornato, oppure None se non è attivo.
+        """
+        return await db[JOBS_COLLECTION].find_one_and_update(
+            {"_id": job_id, "attivo": True},
+            {"$set": {"annulla_richiesto": True, "aggiornato_il": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+
+job_manager = JobManager()
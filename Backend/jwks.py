@@ -0,0 +1,111 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import httpx
+from jose import jwk
+from jose.backends.base import Key
+
+from logging_config import get_logger
+
+logger = get_logger("jwks")
+
+
+class JWKSManager:
+    """
+    Gestisce le chiavi pubbliche (JWKS) di Keycloak.
+
+    - Ogni JWK viene convertita una sola volta in un oggetto chiave pronto per
+      la verifica della firma, indicizzato per 'kid'.
+    - Le richieste concorrenti a Keycloak vengono unificate (single-flight):
+      al massimo un fetch è in corso in ogni momento.
+    - Scaduto il TTL, le chiavi vengono aggiornate in background mentre le
+      richieste continuano a usare quelle correnti.
+    - Un 'kid' sconosciuto (es. dopo una rotazione delle chiavi) provoca un
+      nuovo fetch, limitato a uno ogni `min_refetch_interval` secondi.
+    """
+
+    def __init__(self, certs_url: str, ttl: float = 3600.0, min_refetch_interval: float = 30.0):
+        self.certs_url = certs_url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.jwks: Optional[dict] = None
+        self.keys: Dict[str, Key] = {}
+        self.fetched_at = 0.0
+        self.fetch_count = 0
+        self._last_forced_refresh = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def _fetch(self) -> bool:
+        """Scarica il JWKS e ricostruisce l'indice delle chiavi. Restituisce False in caso di errore"""
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(self.certs_url)
+                response.raise_for_status()
+                jwks = response.json()
+        except Exception as e:
+            logger.error("Errore nel recupero delle chiavi pubbliche: %s", e)
+            return False
+
+        keys = {}
+        for key_data in jwks.get("keys", []):
+            kid = key_data.get("kid")
+            # Keycloak espone anche chiavi di cifratura (use=enc): non servono per i token
+            if not kid or key_data.get("use", "sig") != "sig":
+                continue
+            try:
+                keys[kid] = jwk.construct(key_data, key_data.get("alg", "RS256"))
+            except Exception as e:
+                logger.warning("Chiave pubblica non valida per kid %s: %s", kid, e)
+
+        # Sostituzione atomica: le richieste in corso vedono il vecchio o il nuovo indice
+        self.jwks = jwks
+        self.keys = keys
+        self.fetched_at = time.monotonic()
+        self.fetch_count += 1
+        logger.info("Chiavi pubbliche ottenute da Keycloak: %d chiavi disponibili", len(keys))
+        return True
+
+    def refresh(self) -> asyncio.Task:
+        """Avvia un aggiornamento del JWKS, o restituisce quello già in corso (single-flight)"""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+        return self._inflight
+
+    async def get_keys(self) -> Dict[str, Key]:
+        """
+        Restituisce l'indice kid -> chiave.
+
+        Al primo utilizzo attende il fetch; in seguito, se il TTL è scaduto,
+        avvia l'aggiornamento in background senza bloccare la richiesta.
+        """
+        if not self.keys:
+            # shield: la cancellazione di una richiesta non interrompe il fetch condiviso
+            await asyncio.shield(self.refresh())
+        elif time.monotonic() - self.fetched_at > self.ttl:
+            self.refresh()
+        return self.keys
+
+    async def get_key(self, kid: str) -> Optional[Key]:
+        """Restituisce la chiave per il kid indicato, riscaricando il JWKS se il kid è sconosciuto"""
+        keys = await self.get_keys()
+        key = keys.get(kid)
+        if key is not None:
+            return key
+
+        now = time.monotonic()
+        if now - self._last_forced_refresh < self.min_refetch_interval:
+            return None
+
+        self._last_forced_refresh = now
+        await asyncio.shield(self.refresh())
+        return self.keys.get(kid)
+
+    def stats(self) -> dict:
+        """Restituisce lo stato del key manager"""
+        return {
+            "keys": sorted(self.keys),
+            "fetch_count": self.fetch_count,
+            "age_seconds": round(time.monotonic() - self.fetched_at, 1) if self.fetched_at else None,
+            "ttl": self.ttl,
+        }
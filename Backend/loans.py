@@ -0,0 +1,70 @@
+import json
+import base64
+import binascii
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from search import InvalidCursor
+
+# I prestiti sono i libri non disponibili (prenotazione=False), ordinati per data di restituzione
+LOAN_SORT = [("data_restituzione", 1), ("_id", 1)]
+
+# Limite al parametro `giorni` di /admin/prestiti/in-scadenza
+MAX_DUE_DAYS = 365
+
+
+def overdue_query(now: datetime) -> dict:
+    """Prestiti con data di restituzione già passata"""
+    return {"prenotazione": False, "data_restituzione": {"$lt": now}}
+
+
+def due_soon_query(now: datetime, giorni: int) -> dict:
+    """Prestiti da restituire tra adesso e `giorni` giorni"""
+    return {"prenotazione": False, "data_restituzione": {"$gte": now, "$lte": now + timedelta(days=giorni)}}
+
+
+def borrower_query(affittato_da: str) -> dict:
+    """Prestiti in corso di un utente (corrispondenza esatta sul nome)"""
+    return {"prenotazione": False, "affittato_da": affittato_da}
+
+
+def encode_loan_cursor(last: dict) -> str:
+    """Cursor opaco con la chiave di ordinamento (data_restituzione, _id) dell'ultimo prestito"""
+    data = last.get("data_restituzione")
+    key = {"id": str(last["_id"]), "d": data.isoformat() if isinstance(data, datetime) else None}
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_loan_cursor(cursor: str) -> dict:
+    """Decodifica un cursor prodotto da encode_loan_cursor. Solleva InvalidCursor se non valido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+        return {
+            "id": ObjectId(key["id"]),
+            "d": datetime.fromisoformat(key["d"]) if key["d"] is not None else None
+        }
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidCursor(cursor)
+
+
+def loan_keyset_filter(cursor: dict) -> dict:
+    """
+    Condizione che seleziona i prestiti successivi al cursor nell'ordinamento
+    (data_restituzione crescente, poi _id). I prestiti senza data vengono per primi.
+    """
+    if cursor["d"] is None:
+        return {
+            "$or": [
+                {"data_restituzione": None, "_id": {"$gt": cursor["id"]}},
+                {"data_restituzione": {"$type": "date"}}
+            ]
+        }
+    return {
+        "$or": [
+            {"data_restituzione": {"$gt": cursor["d"]}},
+            {"data_restituzione": cursor["d"], "_id": {"$gt": cursor["id"]}}
+        ]
+    }
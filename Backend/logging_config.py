@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# Configurazione del logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Frazione dei messaggi DEBUG effettivamente scritti (1.0 = tutti)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+# Traccia di debug dei token JWT (claim aud/iss/exp): disabilitata di default
+AUTH_DEBUG_TOKENS = os.getenv("AUTH_DEBUG_TOKENS", "false").lower() in ("1", "true", "yes")
+
+ROOT_LOGGER_NAME = "bookslibrary"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# ID della richiesta HTTP corrente, impostato dal middleware in main.py
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributi standard di LogRecord: tutto il resto arriva da `extra` e finisce nel JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler che scarta i record (contandoli) quando la coda è piena, invece di bloccare"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+class RequestContextFilter(logging.Filter):
+    """Aggiunge al record l'ID della richiesta corrente"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Scrive solo una frazione dei messaggi DEBUG; gli altri livelli passano sempre"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Una riga JSON per record: timestamp, livello, logger, messaggio, request_id e campi extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging() -> None:
+    """
+    Configura il logging dell'applicazione.
+
+    I logger scrivono su una coda in memoria (QueueHandler, non bloccante);
+    un thread dedicato (QueueListener) formatta i record e li scrive su
+    stdout, così le richieste non attendono mai l'I/O dei log. Se la coda è
+    piena il record viene scartato invece di bloccare.
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        ))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    # Il request_id va letto nel thread della richiesta, prima di accodare il record
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [queue_handler]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Svuota la coda e ferma il thread di scrittura dei log"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Restituisce un logger figlio di quello dell'applicazione"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+class RequestIDMiddleware:
+    """
+    Middleware ASGI che assegna a ogni richiesta un ID (header X-Request-ID
+    del client, se presente, altrimenti generato) e lo rende disponibile ai
+    log tramite request_id_var. L'ID viene restituito nell'header di risposta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.header = REQUEST_ID_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                request_id = value.decode("latin-1")[:128]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
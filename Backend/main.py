@@ -1,7 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from logging_config import setup_logging, RequestIDMiddleware, REQUEST_ID_HEADER
+
+# Logging asincrono (coda + thread dedicato) configurato prima di tutto il resto
+setup_logging()
+
 from database import lifespan_manager
-from routes import health, libri, user, admin
+from routes import health, libri, user, admin, prestiti, jobs, metrics
+from metrics import MetricsMiddleware
+from admission import AdmissionMiddleware
+from search import NEXT_CURSOR_HEADER
 
 app = FastAPI(
     title="BooksLibrary API",
@@ -10,6 +18,10 @@ app = FastAPI(
     lifespan=lifespan_manager
 )
 
+# Controllo di ammissione: oltre il limite di richieste in corso risponde subito 503
+# (aggiunto prima di CORS, così anche le risposte 503 hanno gli header CORS)
+app.add_middleware(AdmissionMiddleware)
+
 # Configurazione CORS per permettere comunicazione con frontend
 app.add_middleware(
     CORSMiddleware,
@@ -17,10 +29,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER, "ETag", "Retry-After"],
 )
 
+# ID di richiesta per correlare i log
+app.add_middleware(RequestIDMiddleware)
+
+# Latenza per route e status (endpoint /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # Includi i router
 app.include_router(health.router)
 app.include_router(libri.router)
 app.include_router(user.router)
 app.include_router(admin.router)
+app.include_router(prestiti.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
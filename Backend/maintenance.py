@@ -0,0 +1,100 @@
+from collections import Counter
+
+from catalog_stats import catalog_stats, libro_contributions, STATS_FIELDS
+from indexes import index_manager
+from jobs import job_manager, JobContext, JOB_BATCH_SIZE
+from search_cache import search_cache
+from suggest import suggest_index, SUGGEST_FIELDS
+
+# Tipi di job delle operazioni di manutenzione
+JOB_CANCELLA_LIBRI = "cancella_libri"
+JOB_REINDICIZZA = "reindicizza"
+
+
+async def cancella_tutti_libri(ctx: JobContext) -> dict:
+    """
+    Cancella tutti i libri a batch di JOB_BATCH_SIZE, in ordine di _id.
+
+    Sono cancellati solo i libri esistenti all'avvio del job (_id fino al
+    massimo iniziale): quelli creati nel frattempo restano, così il job
+    termina anche con inserimenti continui. Dopo ogni batch vengono
+    aggiornati cache, suggerimenti e statistiche, per cui un annullamento
+    lascia il catalogo coerente con i libri rimasti.
+    """
+    db = ctx.db
+    ultimo = await db.libri.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if ultimo is None:
+        await ctx.progress(0, 0)
+        return {"libri_cancellati": 0}
+
+    totale = await db.libri.count_documents({"_id": {"$lte": ultimo["_id"]}})
+    await ctx.progress(0, totale)
+
+    cancellati = 0
+    while True:
+        batch = await db.libri.find(
+            {"_id": {"$lte": ultimo["_id"]}}, {**STATS_FIELDS, **SUGGEST_FIELDS}
+        ).sort("_id", 1).limit(JOB_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+
+        result = await db.libri.delete_many({"_id": {"$in": [libro["_id"] for libro in batch]}})
+        cancellati += result.deleted_count
+        search_cache.invalidate()
+
+        delta = Counter()
+        for libro in batch:
+            delta.subtract(libro_contributions(libro))
+            suggest_index.update(libro, None)
+        await catalog_stats.apply_delta(db, {percorso: n for percorso, n in delta.items() if n})
+
+        await ctx.progress(cancellati, max(totale, cancellati))
+        await ctx.throttle()
+
+    # Conteggi esatti anche se qualche libro è stato modificato durante il job
+    await catalog_stats.reconcile(db)
+    return {"libri_cancellati": cancellati}
+
+
+async def reindicizza(ctx: JobContext) -> dict:
+    """
+    Riapplica il registro degli indici MongoDB un indice alla volta, poi
+    ricostruisce l'indice dei suggerimenti e le statistiche del catalogo.
+
+    Con il parametro ricrea=True anche gli indici che corrispondono alla
+    definizione vengono ricostruiti, sempre tramite un indice temporaneo
+    (vedi IndexManager.replace); l'indice testuale libri_text viene
+    ricostruito solo se la definizione è cambiata.
+    """
+    db = ctx.db
+    ricrea = bool(ctx.parametri.get("ricrea"))
+    indici = [(collection, model) for collection, models in index_manager.indexes.items() for model in models]
+    totale = len(indici) + 2
+
+    await ctx.progress(0, totale, fase="indici")
+    esistenti = {}
+    for i, (collection, model) in enumerate(indici, start=1):
+        if collection not in esistenti:
+            esistenti[collection] = await index_manager.existing(db, collection) or {}
+        await index_manager.apply_one(db, collection, model, esistenti[collection], force=ricrea)
+        await ctx.progress(i, totale, fase="indici")
+        await ctx.throttle()
+
+    await suggest_index.build(db)
+    await ctx.progress(len(indici) + 1, totale, fase="suggerimenti")
+
+    await catalog_stats.reconcile(db)
+    search_cache.invalidate()
+    await ctx.progress(totale, totale, fase="statistiche")
+
+    return {
+        "indici": {
+            collection: {nome: stato["stato"] for nome, stato in stati.items()}
+            for collection, stati in index_manager.state.items()
+        },
+        "suggerimenti": suggest_index.stats(),
+    }
+
+
+job_manager.register(JOB_CANCELLA_LIBRI, cancella_tutti_libri)
+job_manager.register(JOB_REINDICIZZA, reindicizza)
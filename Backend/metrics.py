@@ -0,0 +1,199 @@
+import time
+from typing import Callable, Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from pymongo import monitoring
+
+# Bucket (secondi) pensati per un'API che risponde tipicamente in pochi millisecondi
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Durata delle richieste HTTP per route, metodo e status",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "Durata dei comandi MongoDB (command monitoring del driver)",
+    ["command", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+MONGO_COMMANDS_IN_FLIGHT = Gauge(
+    "mongo_commands_in_flight",
+    "Comandi MongoDB inviati e in attesa di risposta"
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out_connections",
+    "Connessioni del pool MongoDB attualmente in uso"
+)
+MONGO_POOL_WAITING = Gauge(
+    "mongo_pool_waiting_operations",
+    "Operazioni in attesa di una connessione libera dal pool MongoDB"
+)
+
+GOOGLE_BOOKS_DURATION = Histogram(
+    "google_books_upstream_duration_seconds",
+    "Durata delle chiamate a Google Books (solo cache miss)",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+AUTH_VERIFY_DURATION = Histogram(
+    "auth_token_verify_duration_seconds",
+    "Durata della verifica completa di un token JWT (solo cache miss)",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight_requests",
+    "Richieste ammesse dal controllo di ammissione e non ancora terminate"
+)
+ADMISSION_LIMITS = Gauge(
+    "admission_limit",
+    "Soglie configurate del controllo di ammissione (0 = disattivata)",
+    ["limit"]
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_requests_total",
+    "Richieste rifiutate dal controllo di ammissione per motivo",
+    ["reason"]
+)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI che misura la durata di ogni richiesta HTTP.
+
+    La route è il template del percorso (es. /libri/{libro_id}), non il
+    percorso reale, per mantenere bassa la cardinalità delle label.
+    Il costo per richiesta è una lettura di perf_counter e un observe.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener del driver: durata di ogni comando MongoDB e comandi in corso"""
+
+    def started(self, event):
+        MONGO_COMMANDS_IN_FLIGHT.inc()
+
+    def succeeded(self, event):
+        MONGO_COMMANDS_IN_FLIGHT.dec()
+        MONGO_COMMAND_DURATION.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMANDS_IN_FLIGHT.dec()
+        MONGO_COMMAND_DURATION.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Listener del driver: connessioni in uso e operazioni in coda sul pool"""
+
+    def connection_check_out_started(self, event):
+        MONGO_POOL_WAITING.inc()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_WAITING.dec()
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_WAITING.dec()
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec()
+
+    # Eventi del pool non usati per le metriche (il driver richiede comunque i metodi)
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+
+class StatsCollector:
+    """
+    Espone come metriche i contatori delle cache e dei componenti in-process
+    (es. cache dei token, proxy Google Books) letti al momento dello scrape.
+    """
+
+    COUNTERS = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, stats: Callable[[], dict]) -> None:
+        self.sources[name] = stats
+
+    def collect(self):
+        counters = {
+            key: CounterMetricFamily(f"cache_{key}", f"Contatore {key} delle cache in-process", labels=["cache"])
+            for key in self.COUNTERS
+        }
+        size = GaugeMetricFamily("cache_entries", "Voci presenti nelle cache in-process", labels=["cache"])
+        size_bytes = GaugeMetricFamily("cache_bytes", "Byte occupati dalle cache in-process limitate in dimensione", labels=["cache"])
+        for name, stats in self.sources.items():
+            values = stats()
+            for key in self.COUNTERS:
+                if key in values:
+                    counters[key].add_metric([name], values[key])
+            if "size" in values:
+                size.add_metric([name], values["size"])
+            if values.get("maxbytes") is not None:
+                size_bytes.add_metric([name], values["bytes"])
+        yield from counters.values()
+        yield size
+        yield size_bytes
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def register_stats(name: str, stats: Callable[[], dict]) -> None:
+    """Registra una sorgente di contatori (funzione che restituisce un dict come TTLCache.stats())"""
+    stats_collector.register(name, stats)
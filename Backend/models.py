@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Union
 from pydantic import BaseModel, Field, ConfigDict
 from enum import Enum
 
@@ -70,3 +70,25 @@ class LibroResponse(BaseModel):
     data_concessione: Optional[datetime] = None
     stato_libro: Optional[StatoLibro] = None  # Opzionale per retrocompatibilità
 
+
+# Limite di id per POST /libri/batch
+BATCH_MAX_IDS = 500
+
+
+class LibriBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_IDS, description="ID dei libri da leggere")
+
+
+class LibriBatchResponse(BaseModel):
+    libri: List[Optional[LibroResponse]] = Field(..., description="Libri nell'ordine degli id richiesti (null se non trovato)")
+    non_trovati: List[str] = Field(..., description="ID richiesti che non corrispondono ad alcun libro")
+
+
+class ValoreFaccetta(BaseModel):
+    valore: Optional[Union[bool, str]] = Field(..., description="Valore del campo (null se assente nel libro)")
+    libri: int = Field(..., description="Numero di risultati con questo valore")
+
+
+class LibriFacetsResponse(BaseModel):
+    libri: List[LibroResponse] = Field(..., description="Pagina dei risultati")
+    facets: Dict[str, List[ValoreFaccetta]] = Field(..., description="Conteggi per ciascuna faccetta richiesta, dal valore più frequente")
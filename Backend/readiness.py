@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from jwks import JWKSManager
+from logging_config import get_logger
+
+logger = get_logger("readiness")
+
+# Intervallo (secondi) tra due verifiche e timeout di ciascuna verifica
+READINESS_INTERVAL = max(0.5, float(os.getenv("READINESS_INTERVAL", "5")))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+# Oltre questo numero di intervalli senza verifiche lo stato è considerato non aggiornato
+READINESS_STALE_INTERVALS = 3
+
+
+class ReadinessProber:
+    """
+    Stato di readiness aggiornato in background.
+
+    Ogni READINESS_INTERVAL secondi un task verifica MongoDB (ping) e la
+    raggiungibilità del JWKS di Keycloak; /health/ready legge solo lo stato
+    salvato, per cui le sonde dell'orchestratore e di Traefik non generano
+    traffico verso MongoDB e Keycloak e non competono con le richieste.
+
+    L'applicazione è pronta se MongoDB risponde e il JWKS è raggiungibile,
+    oppure le chiavi sono già in cache (i token continuano a essere verificati).
+    """
+
+    def __init__(self, interval: float = READINESS_INTERVAL, timeout: float = READINESS_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.checks: Dict[str, dict] = {}
+        self.checked_at: Optional[float] = None
+        self._mongo_client: Optional[AsyncIOMotorClient] = None
+        self._jwks_manager: Optional[JWKSManager] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, mongo_client: AsyncIOMotorClient, jwks_manager: JWKSManager) -> None:
+        """Avvia le verifiche periodiche in background (la prima subito)"""
+        self._mongo_client = mongo_client
+        self._jwks_manager = jwks_manager
+        self._http = httpx.AsyncClient(timeout=self.timeout)
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.interval)
+
+    async def probe(self) -> None:
+        """Esegue tutte le verifiche in parallelo e aggiorna lo stato"""
+        await asyncio.gather(
+            self._check("mongodb", self._ping_mongodb),
+            self._check("jwks", self._fetch_jwks),
+        )
+        self.checked_at = time.monotonic()
+
+    async def _ping_mongodb(self) -> None:
+        await self._mongo_client.admin.command("ping")
+
+    async def _fetch_jwks(self) -> None:
+        response = await self._http.get(self._jwks_manager.certs_url)
+        response.raise_for_status()
+
+    async def _check(self, name: str, check: Callable[[], Awaitable[None]]) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), timeout=self.timeout)
+            errore = None
+        except asyncio.TimeoutError:
+            errore = f"timeout dopo {self.timeout:g}s"
+        except Exception as e:
+            errore = str(e) or type(e).__name__
+
+        # Si registrano solo i cambi di stato, non ogni verifica
+        precedente = self.checks.get(name, {}).get("ok")
+        ok = errore is None
+        if not ok and precedente is not False:
+            logger.warning("Verifica %s fallita: %s", name, errore)
+        elif ok and precedente is False:
+            logger.info("Verifica %s di nuovo riuscita", name)
+        self.checks[name] = {
+            "ok": ok,
+            "errore": errore,
+            "latenza_ms": round((time.perf_counter() - start) * 1000, 1),
+            "verificato_il": datetime.utcnow(),
+        }
+
+    def is_ready(self) -> bool:
+        if self.checked_at is None:
+            return False
+        if time.monotonic() - self.checked_at > self.interval * READINESS_STALE_INTERVALS + self.timeout:
+            return False
+        mongodb = self.checks.get("mongodb", {}).get("ok", False)
+        jwks = self.checks.get("jwks", {}).get("ok", False) or bool(self._jwks_manager and self._jwks_manager.keys)
+        return mongodb and jwks
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "checks": {name: dict(check) for name, check in self.checks.items()},
+            "age_seconds": round(time.monotonic() - self.checked_at, 1) if self.checked_at is not None else None,
+            "interval": self.interval,
+        }
+
+
+readiness_prober = ReadinessProber()
@@ -1,56 +1,180 @@
-from fastapi import APIRouter, HTTPException, Depends
-import asyncio
-from database import get_database, get_executor
-from auth import require_role
+import os
+from collections import Counter
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from pymongo.errors import BulkWriteError
+from database import get_database
+from bulk_import import iter_records, ImportRowError, NDJSON_CONTENT_TYPES, CSV_CONTENT_TYPES
+from auth import require_role, get_token_cache_stats, jwks_manager
+from admission import rate_limiter
+from google_books import google_books_client
+from catalog_stats import catalog_stats, libro_contributions
+from search_cache import search_cache
+from suggest import suggest_index
+from jobs import format_job
+from maintenance import JOB_CANCELLA_LIBRI
+from routes.jobs import avvia_job
 
 router = APIRouter()
 
+# Import massivo: dimensione dei batch di insert_many e numero massimo di errori riportati
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
 
 @router.get("/admin/stats")
 async def get_admin_stats(current_user: dict = Depends(require_role("admin"))):
-    """Endpoint riservato agli amministratori - statistiche del sistema"""
+    """
+    Endpoint riservato agli amministratori - statistiche del sistema.
+    
+    Le statistiche (totale, suddivisioni per stato, disponibilità, lingua e
+    categoria, libri in prestito) sono lette dal documento mantenuto in modo
+    incrementale da catalog_stats, senza scansionare la collection.
+    """
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
     
     try:
-        loop = asyncio.get_event_loop()
-        total_libri = await loop.run_in_executor(
-            executor,
-            database.libri.count_documents,
-            {}
-        )
+        statistiche = await catalog_stats.read(database)
         
         return {
-            "total_libri": total_libri,
+            "total_libri": statistiche["totale"],
+            **statistiche,
             "admin": current_user["username"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
 
 
-@router.delete("/admin/libri/all")
-async def cancella_tutti_libri(current_user: dict = Depends(require_role("admin"))):
-    """Endpoint riservato agli amministratori - cancella tutti i libri dal database"""
+@router.post("/admin/stats/riconcilia")
+async def riconcilia_statistiche(current_user: dict = Depends(require_role("admin"))):
+    """Endpoint riservato agli amministratori - ricalcola subito le statistiche del catalogo"""
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
     
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            database.libri.delete_many,
-            {}
+        await catalog_stats.reconcile(database)
+        return await catalog_stats.read(database)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
+
+
+@router.delete("/admin/libri/all", status_code=202)
+async def cancella_tutti_libri(current_user: dict = Depends(require_role("admin"))):
+    """
+    Endpoint riservato agli amministratori - cancella tutti i libri dal database.
+    
+    La cancellazione avviene in background a batch (job "cancella_libri"):
+    la risposta contiene il job, da seguire con GET /admin/jobs/{id} e
+    annullabile con POST /admin/jobs/{id}/annulla.
+    """
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    job = await avvia_job(database, JOB_CANCELLA_LIBRI, {}, current_user)
+    return {
+        "messaggio": "Cancellazione di tutti i libri avviata",
+        "job": format_job(job)
+    }
+
+
+@router.get("/admin/cache/stats")
+async def get_cache_stats(current_user: dict = Depends(require_role("admin"))):
+    """Endpoint riservato agli amministratori - contatori delle cache in-process"""
+    return {
+        "token_cache": get_token_cache_stats(),
+        "jwks": jwks_manager.stats(),
+        "google_books": google_books_client.stats(),
+        "search": search_cache.stats(),
+        "suggest": suggest_index.stats(),
+        "rate_limit": rate_limiter.stats()
+    }
+
+
+@router.post("/admin/libri/import")
+async def importa_libri(
+    request: Request,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=10000, description="Libri per ogni insert_many"),
+    current_user: dict = Depends(require_role("admin"))
+):
+    """
+    Endpoint riservato agli amministratori - import massivo di libri.
+    
+    Il body (Content-Type application/x-ndjson oppure text/csv con intestazione)
+    viene letto in streaming: ogni riga è validata come LibroCreate, le date
+    sono normalizzate come in crea_libro e i libri validi sono scritti con
+    insert_many(ordered=False) a blocchi di `batch_size`. Le righe non valide
+    o rifiutate da MongoDB finiscono nel report senza interrompere l'import.
+    """
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES:
+        formato = "ndjson"
+    elif content_type in CSV_CONTENT_TYPES:
+        formato = "csv"
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail="Formato non supportato: usare application/x-ndjson oppure text/csv"
         )
+    
+    report = {"righe_lette": 0, "importati": 0, "errori_totali": 0, "errori": []}
+    
+    def registra_errore(riga: int, errore: str):
+        report["errori_totali"] += 1
+        if len(report["errori"]) < IMPORT_MAX_ERRORS:
+            report["errori"].append({"riga": riga, "errore": errore})
+    
+    async def scrivi_batch(batch: list):
+        if not batch:
+            return
+        rifiutati = set()
+        try:
+            result = await database.libri.insert_many([doc for _, doc in batch], ordered=False)
+            report["importati"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            report["importati"] += e.details.get("nInserted", 0)
+            for write_error in e.details.get("writeErrors", []):
+                rifiutati.add(write_error["index"])
+                registra_errore(batch[write_error["index"]][0], write_error.get("errmsg", "Errore di scrittura"))
         
-        return {
-            "messaggio": "Tutti i libri sono stati cancellati",
-            "libri_cancellati": result.deleted_count
-        }
+        search_cache.invalidate()
+        
+        # Un solo $inc sulle statistiche per tutto il batch
+        delta = Counter()
+        for indice, (_, doc) in enumerate(batch):
+            if indice not in rifiutati:
+                delta.update(libro_contributions(doc))
+                suggest_index.update(None, doc)
+        await catalog_stats.apply_delta(database, dict(delta))
+    
+    batch = []
+    try:
+        async for riga, documento, errore in iter_records(request.stream(), formato):
+            report["righe_lette"] += 1
+            if errore:
+                registra_errore(riga, errore)
+                continue
+            batch.append((riga, documento))
+            if len(batch) >= batch_size:
+                await scrivi_batch(batch)
+                batch = []
+        await scrivi_batch(batch)
+    except ImportRowError as e:
+        raise HTTPException(status_code=400, detail=f"Intestazione CSV non valida: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore durante l'import dopo {report['importati']} libri importati: {str(e)}"
+        )
+    
+    return report
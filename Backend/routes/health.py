@@ -1,9 +1,24 @@
-from fastapi import APIRouter
+import os
 import asyncio
-from database import get_mongo_client, get_executor, get_database, MONGODB_DB_NAME
+from fastapi import APIRouter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from database import get_mongo_client, get_database, MONGODB_DB_NAME
+from indexes import index_manager
+from readiness import readiness_prober
+from cache import TTLCache
+from metrics import register_stats
 
 router = APIRouter()
 
+# Durata (secondi) della cache di /db/info
+DB_INFO_CACHE_TTL = float(os.getenv("DB_INFO_CACHE_TTL", "10"))
+
+db_info_cache = TTLCache(maxsize=1, ttl=DB_INFO_CACHE_TTL)
+register_stats("db_info", db_info_cache.stats)
+# Una sola lettura di dbStats alla volta: le richieste concorrenti attendono il risultato
+_db_info_lock = asyncio.Lock()
+
 
 @router.get("/")
 async def root():
@@ -16,22 +31,37 @@ async def root():
     }
 
 
+@router.get("/health/live")
+async def liveness():
+    """Liveness: il processo risponde. Nessuna chiamata a MongoDB o Keycloak"""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    """
+    Readiness: stato delle dipendenze (MongoDB, JWKS di Keycloak) verificato
+    in background da readiness_prober. Risponde 503 se l'applicazione non è pronta.
+    """
+    stato = readiness_prober.status()
+    return JSONResponse(
+        content=jsonable_encoder({"status": "ready" if stato["ready"] else "not_ready", **stato}),
+        status_code=200 if stato["ready"] else 503
+    )
+
+
 @router.get("/health")
 async def health_check():
-    """Endpoint per verificare lo stato dell'applicazione e del database"""
-    mongo_client = get_mongo_client()
-    executor = get_executor()
-    
-    try:
-        if mongo_client is not None:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(executor, mongo_client.admin.command, 'ping')
-            db_status = "connesso"
-        else:
-            db_status = "non connesso"
-    except Exception as e:
-        db_status = f"errore: {str(e)}"
-    
+    """Endpoint per verificare lo stato dell'applicazione e del database (dall'ultima verifica in background)"""
+    mongodb = readiness_prober.checks.get("mongodb")
+
+    if get_mongo_client() is None or mongodb is None:
+        db_status = "non connesso"
+    elif mongodb["ok"]:
+        db_status = "connesso"
+    else:
+        db_status = f"errore: {mongodb['errore']}"
+
     return {
         "status": "healthy",
         "database": db_status
@@ -40,27 +70,43 @@ async def health_check():
 
 @router.get("/db/info")
 async def db_info():
-    """Endpoint per ottenere informazioni sul database"""
+    """
+    Endpoint per ottenere informazioni sul database.
+
+    Il risultato resta in cache per DB_INFO_CACHE_TTL secondi: le richieste
+    frequenti non ripetono list_collection_names e dbStats.
+    """
     database = get_database()
-    executor = get_executor()
-    
+
     if database is None:
         return {"error": "Database non connesso"}
-    
-    try:
-        loop = asyncio.get_event_loop()
-        collections = await loop.run_in_executor(executor, database.list_collection_names)
-        stats = await loop.run_in_executor(executor, database.command, "dbStats")
-        
-        return {
-            "database_name": MONGODB_DB_NAME,
-            "collections": collections,
-            "stats": {
-                "collections": stats.get("collections", 0),
-                "dataSize": stats.get("dataSize", 0),
-                "storageSize": stats.get("storageSize", 0)
+
+    info = db_info_cache.get("db_info")
+    if info is not None:
+        return info
+
+    async with _db_info_lock:
+        info = db_info_cache.get("db_info")
+        if info is not None:
+            return info
+
+        try:
+            collections = await database.list_collection_names()
+            stats = await database.command("dbStats")
+
+            info = {
+                "database_name": MONGODB_DB_NAME,
+                "collections": collections,
+                "stats": {
+                    "collections": stats.get("collections", 0),
+                    "dataSize": stats.get("dataSize", 0),
+                    "storageSize": stats.get("storageSize", 0),
+                    "indexSize": stats.get("indexSize", 0)
+                },
+                "indici": await index_manager.status(database)
             }
-        }
-    except Exception as e:
-        return {"error": str(e)}
+        except Exception as e:
+            return {"error": str(e)}
 
+        db_info_cache.set("db_info", info)
+        return info
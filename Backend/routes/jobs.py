@@ -0,0 +1,99 @@
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Depends, Query
+
+from database import get_database
+from auth import require_role
+from jobs import job_manager, format_job, JobConflict
+from maintenance import JOB_REINDICIZZA
+
+router = APIRouter()
+
+
+def parse_job_id(job_id: str) -> ObjectId:
+    try:
+        return ObjectId(job_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="ID non valido")
+
+
+async def avvia_job(database, tipo: str, parametri: dict, current_user: dict) -> dict:
+    """Crea un job; 409 se ne è già attivo uno dello stesso tipo"""
+    try:
+        return await job_manager.submit(database, tipo, parametri, current_user["username"])
+    except JobConflict as e:
+        attivo = f" (job {e.job['_id']})" if e.job else ""
+        raise HTTPException(status_code=409, detail=f"Operazione già in corso{attivo}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore nell'avvio del job: {str(e)}")
+
+
+@router.get("/admin/jobs")
+async def lista_jobs(
+    tipo: Optional[str] = Query(None, description="Solo i job di questo tipo"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(require_role("admin"))
+):
+    """Endpoint riservato agli amministratori - job più recenti, dal più nuovo"""
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    try:
+        return [format_job(job) for job in await job_manager.recent(database, limit, tipo)]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
+
+
+@router.post("/admin/jobs/reindicizza", status_code=202)
+async def reindicizza(
+    ricrea: bool = Query(False, description="Ricostruisce anche gli indici già conformi al registro (tranne quello testuale)"),
+    current_user: dict = Depends(require_role("admin"))
+):
+    """
+    Endpoint riservato agli amministratori - riapplica in background gli
+    indici MongoDB e ricostruisce suggerimenti e statistiche (job "reindicizza")
+    """
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    return format_job(await avvia_job(database, JOB_REINDICIZZA, {"ricrea": ricrea}, current_user))
+
+
+@router.get("/admin/jobs/{job_id}")
+async def stato_job(job_id: str, current_user: dict = Depends(require_role("admin"))):
+    """Endpoint riservato agli amministratori - stato e progresso di un job"""
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    job = await job_manager.get(database, parse_job_id(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return format_job(job)
+
+
+@router.post("/admin/jobs/{job_id}/annulla", status_code=202)
+async def annulla_job(job_id: str, current_user: dict = Depends(require_role("admin"))):
+    """
+    Endpoint riservato agli amministratori - richiede l'annullamento di un job
+    attivo, che si ferma al termine del batch in corso
+    """
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    job_id = parse_job_id(job_id)
+    job = await job_manager.cancel(database, job_id)
+    if job is None:
+        if await job_manager.get(database, job_id) is None:
+            raise HTTPException(status_code=404, detail="Job non trovato")
+        raise HTTPException(status_code=409, detail="Il job è già terminato")
+    return format_job(job)
@@ -1,18 +1,48 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Header
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Optional, Dict, Any, Tuple, Union
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import date, datetime
-import asyncio
-import traceback
-import re
 import httpx
+import orjson
 
-from models import LibroCreate, LibroUpdate, LibroResponse
-from database import get_database, get_executor, convert_objectid
+from models import (
+    LibroCreate, LibroUpdate, LibroResponse, LibriBatchRequest, LibriBatchResponse, LibriFacetsResponse, StatoLibro
+)
+from database import get_database, convert_objectid, normalize_libro_dates
 from auth import get_current_user, require_role
+from google_books import google_books_client
+from catalog_stats import catalog_stats, STATS_FIELDS
+from search_cache import search_cache
+from suggest import suggest_index, SUGGEST_FIELDS
+from serialization import (
+    dumps_libro, dumps_libri, response_fields, libro_to_json_dict, ORJSON_OPTIONS, ADMIN_ONLY_FIELDS,
+    VERSION_FIELD, libro_version, libro_etag, parse_etags, etag_versions
+)
+from logging_config import get_logger
+from search import (
+    SEARCH_MODE_TEXT, SEARCH_MODE_REGEX, TEXT_SCORE_FIELD, TEXT_SCORE,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, FACET_FIELDS,
+    InvalidCursor, InvalidFields,
+    build_text_query, build_regex_query, build_projection, parse_fields,
+    encode_cursor, decode_cursor, keyset_filter,
+    build_facet_filters, build_facet_pipelines, format_facets
+)
 
 router = APIRouter()
+logger = get_logger("routes.libri")
+
+# Streaming NDJSON per /libri/search e /libri
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+
+def user_is_admin(current_user: Optional[dict]) -> bool:
+    """True se l'utente ha il ruolo admin (False se non ci sono informazioni sull'utente)"""
+    return bool(current_user) and "admin" in current_user.get("roles", ())
 
 
 def filter_libro_for_user(libro_dict: Dict[str, Any], current_user: dict) -> Dict[str, Any]:
@@ -22,74 +52,59 @@ def filter_libro_for_user(libro_dict: Dict[str, Any], current_user: dict) -> Dic
     """
     libro_filtered = libro_dict.copy()
     
-    # Se l'utente non è admin, rimuovi il campo affittato_da
-    if current_user and "roles" in current_user:
-        is_admin = "admin" in current_user["roles"]
-        if not is_admin and "affittato_da" in libro_filtered:
-            libro_filtered.pop("affittato_da", None)
-    else:
-        # Se non ci sono informazioni sull'utente, rimuovi il campo per sicurezza
+    # Se l'utente non è admin (o non ci sono informazioni sull'utente), rimuovi il campo affittato_da
+    if not user_is_admin(current_user):
         libro_filtered.pop("affittato_da", None)
     
     return libro_filtered
 
 
+def projection_for_user(current_user: dict, fields: Optional[List[str]] = None) -> Optional[dict]:
+    """
+    Proiezione MongoDB per le letture dei libri in base al ruolo dell'utente.
+    
+    Per gli utenti non admin i campi riservati (ADMIN_ONLY_FIELDS) vengono
+    esclusi già da MongoDB: non attraversano la rete e non vengono decodificati.
+    Con `fields` la proiezione è di inclusione (vedi build_projection) e i
+    campi riservati sono tolti dall'elenco; senza, è di esclusione, oppure
+    None (documento completo) per gli admin.
+    """
+    is_admin = user_is_admin(current_user)
+    if fields is not None:
+        if not is_admin:
+            fields = [name for name in fields if name not in ADMIN_ONLY_FIELDS]
+        return build_projection(fields)
+    if is_admin:
+        return None
+    return {name: 0 for name in ADMIN_ONLY_FIELDS}
+
+
 @router.post("/libri", response_model=LibroResponse, status_code=201)
-async def crea_libro(libro: LibroCreate, current_user: dict = Depends(require_role("admin"))):
-    """Crea un nuovo libro"""
+async def crea_libro(libro: LibroCreate, response: Response, current_user: dict = Depends(require_role("admin"))):
+    """Crea un nuovo libro (la versione iniziale è restituita nell'header ETag)"""
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
     
     try:
-        loop = asyncio.get_event_loop()
         libro_dict = libro.model_dump()
         
         # Converti le date in datetime per MongoDB se sono stringhe
-        if "data_restituzione" in libro_dict and libro_dict["data_restituzione"]:
-            if isinstance(libro_dict["data_restituzione"], str):
-                try:
-                    # Gestisce formato datetime-local (YYYY-MM-DDTHH:mm)
-                    if 'T' in libro_dict["data_restituzione"]:
-                        libro_dict["data_restituzione"] = datetime.fromisoformat(libro_dict["data_restituzione"])
-                    else:
-                        libro_dict["data_restituzione"] = datetime.fromisoformat(libro_dict["data_restituzione"].replace('Z', '+00:00'))
-                except ValueError:
-                    # Se la conversione fallisce, rimuovi il campo
-                    libro_dict.pop("data_restituzione", None)
+        normalize_libro_dates(libro_dict)
+        libro_dict[VERSION_FIELD] = 1
         
-        if "data_concessione" in libro_dict and libro_dict["data_concessione"]:
-            if isinstance(libro_dict["data_concessione"], str):
-                try:
-                    # Gestisce formato datetime-local (YYYY-MM-DDTHH:mm)
-                    if 'T' in libro_dict["data_concessione"]:
-                        libro_dict["data_concessione"] = datetime.fromisoformat(libro_dict["data_concessione"])
-                    else:
-                        libro_dict["data_concessione"] = datetime.fromisoformat(libro_dict["data_concessione"].replace('Z', '+00:00'))
-                except ValueError:
-                    # Se la conversione fallisce, rimuovi il campo
-                    libro_dict.pop("data_concessione", None)
-        
-        result = await loop.run_in_executor(
-            executor,
-            database.libri.insert_one,
-            libro_dict
-        )
-        
-        # Recupera il libro appena creato
-        libro_creato = await loop.run_in_executor(
-            executor,
-            database.libri.find_one,
-            {"_id": result.inserted_id}
-        )
-        
-        if not libro_creato:
-            raise HTTPException(status_code=500, detail="Libro creato ma non recuperabile")
+        # insert_one aggiunge a libro_dict l'_id generato: il documento inserito
+        # è già la risposta, senza una seconda lettura dal database
+        result = await database.libri.insert_one(libro_dict)
+        libro_dict["_id"] = result.inserted_id
+        search_cache.invalidate()
+        suggest_index.update(None, libro_dict)
+        await catalog_stats.apply(database, None, libro_dict)
+        response.headers["ETag"] = libro_etag(libro_dict, user_is_admin(current_user))
         
         # Converti per la risposta
-        libro_convertito = convert_objectid(libro_creato)
+        libro_convertito = convert_objectid(libro_dict)
         
         # Assicurati che _id sia presente come id per Pydantic
         if "_id" in libro_convertito:
@@ -109,78 +124,424 @@ async def crea_libro(libro: LibroCreate, current_user: dict = Depends(require_ro
         
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Esiste già un libro con questo ISBN")
     except Exception as e:
-        error_detail = f"Errore durante la creazione: {str(e)}\n{traceback.format_exc()}"
-        print(error_detail)  # Stampa nel log per debug
+        logger.exception("Errore durante la creazione: %s", e)
         raise HTTPException(status_code=500, detail=f"Errore durante la creazione: {str(e)}")
 
 
-@router.get("/libri/search", response_model=List[LibroResponse])
+def open_libri_cursor(
+    database,
+    query: dict,
+    scored: bool,
+    key: Optional[dict],
+    projection: Optional[dict],
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = None
+):
+    """
+    Apre il cursor MongoDB per una lista di libri, posizionato dopo `key`.
+    
+    I risultati della ricerca testuale sono ordinati per punteggio decrescente
+    e _id crescente (pipeline di aggregazione, perché find non può filtrare sul
+    punteggio); tutti gli altri per _id crescente.
+    """
+    if scored:
+        pipeline = [
+            {"$match": query},
+            {"$addFields": {TEXT_SCORE_FIELD: TEXT_SCORE}}
+        ]
+        if key:
+            pipeline.append({"$match": keyset_filter(key, scored)})
+        pipeline.append({"$sort": {TEXT_SCORE_FIELD: -1, "_id": 1}})
+        if limit:
+            pipeline.append({"$limit": limit})
+        if projection:
+            # Con una proiezione di inclusione il punteggio va richiesto esplicitamente
+            if any(projection.values()):
+                projection = {**projection, TEXT_SCORE_FIELD: 1}
+            pipeline.append({"$project": projection})
+        options = {"batchSize": batch_size} if batch_size else {}
+        return database.libri.aggregate(pipeline, **options)
+    
+    if key:
+        query = {"$and": [query, keyset_filter(key, scored)]}
+    mongo_cursor = database.libri.find(query, projection).sort("_id", 1)
+    if limit:
+        mongo_cursor = mongo_cursor.limit(limit)
+    if batch_size:
+        mongo_cursor = mongo_cursor.batch_size(batch_size)
+    return mongo_cursor
+
+
+async def fetch_libri_page(
+    database,
+    query: dict,
+    scored: bool,
+    cursor: Optional[str],
+    limit: int,
+    projection: Optional[dict]
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Legge una pagina di libri con paginazione keyset.
+    
+    Viene letto un documento in più del limite per sapere se esiste una
+    pagina successiva. Restituisce (libri, next_cursor); next_cursor è None
+    sull'ultima pagina.
+    """
+    key = decode_cursor(cursor, scored) if cursor else None
+    libri = await open_libri_cursor(database, query, scored, key, projection, limit=limit + 1).to_list(length=None)
+    
+    next_cursor = None
+    if len(libri) > limit:
+        libri = libri[:limit]
+        next_cursor = encode_cursor(libri[-1], scored)
+    
+    return libri, next_cursor
+
+
+async def fetch_libri_page_with_facets(
+    database,
+    query: dict,
+    scored: bool,
+    cursor: Optional[str],
+    limit: int,
+    projection: Optional[dict],
+    facets: List[str]
+) -> Tuple[List[dict], Optional[str], dict]:
+    """
+    Come fetch_libri_page, ma con un solo round trip calcola anche i
+    conteggi delle faccette su tutti i risultati della ricerca: dopo il
+    $match (che usa gli indici) un $facet produce sia la pagina sia un
+    raggruppamento per ciascuna faccetta. Restituisce (libri, next_cursor, faccette).
+    """
+    key = decode_cursor(cursor, scored) if cursor else None
+    
+    pipeline = [{"$match": query}]
+    if scored:
+        pipeline.append({"$addFields": {TEXT_SCORE_FIELD: TEXT_SCORE}})
+    
+    pagina = []
+    if key:
+        pagina.append({"$match": keyset_filter(key, scored)})
+    pagina.append({"$sort": {TEXT_SCORE_FIELD: -1, "_id": 1} if scored else {"_id": 1}})
+    pagina.append({"$limit": limit + 1})
+    if projection:
+        if scored and any(projection.values()):
+            projection = {**projection, TEXT_SCORE_FIELD: 1}
+        pagina.append({"$project": projection})
+    
+    # "libri" non è tra i FACET_FIELDS, quindi non si sovrappone a una faccetta
+    pipeline.append({"$facet": {"libri": pagina, **build_facet_pipelines(facets)}})
+    risultato = (await database.libri.aggregate(pipeline).to_list(length=1))[0]
+    
+    libri = risultato["libri"]
+    next_cursor = None
+    if len(libri) > limit:
+        libri = libri[:limit]
+        next_cursor = encode_cursor(libri[-1], scored)
+    
+    return libri, next_cursor, format_facets(risultato, facets)
+
+
+def libri_page_response(
+    libri: List[dict],
+    current_user: dict,
+    fields: Optional[List[str]],
+    next_cursor: Optional[str]
+) -> Response:
+    """
+    Costruisce la risposta per una pagina di libri: lista JSON nel corpo e
+    cursor della pagina successiva nell'header X-Next-Cursor (assente
+    sull'ultima pagina). Con `fields` vengono restituiti solo _id e i campi richiesti.
+    
+    I documenti sono serializzati direttamente in JSON (vedi serialization),
+    senza passare da LibroResponse.
+    """
+    content = dumps_libri(libri, user_is_admin(current_user), response_fields(fields))
+    return page_response(content, next_cursor)
+
+
+def page_response(content: bytes, next_cursor: Optional[str]) -> Response:
+    """Risposta JSON per una pagina già serializzata, con l'header X-Next-Cursor se c'è una pagina successiva"""
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def wants_ndjson(request: Request) -> bool:
+    """True se il client ha richiesto lo streaming NDJSON tramite l'header Accept"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def libri_stream_response(
+    database,
+    query: dict,
+    scored: bool,
+    cursor: Optional[str],
+    projection: Optional[dict],
+    current_user: dict,
+    fields: Optional[List[str]]
+) -> StreamingResponse:
+    """
+    Restituisce tutti i risultati (a partire dal cursor, se indicato) come
+    NDJSON: un libro serializzato per riga, scritto man mano che i batch
+    arrivano da MongoDB. La memoria usata non dipende dal numero di risultati.
+    """
+    key = decode_cursor(cursor, scored) if cursor else None
+    is_admin = user_is_admin(current_user)
+    campi = response_fields(fields)
+    mongo_cursor = open_libri_cursor(database, query, scored, key, projection, batch_size=STREAM_BATCH_SIZE)
+    
+    async def righe():
+        try:
+            async for libro in mongo_cursor:
+                yield dumps_libro(libro, is_admin, campi) + b"\n"
+        except Exception as e:
+            # Lo status è già stato inviato: si può solo interrompere lo stream
+            logger.exception("Errore durante lo streaming dei libri: %s", e)
+        finally:
+            await mongo_cursor.close()
+    
+    return StreamingResponse(righe(), media_type=NDJSON_MEDIA_TYPE)
+
+
+PaginationLimit = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Numero massimo di libri per pagina")
+PaginationCursor = Query(None, description="Cursor opaco della pagina successiva (header X-Next-Cursor)")
+ProjectionFields = Query(None, description="Campi da restituire, separati da virgola (es. titolo,authors)")
+
+
+# Lista di libri, oppure libri e conteggi se sono richieste le faccette
+@router.get("/libri/search", response_model=Union[List[LibroResponse], LibriFacetsResponse])
 async def cerca_libri(
+    request: Request,
     q: str = Query(..., min_length=1, description="Testo da cercare"),
+    mode: str = Query(
+        SEARCH_MODE_TEXT,
+        pattern=f"^({SEARCH_MODE_TEXT}|{SEARCH_MODE_REGEX})$",
+        description="text = indice testuale ordinato per rilevanza, regex = ricerca per sottostringa (scansione completa)"
+    ),
+    language: Optional[str] = Query(None, description="Filtro esatto sulla lingua del libro"),
+    categories: Optional[List[str]] = Query(None, description="Filtro sulla categoria (ripetibile, valori in OR)"),
+    publisher: Optional[List[str]] = Query(None, description="Filtro esatto sull'editore (ripetibile, valori in OR)"),
+    stato_libro: Optional[List[StatoLibro]] = Query(None, description="Filtro sullo stato del libro (ripetibile, valori in OR)"),
+    prenotazione: Optional[bool] = Query(None, description="Filtro sulla disponibilità"),
+    facets: Optional[str] = Query(
+        None,
+        description=f"Faccette da contare sui risultati, separate da virgola ({', '.join(FACET_FIELDS)})"
+    ),
+    limit: int = PaginationLimit,
+    cursor: Optional[str] = PaginationCursor,
+    fields: Optional[str] = ProjectionFields,
     current_user: dict = Depends(get_current_user)
 ):
-    """Cerca libri per titolo, autore, genere, sottogenere, recensione o commento"""
+    """
+    Cerca libri per titolo, autore, editore, categoria, lingua o ISBN.
+    
+    I risultati sono paginati: se esistono altri risultati, l'header
+    X-Next-Cursor contiene il cursor da passare per la pagina successiva.
+    Con "Accept: application/x-ndjson" vengono invece trasmessi in streaming
+    tutti i risultati, un libro per riga.
+    
+    I filtri (language, categories, publisher, stato_libro, prenotazione)
+    sono aggiunti alla condizione iniziale della query. Con `facets` il corpo
+    diventa {"libri": [...], "facets": {campo: [{"valore", "libri"}, ...]}}
+    e i conteggi, calcolati su tutti i risultati con i filtri applicati,
+    arrivano nella stessa aggregazione della pagina.
+    """
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
     
     try:
-        # Crea una regex case-insensitive per la ricerca
-        search_regex = re.compile(re.escape(q), re.IGNORECASE)
-        
-        # Crea la query MongoDB per cercare in tutti i campi testuali
-        query = {
-            "$or": [
-                {"titolo": search_regex},
-                {"authors": search_regex},
-                {"publisher": search_regex},
-                {"categories": search_regex},
-                {"language": search_regex},
-                {"isbn_10": search_regex}
-            ]
-        }
+        requested_fields = parse_fields(fields, LibroResponse.model_fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=f"Campo non valido: {e}")
+    
+    try:
+        requested_facets = parse_fields(facets, FACET_FIELDS)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=f"Faccetta non valida: {e}")
+    
+    if requested_facets is not None and wants_ndjson(request):
+        raise HTTPException(status_code=400, detail="Le faccette non sono disponibili in streaming NDJSON")
+    
+    # I campi riservati agli admin non vengono letti da MongoDB per gli altri utenti
+    projection = projection_for_user(current_user, requested_fields)
+    
+    filters = build_facet_filters(
+        language, categories, publisher,
+        [stato.value for stato in stato_libro] if stato_libro else None,
+        prenotazione
+    )
+    
+    try:
+        if mode == SEARCH_MODE_REGEX:
+            query, scored = build_regex_query(q), False
+        else:
+            query, scored = build_text_query(q)
         
-        loop = asyncio.get_event_loop()
-        libri = await loop.run_in_executor(
-            executor,
-            lambda: list(database.libri.find(query))
-        )
+        # Nella stessa $match della ricerca, così MongoDB li valuta durante la scansione dell'indice
+        query.update(filters)
         
-        libri_convertiti = [convert_objectid(libro) for libro in libri]
-        # Assicurati che ogni libro abbia id oltre a _id e valori di default per campi opzionali
-        for libro in libri_convertiti:
-            if "_id" in libro:
-                libro["id"] = libro["_id"]
-            # Imposta valori di default per retrocompatibilità
-            if "prenotazione" not in libro:
-                libro["prenotazione"] = True
-            if "stato_libro" not in libro:
-                libro["stato_libro"] = "buono"
+        if wants_ndjson(request):
+            return libri_stream_response(
+                database, query, scored, cursor, projection, current_user, requested_fields
+            )
         
-        # Filtra i campi sensibili per ogni libro in base al ruolo dell'utente
-        libri_filtered = [filter_libro_for_user(libro, current_user) for libro in libri_convertiti]
+        # Le pagine già servite (stessi parametri e stesso ruolo) escono dalla cache
+        # senza query né serializzazione; ogni scrittura sui libri la invalida
+        is_admin = user_is_admin(current_user)
+        cache_key = search_cache.key(
+            q, mode, filters, limit, cursor, requested_fields, requested_facets, is_admin
+        )
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return page_response(*cached)
+        generation = search_cache.generation
         
-        return [LibroResponse(**libro) for libro in libri_filtered]
+        if requested_facets is None:
+            libri, next_cursor = await fetch_libri_page(
+                database, query, scored, cursor, limit, projection
+            )
+            content = dumps_libri(libri, is_admin, response_fields(requested_fields))
+        else:
+            libri, next_cursor, conteggi = await fetch_libri_page_with_facets(
+                database, query, scored, cursor, limit, projection, requested_facets
+            )
+            content = b"".join((
+                b'{"libri":', dumps_libri(libri, is_admin, response_fields(requested_fields)),
+                b',"facets":', orjson.dumps(conteggi, option=ORJSON_OPTIONS), b"}"
+            ))
+        search_cache.set(cache_key, generation, content, next_cursor)
+        return page_response(content, next_cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Cursor non valido")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore durante la ricerca: {str(e)}")
 
 
+@router.get("/libri/suggest")
+async def suggerisci_libri(
+    prefix: str = Query(..., min_length=1, max_length=100, description="Inizio del titolo, dell'autore o dell'editore"),
+    limit: int = Query(10, ge=1, le=50, description="Numero massimo di suggerimenti"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Suggerimenti per la casella di ricerca (titoli, autori, editori) che
+    iniziano con `prefix`, anche a partire da una parola interna.
+    
+    Le risposte vengono dall'indice in memoria di suggest.py, senza query al
+    database; finché l'indice non è pronto (costruzione all'avvio) la lista è vuota.
+    """
+    return suggest_index.suggest(prefix, limit)
+
+
 @router.get("/libri", response_model=List[LibroResponse])
-async def lista_libri(current_user: dict = Depends(get_current_user)):
-    """Ottieni tutti i libri - DEPRECATO: usa /libri/search invece"""
-    # Non restituire più tutti i libri, restituisci lista vuota
-    # per forzare l'uso della ricerca
-    return []
+async def lista_libri(
+    request: Request,
+    limit: int = PaginationLimit,
+    cursor: Optional[str] = PaginationCursor,
+    fields: Optional[str] = ProjectionFields,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Elenca il catalogo a pagine, in ordine di inserimento (_id crescente).
+    
+    Ogni richiesta legge al massimo `limit` libri; la pagina successiva si
+    ottiene passando il cursor dell'header X-Next-Cursor. Con
+    "Accept: application/x-ndjson" l'intero catalogo viene trasmesso in streaming.
+    """
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    try:
+        requested_fields = parse_fields(fields, LibroResponse.model_fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=f"Campo non valido: {e}")
+    
+    # I campi riservati agli admin non vengono letti da MongoDB per gli altri utenti
+    projection = projection_for_user(current_user, requested_fields)
+    
+    try:
+        if wants_ndjson(request):
+            return libri_stream_response(
+                database, {}, False, cursor, projection, current_user, requested_fields
+            )
+        
+        libri, next_cursor = await fetch_libri_page(
+            database, {}, False, cursor, limit, projection
+        )
+        
+        return libri_page_response(libri, current_user, requested_fields, next_cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Cursor non valido")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore durante il recupero: {str(e)}")
+
+
+@router.post("/libri/batch", response_model=LibriBatchResponse)
+async def ottieni_libri_batch(richiesta: LibriBatchRequest, current_user: dict = Depends(get_current_user)):
+    """
+    Legge più libri per ID con una sola richiesta e una sola query $in.
+    
+    I libri sono restituiti nell'ordine degli id richiesti (gli id ripetuti
+    vengono ripetuti); al posto di un libro inesistente c'è null e il suo id
+    compare in `non_trovati`.
+    """
+    database = get_database()
+    
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+    
+    object_ids = []
+    for libro_id in richiesta.ids:
+        try:
+            object_ids.append(ObjectId(libro_id))
+        except InvalidId:
+            raise HTTPException(status_code=400, detail=f"ID non valido: {libro_id}")
+    
+    try:
+        trovati = {
+            libro["_id"]: libro
+            async for libro in database.libri.find(
+                {"_id": {"$in": list(set(object_ids))}}, projection_for_user(current_user)
+            )
+        }
+        
+        # Ogni documento è convertito una sola volta anche se richiesto più volte
+        is_admin = user_is_admin(current_user)
+        convertiti = {oid: libro_to_json_dict(libro, is_admin) for oid, libro in trovati.items()}
+        
+        content = orjson.dumps(
+            {
+                "libri": [convertiti.get(oid) for oid in object_ids],
+                "non_trovati": [libro_id for libro_id, oid in zip(richiesta.ids, object_ids) if oid not in trovati],
+            },
+            option=ORJSON_OPTIONS
+        )
+        return Response(content=content, media_type="application/json")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore durante il recupero: {str(e)}")
 
 
 @router.get("/libri/{libro_id}", response_model=LibroResponse)
-async def ottieni_libro(libro_id: str, current_user: dict = Depends(get_current_user)):
-    """Ottieni un libro specifico per ID"""
+async def ottieni_libro(
+    libro_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Ottieni un libro specifico per ID.
+    
+    La risposta contiene l'header ETag con la versione del libro: se il client
+    la ripresenta in If-None-Match e il libro non è cambiato la risposta è un
+    304 senza body, senza serializzare il documento.
+    """
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
@@ -191,30 +552,21 @@ async def ottieni_libro(libro_id: str, current_user: dict = Depends(get_current_
         raise HTTPException(status_code=400, detail="ID non valido")
     
     try:
-        loop = asyncio.get_event_loop()
-        libro = await loop.run_in_executor(
-            executor,
-            database.libri.find_one,
-            {"_id": object_id}
-        )
+        libro = await database.libri.find_one({"_id": object_id}, projection_for_user(current_user))
         
         if not libro:
             raise HTTPException(status_code=404, detail="Libro non trovato")
         
-        libro_convertito = convert_objectid(libro)
-        if "_id" in libro_convertito:
-            libro_convertito["id"] = libro_convertito["_id"]
+        is_admin = user_is_admin(current_user)
+        etag = libro_etag(libro, is_admin)
+        headers = {"ETag": etag}
         
-        # Assicurati che i campi opzionali abbiano valori di default
-        if "prenotazione" not in libro_convertito:
-            libro_convertito["prenotazione"] = True
-        if "stato_libro" not in libro_convertito:
-            libro_convertito["stato_libro"] = "buono"
+        richiesti = parse_etags(if_none_match)
+        if richiesti and ("*" in richiesti or etag in richiesti):
+            return Response(status_code=304, headers=headers)
         
-        # Filtra i campi sensibili in base al ruolo dell'utente
-        libro_filtered = filter_libro_for_user(libro_convertito, current_user)
-        
-        return LibroResponse(**libro_filtered)
+        # Serializzazione diretta in JSON (stesso schema di LibroResponse)
+        return Response(content=dumps_libro(libro, is_admin), media_type="application/json", headers=headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -222,10 +574,22 @@ async def ottieni_libro(libro_id: str, current_user: dict = Depends(get_current_
 
 
 @router.put("/libri/{libro_id}", response_model=LibroResponse)
-async def aggiorna_libro(libro_id: str, libro_update: LibroUpdate, current_user: dict = Depends(get_current_user)):
-    """Aggiorna un libro esistente"""
+async def aggiorna_libro(
+    libro_id: str,
+    libro_update: LibroUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Aggiorna un libro esistente.
+    
+    Con l'header If-Match (ETag ottenuto da GET /libri/{id}) l'aggiornamento
+    avviene solo se il libro è ancora a quella versione: il controllo fa parte
+    del filtro di find_one_and_update, quindi è atomico. Se nel frattempo il
+    libro è stato modificato la risposta è 412 e nessun campo viene scritto.
+    """
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
@@ -245,24 +609,40 @@ async def aggiorna_libro(libro_id: str, libro_update: LibroUpdate, current_user:
     if "data_pubblicazione" in update_data and isinstance(update_data["data_pubblicazione"], date):
         update_data["data_pubblicazione"] = datetime.combine(update_data["data_pubblicazione"], datetime.min.time())
     
+    filtro = {"_id": object_id}
+    # If-Match usa il confronto forte: un ETag debole non corrisponde mai (412)
+    attesi = parse_etags(if_match, weak=False)
+    if attesi is not None and "*" not in attesi:
+        versioni = etag_versions(attesi)
+        # La versione 0 corrisponde ai documenti senza contatore
+        if 0 in versioni:
+            versioni.append(None)
+        filtro[VERSION_FIELD] = {"$in": versioni}
+    
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            database.libri.update_one,
-            {"_id": object_id},
-            {"$set": update_data}
+        # Aggiorna in un solo round trip: il documento precedente serve per le
+        # statistiche e, con un $set dei soli campi di primo livello, il
+        # documento aggiornato si ottiene applicando update_data in memoria
+        libro_precedente = await database.libri.find_one_and_update(
+            filtro,
+            {"$set": update_data, "$inc": {VERSION_FIELD: 1}},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.matched_count == 0:
+        if libro_precedente is None:
+            if VERSION_FIELD in filtro and await database.libri.find_one({"_id": object_id}, {"_id": 1}):
+                raise HTTPException(status_code=412, detail="Il libro è stato modificato da un'altra richiesta")
             raise HTTPException(status_code=404, detail="Libro non trovato")
         
-        # Recupera il libro aggiornato
-        libro_aggiornato = await loop.run_in_executor(
-            executor,
-            database.libri.find_one,
-            {"_id": object_id}
-        )
+        libro_aggiornato = {
+            **libro_precedente,
+            **update_data,
+            VERSION_FIELD: libro_version(libro_precedente) + 1
+        }
+        search_cache.invalidate()
+        suggest_index.update(libro_precedente, libro_aggiornato)
+        await catalog_stats.apply(database, libro_precedente, libro_aggiornato)
+        response.headers["ETag"] = libro_etag(libro_aggiornato, user_is_admin(current_user))
         
         libro_convertito = convert_objectid(libro_aggiornato)
         if "_id" in libro_convertito:
@@ -280,6 +660,8 @@ async def aggiorna_libro(libro_id: str, libro_update: LibroUpdate, current_user:
         return LibroResponse(**libro_filtered)
     except HTTPException:
         raise
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Esiste già un libro con questo ISBN")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore durante l'aggiornamento: {str(e)}")
 
@@ -288,7 +670,6 @@ async def aggiorna_libro(libro_id: str, libro_update: LibroUpdate, current_user:
 async def elimina_libro(libro_id: str, current_user: dict = Depends(require_role("admin"))):
     """Elimina un libro"""
     database = get_database()
-    executor = get_executor()
     
     if database is None:
         raise HTTPException(status_code=500, detail="Database non connesso")
@@ -299,16 +680,17 @@ async def elimina_libro(libro_id: str, current_user: dict = Depends(require_role
         raise HTTPException(status_code=400, detail="ID non valido")
     
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            database.libri.delete_one,
-            {"_id": object_id}
+        libro_eliminato = await database.libri.find_one_and_delete(
+            {"_id": object_id},
+            projection={**STATS_FIELDS, **SUGGEST_FIELDS}
         )
         
-        if result.deleted_count == 0:
+        if libro_eliminato is None:
             raise HTTPException(status_code=404, detail="Libro non trovato")
         
+        search_cache.invalidate()
+        suggest_index.update(libro_eliminato, None)
+        await catalog_stats.apply(database, libro_eliminato, None)
         return None
     except HTTPException:
         raise
@@ -321,15 +703,9 @@ async def cerca_google_books(
     q: str = Query(..., min_length=1, description="Testo da cercare su Google Books"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Cerca libri su Google Books API tramite proxy"""
+    """Cerca libri su Google Books API tramite proxy (con cache e richieste unificate)"""
     try:
-        url = "https://www.googleapis.com/books/v1/volumes"
-        params = {"q": q}
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+        return await google_books_client.search(q)
     except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
@@ -340,4 +716,3 @@ async def cerca_google_books(
             status_code=500,
             detail=f"Errore sconosciuto: {str(e)}"
         )
-
@@ -0,0 +1,47 @@
+import os
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+from auth import get_verified_token
+
+router = APIRouter()
+
+# Token statico per lo scraper di Prometheus (Authorization: Bearer <token>); vuoto = solo admin
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+metrics_security = HTTPBearer(auto_error=False)
+
+
+async def require_metrics_access(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(metrics_security)
+) -> None:
+    """
+    Le metriche (latenze per route, comandi MongoDB, stato del pool, cache)
+    sono riservate: serve il token statico METRICS_TOKEN oppure il token
+    Keycloak di un admin.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Autenticazione richiesta",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return
+    entry = await get_verified_token(credentials)
+    if "admin" not in entry["user"]["roles"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Operazione non consentita. Ruolo richiesto: admin"
+        )
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+async def metrics():
+    """Endpoint per Prometheus: latenze per route, comandi MongoDB, Google Books, autenticazione e cache"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
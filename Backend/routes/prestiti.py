@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+
+from models import LibroResponse
+from database import get_database
+from auth import require_role
+from search import InvalidCursor, InvalidFields, parse_fields, build_projection
+from loans import (
+    LOAN_SORT, MAX_DUE_DAYS,
+    overdue_query, due_soon_query, borrower_query,
+    encode_loan_cursor, decode_loan_cursor, loan_keyset_filter
+)
+from routes.libri import libri_page_response, PaginationLimit, PaginationCursor, ProjectionFields
+
+router = APIRouter()
+
+
+async def fetch_prestiti_page(
+    database,
+    query: dict,
+    cursor: Optional[str],
+    limit: int,
+    projection: Optional[dict]
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Legge una pagina di prestiti ordinati per data di restituzione, con
+    paginazione keyset su (data_restituzione, _id). Le query usano gli indici
+    composti che iniziano con prenotazione o affittato_da (vedi indexes.py),
+    per cui filtro e ordinamento non richiedono scansioni né sort in memoria.
+    """
+    if cursor:
+        query = {"$and": [query, loan_keyset_filter(decode_loan_cursor(cursor))]}
+    if projection:
+        projection = {**projection, "data_restituzione": 1}
+
+    libri = await database.libri.find(query, projection).sort(LOAN_SORT).limit(limit + 1).to_list(length=None)
+
+    next_cursor = None
+    if len(libri) > limit:
+        libri = libri[:limit]
+        next_cursor = encode_loan_cursor(libri[-1])
+
+    return libri, next_cursor
+
+
+async def prestiti_response(query: dict, limit: int, cursor: Optional[str], fields: Optional[str], current_user: dict):
+    """Risposta comune agli endpoint dei prestiti (lista JSON + header X-Next-Cursor)"""
+    database = get_database()
+
+    if database is None:
+        raise HTTPException(status_code=500, detail="Database non connesso")
+
+    try:
+        requested_fields = parse_fields(fields, LibroResponse.model_fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=f"Campo non valido: {e}")
+
+    try:
+        libri, next_cursor = await fetch_prestiti_page(
+            database, query, cursor, limit, build_projection(requested_fields)
+        )
+        return libri_page_response(libri, current_user, requested_fields, next_cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Cursor non valido")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore durante il recupero dei prestiti: {str(e)}")
+
+
+@router.get("/admin/prestiti/scaduti", response_model=List[LibroResponse])
+async def prestiti_scaduti(
+    limit: int = PaginationLimit,
+    cursor: Optional[str] = PaginationCursor,
+    fields: Optional[str] = ProjectionFields,
+    current_user: dict = Depends(require_role("admin"))
+):
+    """Endpoint riservato agli amministratori - prestiti con restituzione scaduta, dal più vecchio"""
+    return await prestiti_response(overdue_query(datetime.utcnow()), limit, cursor, fields, current_user)
+
+
+@router.get("/admin/prestiti/in-scadenza", response_model=List[LibroResponse])
+async def prestiti_in_scadenza(
+    giorni: int = Query(7, ge=0, le=MAX_DUE_DAYS, description="Finestra in giorni a partire da adesso"),
+    limit: int = PaginationLimit,
+    cursor: Optional[str] = PaginationCursor,
+    fields: Optional[str] = ProjectionFields,
+    current_user: dict = Depends(require_role("admin"))
+):
+    """Endpoint riservato agli amministratori - prestiti da restituire entro `giorni` giorni"""
+    return await prestiti_response(due_soon_query(datetime.utcnow(), giorni), limit, cursor, fields, current_user)
+
+
+@router.get("/admin/prestiti/utente", response_model=List[LibroResponse])
+async def prestiti_utente(
+    affittato_da: str = Query(..., min_length=1, description="Nome e cognome di chi ha il libro in prestito"),
+    limit: int = PaginationLimit,
+    cursor: Optional[str] = PaginationCursor,
+    fields: Optional[str] = ProjectionFields,
+    current_user: dict = Depends(require_role("admin"))
+):
+    """Endpoint riservato agli amministratori - prestiti in corso di un utente"""
+    return await prestiti_response(borrower_query(affittato_da), limit, cursor, fields, current_user)
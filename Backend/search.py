@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import base64
+import binascii
+from typing import Optional, List, Iterable
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from serialization import LIBRO_DEFAULTS
+
+# Modalità di ricerca supportate da /libri/search
+SEARCH_MODE_TEXT = "text"
+SEARCH_MODE_REGEX = "regex"
+
+# Proiezione e ordinamento per il punteggio di rilevanza dell'indice testuale
+TEXT_SCORE_FIELD = "score"
+TEXT_SCORE = {"$meta": "textScore"}
+
+ISBN_10_PATTERN = re.compile(r"^\d{9}[\dX]$")
+
+# Paginazione keyset
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Faccette di /libri/search: conteggi per valore sui risultati della ricerca
+FACET_FIELDS = ("categories", "language", "publisher", "stato_libro", "prenotazione")
+# Valori restituiti per ogni faccetta (i più frequenti)
+FACET_MAX_VALUES = int(os.getenv("FACET_MAX_VALUES", "20"))
+
+
+class InvalidCursor(ValueError):
+    """Cursor di paginazione non decodificabile"""
+
+
+class InvalidFields(ValueError):
+    """Campi di proiezione non validi"""
+
+
+def normalize_isbn10(q: str) -> Optional[str]:
+    """Restituisce l'ISBN-10 normalizzato (senza trattini/spazi) se il testo è un ISBN-10, altrimenti None"""
+    candidate = re.sub(r"[\s-]", "", q).upper()
+    if ISBN_10_PATTERN.match(candidate):
+        return candidate
+    return None
+
+
+def build_regex_query(q: str) -> dict:
+    """
+    Query di ripiego: regex case-insensitive in $or su tutti i campi testuali.
+    Non può usare indici, quindi esegue una scansione completa della collection.
+    """
+    search_regex = re.compile(re.escape(q), re.IGNORECASE)
+    return {
+        "$or": [
+            {"titolo": search_regex},
+            {"authors": search_regex},
+            {"publisher": search_regex},
+            {"categories": search_regex},
+            {"language": search_regex},
+            {"isbn_10": search_regex}
+        ]
+    }
+
+
+def build_text_query(q: str) -> tuple:
+    """
+    Query indicizzata per la ricerca.
+
+    - Un ISBN-10 viene cercato per corrispondenza esatta sull'indice di isbn_10.
+    - Negli altri casi si usa l'indice testuale (titolo, authors, publisher,
+      categories) con punteggio di rilevanza pesato.
+
+    Restituisce (query, usa_punteggio).
+    """
+    isbn = normalize_isbn10(q)
+    if isbn:
+        return {"isbn_10": isbn}, False
+    return {"$text": {"$search": q}}, True
+
+
+def encode_cursor(last: dict, scored: bool) -> str:
+    """
+    Codifica in un cursor opaco la chiave di ordinamento dell'ultimo documento
+    della pagina: _id, più il punteggio di rilevanza per la ricerca testuale.
+    """
+    key = {"id": str(last["_id"])}
+    if scored:
+        key["s"] = last[TEXT_SCORE_FIELD]
+    raw = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, scored: bool) -> dict:
+    """Decodifica un cursor prodotto da encode_cursor. Solleva InvalidCursor se non valido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+        decoded = {"id": ObjectId(key["id"])}
+        if scored:
+            decoded["s"] = float(key["s"])
+        return decoded
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidCursor(cursor)
+
+
+def keyset_filter(cursor: dict, scored: bool) -> dict:
+    """
+    Condizione che seleziona i documenti successivi al cursor nell'ordinamento
+    (_id crescente, oppure punteggio decrescente e _id crescente).
+    """
+    if not scored:
+        return {"_id": {"$gt": cursor["id"]}}
+    return {
+        "$or": [
+            {TEXT_SCORE_FIELD: {"$lt": cursor["s"]}},
+            {TEXT_SCORE_FIELD: cursor["s"], "_id": {"$gt": cursor["id"]}}
+        ]
+    }
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """
+    Converte il parametro `fields` (nomi separati da virgola) in una lista di
+    campi validi. Restituisce None se non è richiesta alcuna proiezione.
+    """
+    if not fields:
+        return None
+    allowed = set(allowed)
+    requested = []
+    for name in fields.split(","):
+        name = name.strip()
+        if name in ("", "_id", "id"):
+            continue
+        if name not in allowed:
+            raise InvalidFields(name)
+        requested.append(name)
+    return requested
+
+
+def build_projection(fields: Optional[List[str]], required: Iterable[str] = ("titolo",)) -> Optional[dict]:
+    """Proiezione MongoDB per i campi richiesti (più quelli obbligatori della risposta)"""
+    if fields is None:
+        return None
+    projection = {name: 1 for name in required}
+    projection.update({name: 1 for name in fields})
+    return projection
+
+
+def build_facet_filters(
+    language: Optional[str] = None,
+    categories: Optional[List[str]] = None,
+    publisher: Optional[List[str]] = None,
+    stato_libro: Optional[List[str]] = None,
+    prenotazione: Optional[bool] = None
+) -> dict:
+    """
+    Condizioni dei filtri per faccetta, da unire alla query della ricerca
+    (più valori dello stesso filtro sono in OR, filtri diversi in AND).
+    
+    Per i campi con un default (LIBRO_DEFAULTS) il valore di default
+    comprende anche i documenti senza il campo, come nelle risposte e
+    nelle statistiche del catalogo.
+    """
+    filtri = {}
+    if language:
+        filtri["language"] = language
+    for campo, valori in (("categories", categories), ("publisher", publisher)):
+        if valori:
+            filtri[campo] = valori[0] if len(valori) == 1 else {"$in": list(valori)}
+    if stato_libro:
+        valori = list(stato_libro)
+        if LIBRO_DEFAULTS["stato_libro"] in valori:
+            valori.append(None)
+        filtri["stato_libro"] = valori[0] if len(valori) == 1 else {"$in": valori}
+    if prenotazione is not None:
+        # Come in catalog_stats, solo False indica un libro non disponibile
+        filtri["prenotazione"] = {"$ne": False} if prenotazione else False
+    return filtri
+
+
+def build_facet_pipelines(facets: Iterable[str], max_values: int = FACET_MAX_VALUES) -> dict:
+    """
+    Sotto-pipeline di $facet che contano i risultati per valore di ciascuna
+    faccetta. I documenti senza un campo con default (LIBRO_DEFAULTS) sono
+    contati sotto il valore di default.
+    """
+    pipelines = {}
+    for campo in facets:
+        pipeline = [{"$unwind": f"${campo}"}] if campo == "categories" else []
+        valore = f"${campo}"
+        if campo in LIBRO_DEFAULTS:
+            valore = {"$ifNull": [valore, LIBRO_DEFAULTS[campo]]}
+        pipeline += [
+            {"$group": {"_id": valore, "n": {"$sum": 1}}},
+            {"$sort": {"n": -1, "_id": 1}},
+            {"$limit": max_values},
+        ]
+        pipelines[campo] = pipeline
+    return pipelines
+
+
+def format_facets(risultato: dict, facets: Iterable[str]) -> dict:
+    """Converte l'output di $facet in {faccetta: [{"valore": ..., "libri": n}, ...]}"""
+    return {
+        campo: [{"valore": gruppo["_id"], "libri": gruppo["n"]} for gruppo in risultato.get(campo, [])]
+        for campo in facets
+    }
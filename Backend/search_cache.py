@@ -0,0 +1,87 @@
+import os
+from typing import Hashable, Optional, Tuple
+
+from cache import TTLCache
+from metrics import register_stats
+from search import SEARCH_MODE_TEXT
+
+# Cache delle pagine di /libri/search (risposta già serializzata)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def normalize_search_text(q: str, mode: str) -> str:
+    """
+    Normalizza il testo cercato per la chiave di cache. Entrambe le modalità
+    ignorano maiuscole e minuscole; la ricerca testuale ignora anche gli spazi
+    in eccesso, la regex no (il testo è cercato come sottostringa esatta).
+    """
+    if mode == SEARCH_MODE_TEXT:
+        q = " ".join(q.split())
+    return q.lower()
+
+
+class SearchCache:
+    """
+    Cache in-process (LRU+TTL, limitata in byte) delle pagine di /libri/search.
+
+    La chiave comprende tutti i parametri che cambiano la risposta e il ruolo
+    dell'utente (agli utenti non admin affittato_da non viene mostrato).
+    Ogni scrittura sui libri chiama invalidate(), che svuota la cache e
+    incrementa la generazione: una ricerca iniziata prima della scrittura e
+    terminata dopo non salva il proprio risultato, ormai potenzialmente vecchio.
+
+    Con più worker ogni processo ha la propria cache: le scritture arrivate a
+    un altro worker diventano visibili al più dopo SEARCH_CACHE_TTL secondi.
+    """
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL, maxbytes: int = SEARCH_CACHE_MAX_BYTES):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes)
+        self.generation = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(
+        q: str,
+        mode: str,
+        filters: dict,
+        limit: int,
+        cursor: Optional[str],
+        fields: Optional[list],
+        facets: Optional[list],
+        is_admin: bool
+    ) -> Hashable:
+        # I filtri sono condizioni MongoDB (valori semplici, {"$in": [...]} o {"$ne": False}): la repr ordinata è una chiave stabile
+        return (
+            normalize_search_text(q, mode), mode, repr(sorted(filters.items())), limit, cursor,
+            tuple(fields) if fields is not None else None,
+            tuple(facets) if facets is not None else None,
+            is_admin
+        )
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, Optional[str]]]:
+        """Restituisce (body, next_cursor) se la pagina è in cache"""
+        return self.cache.get(key)
+
+    def set(self, key: Hashable, generation: int, content: bytes, next_cursor: Optional[str]) -> None:
+        """Salva una pagina letta alla generazione `generation`, se nel frattempo non ci sono state scritture"""
+        if generation == self.generation:
+            self.cache.set(key, (content, next_cursor), size=len(content))
+
+    def invalidate(self) -> None:
+        """Da chiamare dopo ogni scrittura sui libri"""
+        self.generation += 1
+        self.invalidations += 1
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "generation": self.generation,
+            "invalidations": self.invalidations,
+        }
+
+
+search_cache = SearchCache()
+register_stats("search", search_cache.stats)
@@ -0,0 +1,103 @@
+from typing import Iterable, List, Optional
+
+import orjson
+
+from models import LibroResponse
+
+# Campi della risposta nell'ordine di LibroResponse (l'id è serializzato come "_id")
+LIBRO_FIELDS = tuple(name for name in LibroResponse.model_fields if name != "id")
+
+# Valori di default per i documenti creati prima dell'introduzione di questi campi
+LIBRO_DEFAULTS = {"prenotazione": True, "stato_libro": "buono"}
+
+# Campi visibili solo agli admin
+ADMIN_ONLY_FIELDS = ("affittato_da",)
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+def response_fields(fields: Optional[Iterable[str]] = None) -> tuple:
+    """Campi da serializzare, nell'ordine di LibroResponse (tutti se `fields` è None)"""
+    if fields is None:
+        return LIBRO_FIELDS
+    requested = set(fields)
+    return tuple(name for name in LIBRO_FIELDS if name in requested)
+
+
+def libro_to_json_dict(doc: dict, is_admin: bool, fields: tuple = LIBRO_FIELDS) -> dict:
+    """
+    Converte un documento MongoDB grezzo nel dizionario della risposta, con lo
+    stesso schema di LibroResponse ma senza validazione Pydantic né copie:
+    _id come stringa, default per i campi mancanti e campi riservati agli
+    admin impostati a null per gli altri utenti.
+    """
+    out = {"_id": str(doc["_id"])}
+    get = doc.get
+    for name in fields:
+        out[name] = get(name, LIBRO_DEFAULTS.get(name))
+    if not is_admin:
+        for name in ADMIN_ONLY_FIELDS:
+            if name in out:
+                out[name] = None
+    return out
+
+
+def dumps_libro(doc: dict, is_admin: bool, fields: tuple = LIBRO_FIELDS) -> bytes:
+    """Serializza un libro in JSON (bytes)"""
+    return orjson.dumps(libro_to_json_dict(doc, is_admin, fields), option=ORJSON_OPTIONS)
+
+
+def dumps_libri(docs: List[dict], is_admin: bool, fields: tuple = LIBRO_FIELDS) -> bytes:
+    """Serializza una lista di libri in un array JSON (bytes)"""
+    return orjson.dumps([libro_to_json_dict(doc, is_admin, fields) for doc in docs], option=ORJSON_OPTIONS)
+
+
+# Contatore di versione dei libri: 1 alla creazione, +1 a ogni aggiornamento.
+# I documenti creati prima della sua introduzione sono considerati alla versione 0
+VERSION_FIELD = "versione"
+
+
+def libro_version(doc: dict) -> int:
+    """Versione corrente di un documento libro"""
+    return doc.get(VERSION_FIELD) or 0
+
+
+def libro_etag(doc: dict, is_admin: bool) -> str:
+    """
+    ETag forte di un libro: versione più ruolo, perché admin e utenti ricevono
+    rappresentazioni diverse (affittato_da è visibile solo agli admin).
+    """
+    return f'"{libro_version(doc)}-{"a" if is_admin else "u"}"'
+
+
+def parse_etags(header: Optional[str], weak: bool = True) -> Optional[List[str]]:
+    """
+    Valori di un header If-Match / If-None-Match.
+    Restituisce None se l'header è assente e ["*"] per il carattere jolly.
+    
+    Con weak=True (If-None-Match, confronto debole) il prefisso W/ viene
+    rimosso; con weak=False (If-Match, confronto forte, RFC 9110 §13.1.1)
+    gli ETag deboli vengono scartati, perché non corrispondono mai.
+    """
+    if header is None:
+        return None
+    etags = []
+    for value in header.split(","):
+        value = value.strip()
+        if value.startswith("W/"):
+            if not weak:
+                continue
+            value = value[2:]
+        if value:
+            etags.append(value)
+    return etags
+
+
+def etag_versions(etags: List[str]) -> List[int]:
+    """Versioni contenute in una lista di ETag prodotti da libro_etag (gli altri valori vengono ignorati)"""
+    versions = []
+    for etag in etags:
+        version = etag.strip('"').split("-", 1)[0]
+        if version.isdigit():
+            versions.append(int(version))
+    return versions
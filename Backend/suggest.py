@@ -0,0 +1,309 @@
+import os
+import sys
+import asyncio
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from logging_config import get_logger
+from metrics import register_stats
+
+logger = get_logger("suggest")
+
+# Limite di memoria (stima in byte) dell'indice dei suggerimenti
+SUGGEST_MAX_BYTES = int(os.getenv("SUGGEST_MAX_BYTES", str(64 * 1024 * 1024)))
+# Parole iniziali di ogni valore da cui può partire un suggerimento ("rosa" -> "Il nome della rosa")
+SUGGEST_MAX_WORDS = int(os.getenv("SUGGEST_MAX_WORDS", "6"))
+# Voci esaminate per ogni richiesta: limita il costo dei prefissi molto comuni
+SUGGEST_SCAN_LIMIT = int(os.getenv("SUGGEST_SCAN_LIMIT", "256"))
+
+# Campi del libro indicizzati: tipo di suggerimento -> campo
+SUGGEST_KINDS = {"titolo": "titolo", "autore": "authors", "editore": "publisher"}
+SUGGEST_FIELDS = {campo: 1 for campo in SUGGEST_KINDS.values()}
+
+# Una voce dell'indice è "testo normalizzato da una parola in poi" + SEP + id del valore
+SEP = "\x00"
+# Stima del costo (byte) delle strutture Python per ogni valore e per ogni voce, oltre alle stringhe
+_VALUE_OVERHEAD = 300
+_SLOT_BYTES = 8
+
+
+def normalize_text(text: str) -> str:
+    """Minuscole, senza accenti e con spazi singoli: "Città  Eterna" -> "citta eterna" """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(ch for ch in text if not unicodedata.combining(ch)).split())
+
+
+def libro_values(libro: Optional[dict]) -> Iterable[Tuple[str, str]]:
+    """Coppie (tipo, testo) da indicizzare per un libro"""
+    if not libro:
+        return
+    for kind, campo in SUGGEST_KINDS.items():
+        valore = libro.get(campo)
+        for testo in (valore if isinstance(valore, list) else [valore]):
+            if isinstance(testo, str) and testo.strip():
+                yield kind, " ".join(testo.split())
+
+
+def value_entries(value_id: int, testo: str) -> List[str]:
+    """Voci dell'indice per un valore: una per ciascuna delle prime SUGGEST_MAX_WORDS parole"""
+    parole = normalize_text(testo).split()
+    return [
+        " ".join(parole[i:]) + SEP + str(value_id)
+        for i in range(min(len(parole), SUGGEST_MAX_WORDS))
+    ]
+
+
+class SuggestIndex:
+    """
+    Indice in memoria per /libri/suggest.
+
+    Ogni valore distinto (tipo, testo) è memorizzato una sola volta, con un id
+    e il numero di libri in cui compare. L'indice vero e proprio è una lista
+    ordinata di stringhe "testo normalizzato a partire da una parola\0id",
+    una per ciascuna delle prime parole del valore: la ricerca per prefisso è
+    una bisect più la scansione delle voci successive, al massimo
+    SUGGEST_SCAN_LIMIT, con confronti tra stringhe eseguiti in C.
+
+    L'indice viene costruito all'avvio in background e aggiornato dalle
+    scritture sui libri. Oltre SUGGEST_MAX_BYTES i nuovi valori non vengono
+    aggiunti (lo stato lo segnala come incompleto).
+    """
+
+    def __init__(self, max_bytes: int = SUGGEST_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._reset()
+        self.ready = False
+        self._pending: Optional[list] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _reset(self) -> None:
+        self.entries: List[str] = []
+        self.ids: Dict[Tuple[str, str], int] = {}     # (tipo, testo) -> id
+        self.values: Dict[int, Tuple[str, str]] = {}  # id -> (tipo, testo)
+        self.counts: Dict[int, int] = {}              # id -> numero di libri
+        self._next_id = 0
+        self.bytes = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _cost(testo: str, entries: List[str]) -> int:
+        """Stima dei byte occupati da un valore e dalle sue voci"""
+        return sys.getsizeof(testo) + _VALUE_OVERHEAD + sum(sys.getsizeof(e) + _SLOT_BYTES for e in entries)
+
+    def _new_value(self, kind: str, testo: str) -> Optional[Tuple[int, List[str]]]:
+        """Registra un nuovo valore se c'è spazio; restituisce (id, voci) oppure None"""
+        value_id = self._next_id
+        entries = value_entries(value_id, testo)
+        costo = self._cost(testo, entries)
+        if self.bytes + costo > self.max_bytes:
+            self.dropped += 1
+            return None
+        self._next_id += 1
+        self.ids[(kind, testo)] = value_id
+        self.values[value_id] = (kind, testo)
+        self.bytes += costo
+        return value_id, entries
+
+    # --- costruzione ---
+
+    async def start(self, db: AsyncIOMotorDatabase) -> None:
+        """Avvia la costruzione dell'indice in background, se non è già in corso"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._build(db))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def build(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Ricostruisce l'indice e ne attende la fine. Se una costruzione è già in
+        corso (es. quella avviata da start()) ne attende la fine invece di
+        avviarne una seconda in parallelo.
+        """
+        await self.start(db)
+        # shield: chi attende (es. un job annullato) non interrompe una costruzione condivisa
+        await asyncio.shield(self._task)
+
+    async def _build(self, db: AsyncIOMotorDatabase) -> None:
+        """
+        Legge titoli, autori ed editori di tutti i libri e ricostruisce l'indice.
+
+        I valori vengono contati durante la lettura, senza tenere in memoria i
+        valori di ogni libro. Le scritture arrivate nel frattempo finiscono in
+        una lista propria di questa costruzione; per i loro libri serve sapere
+        cosa è stato contato, perché il cursor può aver letto il libro prima o
+        dopo la scrittura: se la scrittura era già nota quando il cursor ha
+        letto il libro si conservano i valori letti, altrimenti il cursor ha
+        contato il documento precedente alla prima scrittura (il suo `before`).
+        Al termine quei libri vengono riletti e i conteggi corretti, finché non
+        ci sono nuove scritture.
+        """
+        pending: list = []
+        self._pending = pending
+        try:
+            counts: Dict[Tuple[str, str], int] = {}
+            # Valori contati, solo per i libri toccati dalle scritture in sospeso
+            per_libro: Dict[object, tuple] = {}
+
+            def conta(valori: tuple, n: int) -> None:
+                for valore in valori:
+                    totale = counts.get(valore, 0) + n
+                    if totale > 0:
+                        counts[valore] = totale
+                    else:
+                        counts.pop(valore, None)
+
+            def scritture_fino(visti: int, ids: set) -> int:
+                """Aggiunge a `ids` i libri delle scritture in sospeso da `visti` in poi"""
+                for scrittura in pending[visti:]:
+                    ids.update(libro["_id"] for libro in scrittura if libro and "_id" in libro)
+                return len(pending)
+
+            in_sospeso: set = set()
+            visti = 0
+            async for libro in db.libri.find({}, SUGGEST_FIELDS).batch_size(1000):
+                if len(pending) > visti:
+                    visti = scritture_fino(visti, in_sospeso)
+                valori = tuple(libro_values(libro))
+                if libro["_id"] in in_sospeso:
+                    per_libro[libro["_id"]] = valori
+                conta(valori, 1)
+
+            # `pending` resta completo (serve se la costruzione fallisce): `riletti_fino` indica
+            # le scritture i cui libri sono già stati riletti
+            riletti_fino = 0
+            while len(pending) > riletti_fino:
+                nuove, riletti_fino = pending[riletti_fino:], len(pending)
+                ids = set()
+                for before, after in nuove:
+                    for libro in (before, after):
+                        if libro and "_id" in libro:
+                            ids.add(libro["_id"])
+                            if libro["_id"] not in per_libro:
+                                per_libro[libro["_id"]] = tuple(libro_values(before))
+                riletti = {}
+                async for libro in db.libri.find({"_id": {"$in": list(ids)}}, SUGGEST_FIELDS):
+                    riletti[libro["_id"]] = libro
+                for libro_id in ids:
+                    valori = tuple(libro_values(riletti.get(libro_id)))
+                    conta(per_libro[libro_id], -1)
+                    conta(valori, 1)
+                    per_libro[libro_id] = valori
+
+            # Da qui alla fine non ci sono await: nessuna scrittura può inserirsi
+            per_libro.clear()
+            self._reset()
+            entries = []
+            for (kind, testo), n in counts.items():
+                nuovo = self._new_value(kind, testo)
+                if nuovo is not None:
+                    self.counts[nuovo[0]] = n
+                    entries.extend(nuovo[1])
+            # Una sola sort alla fine invece di un inserimento ordinato per voce
+            entries.sort()
+            self.entries = entries
+            self.ready = True
+            pending.clear()
+            logger.info(
+                "Indice dei suggerimenti costruito: %d valori, %d voci, ~%d KiB",
+                len(self.values), len(self.entries), self.bytes // 1024
+            )
+        except Exception as e:
+            logger.warning("Errore nella costruzione dell'indice dei suggerimenti: %s", e)
+        finally:
+            # Costruzione fallita o interrotta: l'indice precedente è intatto e le
+            # scritture arrivate nel frattempo gli vengono applicate come differenze
+            if self._pending is pending:
+                self._pending = None
+            for before, after in pending:
+                self.update(before, after)
+
+    # --- aggiornamenti incrementali ---
+
+    def update(self, before: Optional[dict], after: Optional[dict]) -> None:
+        """Applica una scrittura su un libro (before=None per un inserimento, after=None per una cancellazione)"""
+        if self._pending is not None:
+            self._pending.append((before, after))
+            return
+        for kind, testo in libro_values(before):
+            self._remove(kind, testo)
+        for kind, testo in libro_values(after):
+            self._add(kind, testo)
+
+    def _add(self, kind: str, testo: str) -> None:
+        value_id = self.ids.get((kind, testo))
+        if value_id is not None:
+            self.counts[value_id] += 1
+            return
+        nuovo = self._new_value(kind, testo)
+        if nuovo is None:
+            return
+        value_id, entries = nuovo
+        self.counts[value_id] = 1
+        for entry in entries:
+            insort(self.entries, entry)
+
+    def _remove(self, kind: str, testo: str) -> None:
+        value_id = self.ids.get((kind, testo))
+        if value_id is None:
+            return
+        if self.counts[value_id] > 1:
+            self.counts[value_id] -= 1
+            return
+        entries = value_entries(value_id, testo)
+        for entry in entries:
+            i = bisect_left(self.entries, entry)
+            if i < len(self.entries) and self.entries[i] == entry:
+                del self.entries[i]
+        self.bytes -= self._cost(testo, entries)
+        del self.ids[(kind, testo)], self.values[value_id], self.counts[value_id]
+
+    def clear(self) -> None:
+        """Svuota l'indice (es. dopo la cancellazione di tutti i libri)"""
+        self._reset()
+        if self._pending is not None:
+            self._pending.clear()
+
+    # --- ricerca ---
+
+    def suggest(self, prefix: str, limit: int) -> List[dict]:
+        """Suggerimenti per un prefisso, ordinati per numero di libri e poi alfabeticamente"""
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+        entries = self.entries
+        candidati = set()
+        i = bisect_left(entries, prefix)
+        fine = min(len(entries), i + SUGGEST_SCAN_LIMIT)
+        while i < fine and entries[i].startswith(prefix):
+            candidati.add(int(entries[i].rpartition(SEP)[2]))
+            i += 1
+        migliori = sorted(candidati, key=lambda v: (-self.counts[v], self.values[v][1]))[:limit]
+        return [
+            {"testo": self.values[v][1], "tipo": self.values[v][0], "libri": self.counts[v]}
+            for v in migliori
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.values),
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "maxbytes": self.max_bytes,
+            "dropped": self.dropped,
+            "ready": self.ready,
+            "complete": self.ready and self.dropped == 0,
+        }
+
+
+suggest_index = SuggestIndex()
+register_stats("suggest", suggest_index.stats)
@@ -0,0 +1,196 @@
+"""
+Fixture comuni dei test del backend.
+
+I test usano l'app FastAPI senza lifespan (nessuna connessione a MongoDB o a
+Keycloak): il database è sostituito da FakeDatabase, che restituisce i
+documenti in memoria e registra filtri, proiezioni e pipeline ricevute, e
+l'autenticazione da un override di get_verified_token con i ruoli richiesti.
+"""
+import os
+
+os.environ.setdefault("MONGODB_DB_NAME", "bookslibrary_test")
+
+from datetime import datetime
+from typing import List, Optional
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import auth
+import database
+from main import app
+from search_cache import search_cache
+
+
+def apply_projection(doc: dict, projection: Optional[dict]) -> dict:
+    """Applica una proiezione MongoDB (inclusione o esclusione) a un documento"""
+    if not projection:
+        return dict(doc)
+    if any(projection.values()):
+        campi = {name for name, value in projection.items() if value}
+        return {name: value for name, value in doc.items() if name == "_id" or name in campi}
+    return {name: value for name, value in doc.items() if name not in projection}
+
+
+def pipeline_projection(pipeline: List[dict]) -> Optional[dict]:
+    """Proiezione dello stage $project di una pipeline (anche dentro $facet)"""
+    for stage in pipeline:
+        if "$project" in stage:
+            return stage["$project"]
+        if "$facet" in stage:
+            return pipeline_projection(stage["$facet"]["libri"])
+    return None
+
+
+class FakeCursor:
+    """Cursor in memoria con l'interfaccia usata dalle route (sort, limit, batch_size, to_list, async for)"""
+
+    def __init__(self, docs: List[dict]):
+        self.docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, limit: int):
+        self.docs = self.docs[:limit]
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    async def to_list(self, length: Optional[int] = None):
+        return list(self.docs)
+
+    async def close(self):
+        pass
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """
+    Collezione in memoria: dei filtri sono valutati solo _id e le condizioni
+    {"campo": {"$in": [...]}} (None corrisponde anche al campo mancante); la
+    proiezione è applicata come farebbe MongoDB. Ogni chiamata è registrata
+    in `calls` come (metodo, filtro o pipeline, proiezione).
+    """
+
+    def __init__(self, docs: List[dict]):
+        self.docs = docs
+        self.calls = []
+
+    def _match(self, query: dict) -> List[dict]:
+        docs = self.docs
+        filtro_id = query.get("_id")
+        if filtro_id is not None:
+            ids = filtro_id["$in"] if isinstance(filtro_id, dict) else [filtro_id]
+            docs = [doc for doc in docs if doc["_id"] in ids]
+        for campo, condizione in query.items():
+            if campo != "_id" and isinstance(condizione, dict) and "$in" in condizione:
+                docs = [doc for doc in docs if doc.get(campo) in condizione["$in"]]
+        return docs
+
+    async def find_one_and_update(self, query: dict, update: dict, return_document=None, **kwargs):
+        self.calls.append(("find_one_and_update", query, None))
+        docs = self._match(query)
+        if not docs:
+            return None
+        prima = dict(docs[0])
+        docs[0].update(update.get("$set", {}))
+        for campo, n in update.get("$inc", {}).items():
+            docs[0][campo] = docs[0].get(campo, 0) + n
+        return prima
+
+    async def update_one(self, query: dict, update: dict, **kwargs):
+        self.calls.append(("update_one", query, None))
+
+    def find(self, query: dict, projection: Optional[dict] = None):
+        self.calls.append(("find", query, projection))
+        return FakeCursor([apply_projection(doc, projection) for doc in self._match(query)])
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None):
+        self.calls.append(("find_one", query, projection))
+        docs = self._match(query)
+        return apply_projection(docs[0], projection) if docs else None
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        projection = pipeline_projection(pipeline)
+        self.calls.append(("aggregate", pipeline, projection))
+        libri = [apply_projection(doc, projection) for doc in self.docs]
+        if any("$facet" in stage for stage in pipeline):
+            facet = next(stage["$facet"] for stage in pipeline if "$facet" in stage)
+            return FakeCursor([{"libri": libri, **{name: [] for name in facet if name != "libri"}}])
+        return FakeCursor(libri)
+
+
+class FakeDatabase:
+    def __init__(self, libri: List[dict]):
+        self.libri = FakeCollection(libri)
+        self.statistiche = FakeCollection([])
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return getattr(self, name)
+
+
+# Lettore registrato come affittuario nel libro di prova
+AFFITTUARIO = "lettore.riservato"
+
+
+def make_libro(**campi) -> dict:
+    libro = {
+        "_id": ObjectId(),
+        "titolo": "Il nome della rosa",
+        "authors": ["Umberto Eco"],
+        "publisher": "Bompiani",
+        "language": "it",
+        "categories": ["Romanzo"],
+        "isbn_10": "8845292614",
+        "prenotazione": False,
+        "affittato_da": AFFITTUARIO,
+        "data_restituzione": datetime(2025, 1, 1, 10, 0),
+        "stato_libro": "buono",
+        "versione": 1,
+    }
+    libro.update(campi)
+    return libro
+
+
+@pytest.fixture
+def libro() -> dict:
+    return make_libro()
+
+
+@pytest.fixture
+def fake_db(libro, monkeypatch) -> FakeDatabase:
+    db = FakeDatabase([libro])
+    monkeypatch.setattr(database, "database", db)
+    # Ogni test parte senza pagine di ricerca in cache
+    search_cache.invalidate()
+    return db
+
+
+def token_entry(roles: List[str], sub: Optional[str] = "utente-1") -> dict:
+    """Voce della cache dei token come la costruisce get_verified_token"""
+    return {
+        "payload": {"sub": sub},
+        "user": {"username": "mario", "email": None, "name": None, "sub": sub, "roles": roles},
+    }
+
+
+@pytest.fixture
+def client():
+    yield TestClient(app, headers={"Authorization": "Bearer test"})
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(params=["admin", "user"])
+def role(request, client) -> str:
+    """Esegue il test una volta come admin e una volta come utente normale"""
+    app.dependency_overrides[auth.get_verified_token] = lambda: token_entry([request.param])
+    return request.param
@@ -0,0 +1,155 @@
+"""Riconciliazione delle statistiche concorrente con gli aggiornamenti incrementali"""
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from catalog_stats import CatalogStats, STATS_COLLECTION, STATS_ID, GENERATION_FIELD, stats_delta
+from conftest import FakeCursor, make_libro
+
+
+def facet(libri: list) -> dict:
+    """Risultato dell'aggregazione $facet di CatalogStats su una lista di libri"""
+    def gruppi(valori):
+        return [{"_id": valore, "n": n} for valore, n in Counter(valori).items()]
+
+    return {
+        "totale": [{"n": len(libri)}] if libri else [],
+        "per_stato": gruppi(libro.get("stato_libro") for libro in libri),
+        "per_prenotazione": gruppi(libro.get("prenotazione") for libro in libri),
+        "per_lingua": gruppi(libro.get("language") for libro in libri),
+        "per_categoria": gruppi(c for libro in libri for c in libro.get("categories") or []),
+    }
+
+
+class Libri:
+    """Collection libri: l'aggregazione vede i libri presenti all'inizio e poi esegue `durante`"""
+
+    def __init__(self, docs: list):
+        self.docs = docs
+        self.durante = None
+
+    def aggregate(self, pipeline):
+        risultato = facet(list(self.docs))
+        durante, self.durante = self.durante, None
+
+        class Cursor(FakeCursor):
+            async def to_list(self, length=None):
+                if durante:
+                    await durante()
+                return [risultato]
+
+        return Cursor([risultato])
+
+
+class Statistiche:
+    """Collection delle statistiche con $inc, $set e i filtri usati da CatalogStats"""
+
+    def __init__(self):
+        self.doc = None
+
+    def _match(self, query: dict) -> bool:
+        if self.doc is None:
+            return False
+        return all(self.doc.get(campo) == valore for campo, valore in query.items())
+
+    async def find_one(self, query: dict, projection=None):
+        return dict(self.doc) if self._match(query) else None
+
+    async def insert_one(self, doc: dict):
+        if self.doc is not None:
+            raise DuplicateKeyError("E11000")
+        self.doc = dict(doc)
+
+    async def replace_one(self, query: dict, doc: dict):
+        matched = self._match(query)
+        if matched:
+            self.doc = dict(doc)
+        return SimpleNamespace(matched_count=int(matched))
+
+    async def update_one(self, query: dict, modifiche: dict):
+        if not self._match(query):
+            return SimpleNamespace(matched_count=0)
+        for percorso, n in modifiche["$inc"].items():
+            if "." in percorso:
+                breakdown, chiave = percorso.split(".", 1)
+                gruppo = self.doc.setdefault(breakdown, {})
+                gruppo[chiave] = gruppo.get(chiave, 0) + n
+            else:
+                self.doc[percorso] = self.doc.get(percorso, 0) + n
+        self.doc.update(modifiche.get("$set", {}))
+        return SimpleNamespace(matched_count=1)
+
+
+class Database(dict):
+    def __init__(self, libri: list):
+        super().__init__({STATS_COLLECTION: Statistiche()})
+        self.libri = Libri(libri)
+
+
+@pytest.fixture
+def db():
+    return Database([make_libro(language="it"), make_libro(language="en")])
+
+
+def test_prima_riconciliazione_crea_il_documento(db):
+    doc = asyncio.run(CatalogStats(interval=0).reconcile(db))
+    assert doc["totale"] == 2
+    assert db[STATS_COLLECTION].doc[GENERATION_FIELD] == 0
+
+
+def test_aggiornamento_durante_la_riconciliazione_non_va_perso(db):
+    stats = CatalogStats(interval=0)
+
+    async def scenario():
+        await stats.reconcile(db)
+
+        # Un inserimento arriva mentre l'aggregazione è in corso e non è visto da essa
+        nuovo = make_libro(language="fr")
+
+        async def inserimento():
+            db.libri.docs.append(nuovo)
+            await stats.apply(db, None, nuovo)
+
+        db.libri.durante = inserimento
+        await stats.reconcile(db)
+        return await stats.read(db)
+
+    risultato = asyncio.run(scenario())
+    assert risultato["totale"] == 3
+    assert risultato["per_lingua"] == {"en": 1, "fr": 1, "it": 1}
+
+
+def test_documento_senza_generazione(db):
+    """I documenti creati prima del contatore vengono comunque riconciliati"""
+    db[STATS_COLLECTION].doc = {"_id": STATS_ID, "totale": 99}
+    doc = asyncio.run(CatalogStats(interval=0).reconcile(db))
+    assert doc["totale"] == 2
+    assert db[STATS_COLLECTION].doc["totale"] == 2
+
+
+def test_aggiornamenti_continui_lasciano_il_documento_incrementale(db, monkeypatch):
+    stats = CatalogStats(interval=0)
+
+    async def scenario():
+        await stats.reconcile(db)
+        originale = db.libri.aggregate
+
+        def aggregate_con_scrittura(pipeline):
+            nuovo = make_libro(language="de")
+
+            async def inserimento():
+                db.libri.docs.append(nuovo)
+                await stats.apply_delta(db, stats_delta(None, nuovo))
+
+            db.libri.durante = inserimento
+            return originale(pipeline)
+
+        monkeypatch.setattr(db.libri, "aggregate", aggregate_con_scrittura)
+        return await stats.reconcile(db)
+
+    doc = asyncio.run(scenario())
+    # Nessun aggiornamento perso: 2 libri iniziali più uno per tentativo
+    assert doc["totale"] == len(db.libri.docs)
@@ -0,0 +1,76 @@
+"""ETag di GET /libri/{id} e aggiornamento condizionato di PUT /libri/{id}"""
+from bson import ObjectId
+
+from serialization import parse_etags
+
+AGGIORNAMENTO = {"stato_libro": "ottimo"}
+
+
+def test_etag_per_ruolo(client, fake_db, libro, role):
+    response = client.get(f"/libri/{libro['_id']}")
+    assert response.headers["ETag"] == ('"1-a"' if role == "admin" else '"1-u"')
+
+
+def test_if_none_match_corrispondente_304(client, fake_db, libro, role):
+    etag = client.get(f"/libri/{libro['_id']}").headers["ETag"]
+    for header in (etag, f"W/{etag}", f'"0-x", {etag}', "*"):
+        response = client.get(f"/libri/{libro['_id']}", headers={"If-None-Match": header})
+        assert response.status_code == 304, header
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+
+def test_if_none_match_dopo_modifica_200(client, fake_db, libro, role):
+    etag = client.get(f"/libri/{libro['_id']}").headers["ETag"]
+    assert client.put(f"/libri/{libro['_id']}", json=AGGIORNAMENTO).status_code == 200
+    response = client.get(f"/libri/{libro['_id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_if_match_aggiornato(client, fake_db, libro, role):
+    etag = client.get(f"/libri/{libro['_id']}").headers["ETag"]
+    response = client.put(f"/libri/{libro['_id']}", json=AGGIORNAMENTO, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == ('"2-a"' if role == "admin" else '"2-u"')
+    assert libro["stato_libro"] == "ottimo"
+
+
+def test_if_match_superato_412(client, fake_db, libro, role):
+    etag = client.get(f"/libri/{libro['_id']}").headers["ETag"]
+    assert client.put(f"/libri/{libro['_id']}", json=AGGIORNAMENTO).status_code == 200
+
+    response = client.put(f"/libri/{libro['_id']}", json={"stato_libro": "pessimo"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert libro["stato_libro"] == "ottimo"
+    assert libro["versione"] == 2
+
+
+def test_if_match_debole_412(client, fake_db, libro, role):
+    """If-Match usa il confronto forte: un ETag debole non corrisponde anche se la versione è giusta"""
+    etag = client.get(f"/libri/{libro['_id']}").headers["ETag"]
+    response = client.put(f"/libri/{libro['_id']}", json=AGGIORNAMENTO, headers={"If-Match": f"W/{etag}"})
+    assert response.status_code == 412
+    assert libro["versione"] == 1
+
+
+def test_if_match_libro_inesistente_404(client, fake_db, role):
+    """Per un libro inesistente la risposta è 404 anche con un If-Match che non corrisponde"""
+    response = client.put(f"/libri/{ObjectId()}", json=AGGIORNAMENTO, headers={"If-Match": '"1-u"'})
+    assert response.status_code == 404
+
+
+def test_if_match_documento_senza_versione(client, fake_db, libro, role):
+    """I libri creati prima del contatore sono alla versione 0"""
+    del libro["versione"]
+    etag = client.get(f"/libri/{libro['_id']}").headers["ETag"]
+    assert etag.startswith('"0-')
+    assert client.put(f"/libri/{libro['_id']}", json=AGGIORNAMENTO, headers={"If-Match": etag}).status_code == 200
+
+
+def test_parse_etags():
+    assert parse_etags(None) is None
+    assert parse_etags('W/"1-u", "2-u"') == ['"1-u"', '"2-u"']
+    assert parse_etags('W/"1-u", "2-u"', weak=False) == ['"2-u"']
+    assert parse_etags('W/"1-u"', weak=False) == []
+    assert parse_etags("*", weak=False) == ["*"]
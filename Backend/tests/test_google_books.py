@@ -0,0 +1,119 @@
+"""Cache e unificazione delle richieste del proxy Google Books (server stub con httpx.MockTransport)"""
+import asyncio
+
+import httpx
+import pytest
+
+from google_books import GoogleBooksClient
+
+STUB_URL = "http://google-books.stub/books/v1/volumes"
+
+
+class StubGoogleBooks:
+    """Risponde con la query ricevuta; con `fail` risponde 503. `rilascia` trattiene le risposte"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.queries = []
+        self.rilascia = asyncio.Event()
+        self.rilascia.set()
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        q = request.url.params["q"]
+        self.queries.append(q)
+        await self.rilascia.wait()
+        if self.fail:
+            return httpx.Response(503, json={"error": "non disponibile"})
+        return httpx.Response(200, json={"totalItems": 1, "items": [{"q": q}]})
+
+
+def make_client(stub: StubGoogleBooks) -> GoogleBooksClient:
+    client = GoogleBooksClient(base_url=STUB_URL)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(stub))
+    return client
+
+
+def test_miss_poi_hit():
+    async def scenario():
+        stub = StubGoogleBooks()
+        client = make_client(stub)
+        primo = await client.search("Il nome  della rosa")
+        secondo = await client.search(" Il nome della rosa ")
+        assert primo == secondo
+        assert stub.queries == ["Il nome  della rosa"]
+        assert client.upstream_calls == 1
+        stats = client.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_query_originale_inviata_a_google_books():
+    async def scenario():
+        stub = StubGoogleBooks()
+        client = make_client(stub)
+        await client.search('intitle:"Il Nome della Rosa"')
+        await client.search('intitle:"il nome della rosa"')
+        # Le maiuscole contano: query diverse, chiavi di cache diverse
+        assert stub.queries == ['intitle:"Il Nome della Rosa"', 'intitle:"il nome della rosa"']
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_richieste_concorrenti_unificate():
+    async def scenario():
+        stub = StubGoogleBooks()
+        stub.rilascia.clear()
+        client = make_client(stub)
+        chiamate = [asyncio.create_task(client.search("rosa")) for _ in range(10)]
+        await asyncio.sleep(0.01)
+        stub.rilascia.set()
+        risultati = await asyncio.gather(*chiamate)
+        assert all(r == risultati[0] for r in risultati)
+        assert stub.queries == ["rosa"]
+        assert client.coalesced == 9
+        assert not client._inflight
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_errore_a_tutti_i_chiamanti_in_attesa():
+    async def scenario():
+        stub = StubGoogleBooks(fail=True)
+        stub.rilascia.clear()
+        client = make_client(stub)
+        chiamate = [asyncio.create_task(client.search("rosa")) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        stub.rilascia.set()
+        risultati = await asyncio.gather(*chiamate, return_exceptions=True)
+        assert all(isinstance(r, httpx.HTTPStatusError) for r in risultati)
+        assert stub.queries == ["rosa"]
+
+        # L'errore non resta in cache: la richiesta successiva riprova
+        stub.fail = False
+        assert (await client.search("rosa"))["totalItems"] == 1
+        assert stub.queries == ["rosa", "rosa"]
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_chiamante_cancellato_non_interrompe_la_richiesta_condivisa():
+    async def scenario():
+        stub = StubGoogleBooks()
+        stub.rilascia.clear()
+        client = make_client(stub)
+        primo = asyncio.create_task(client.search("rosa"))
+        secondo = asyncio.create_task(client.search("rosa"))
+        await asyncio.sleep(0.01)
+        primo.cancel()
+        stub.rilascia.set()
+        assert (await secondo)["totalItems"] == 1
+        with pytest.raises(asyncio.CancelledError):
+            await primo
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,137 @@
+"""Ricostruzione degli indici: il vecchio indice viene eliminato solo quando le query sono coperte"""
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from indexes import IndexManager, INDEXES, STATO_ERRORE, STATO_PRONTO, TEMP_INDEX_SUFFIX, standin_model
+from conftest import FakeCursor
+
+
+def registro(nome: str):
+    return next(model for model in INDEXES["libri"] if model.document["name"] == nome)
+
+
+def info(model) -> dict:
+    """Voce di index_information corrispondente a un IndexModel"""
+    spec = dict(model.document)
+    if "weights" in spec:
+        return {"key": [("_fts", "text"), ("_ftsx", 1)], "weights": spec["weights"],
+                "default_language": spec.get("default_language"), "language_override": spec.get("language_override")}
+    spec["key"] = list(spec["key"].items())
+    spec.pop("name")
+    return spec
+
+
+class Indici:
+    """Collection che registra le operazioni sugli indici; `fallisce` contiene i nomi da rifiutare"""
+
+    def __init__(self, duplicato=None, fallisce=()):
+        self.operazioni = []
+        self.duplicato = duplicato
+        self.fallisce = set(fallisce)
+
+    async def create_indexes(self, models):
+        nome = models[0].document["name"]
+        self.operazioni.append(("create", nome))
+        if nome in self.fallisce:
+            raise OperationFailure("E11000 duplicate key error")
+
+    async def drop_index(self, nome):
+        self.operazioni.append(("drop", nome))
+
+    def aggregate(self, pipeline, **kwargs):
+        self.operazioni.append(("duplicati", None))
+        return FakeCursor([{"_id": {"k0": self.duplicato}, "n": 2}] if self.duplicato else [])
+
+
+def applica(collection, model, existing, force=False):
+    manager = IndexManager({"libri": [model]})
+    asyncio.run(manager.apply_one({"libri": collection}, "libri", model, existing, force=force))
+    return manager.state["libri"][model.document["name"]]
+
+
+# isbn_10 come creato prima dell'indice univoco: stessa chiave, nessuna opzione
+ISBN_PRECEDENTE = {"isbn_10": {"key": [("isbn_10", 1)], "v": 2}}
+ISBN_TEMP = "isbn_10" + TEMP_INDEX_SUFFIX
+
+
+def test_definizione_cambiata_sostituita_tramite_indice_temporaneo():
+    collection = Indici()
+    stato = applica(collection, registro("isbn_10"), ISBN_PRECEDENTE)
+    assert stato["stato"] == STATO_PRONTO
+    assert collection.operazioni == [
+        ("duplicati", None),
+        ("create", ISBN_TEMP),
+        ("drop", "isbn_10"),
+        ("create", "isbn_10"),
+        ("drop", ISBN_TEMP),
+    ]
+
+
+def test_duplicati_lasciano_il_vecchio_indice():
+    collection = Indici(duplicato="8845292614")
+    stato = applica(collection, registro("isbn_10"), ISBN_PRECEDENTE)
+    assert stato["stato"] == STATO_ERRORE
+    assert "8845292614" in stato["errore"]
+    assert collection.operazioni == [("duplicati", None)]
+
+
+def test_errore_nella_costruzione_lascia_l_indice_temporaneo():
+    collection = Indici(fallisce={"isbn_10"})
+    stato = applica(collection, registro("isbn_10"), ISBN_PRECEDENTE)
+    assert stato["stato"] == STATO_ERRORE
+    assert ISBN_TEMP in stato["errore"]
+    assert ("drop", ISBN_TEMP) not in collection.operazioni
+    # Il vecchio indice viene eliminato solo dopo la costruzione di quello temporaneo
+    assert collection.operazioni.index(("create", ISBN_TEMP)) < collection.operazioni.index(("drop", "isbn_10"))
+
+
+def test_indice_temporaneo_rimasto_viene_rimosso():
+    collection = Indici()
+    stato = applica(collection, registro("isbn_10"), {ISBN_TEMP: {"key": [("isbn_10", 1), ("_id", 1)]}})
+    assert stato["stato"] == STATO_PRONTO
+    assert collection.operazioni == [("create", "isbn_10"), ("drop", ISBN_TEMP)]
+
+
+@pytest.mark.parametrize("force", [False, True])
+def test_indice_testuale_conforme_mai_eliminato(force):
+    model = registro("libri_text")
+    collection = Indici()
+    stato = applica(collection, model, {"libri_text": info(model)}, force=force)
+    assert stato["stato"] == STATO_PRONTO
+    assert collection.operazioni == []
+
+
+def test_force_ricostruisce_tramite_indice_temporaneo():
+    model = registro("authors")
+    collection = Indici()
+    stato = applica(collection, model, {"authors": info(model)}, force=True)
+    assert stato["stato"] == STATO_PRONTO
+    assert collection.operazioni == [
+        ("create", "authors" + TEMP_INDEX_SUFFIX),
+        ("drop", "authors"),
+        ("create", "authors"),
+        ("drop", "authors" + TEMP_INDEX_SUFFIX),
+    ]
+
+
+def test_indice_conforme_non_toccato():
+    model = registro("isbn_10")
+    collection = Indici()
+    assert applica(collection, model, {"isbn_10": info(model)})["stato"] == STATO_PRONTO
+    assert collection.operazioni == []
+
+
+def test_indice_temporaneo_diverso_dal_vecchio_e_dal_nuovo():
+    isbn = standin_model(registro("isbn_10").document).document
+    assert list(isbn["key"].items()) == [("isbn_10", 1), ("_id", 1)]
+    assert "unique" not in isbn and "partialFilterExpression" not in isbn
+
+    # Con _id già tra le chiavi si usa il prefisso
+    prestiti = standin_model(registro("prenotazione_data_restituzione").document).document
+    assert list(prestiti["key"].items()) == [("prenotazione", 1), ("data_restituzione", 1)]
+
+    # La collation resta, perché le query sul titolo la usano
+    titolo = standin_model(registro("titolo_it").document).document
+    assert titolo["collation"] == {"locale": "it", "strength": 2}
@@ -0,0 +1,124 @@
+"""Heartbeat dei job: un passo lungo senza progresso non fa scadere il job"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import jobs
+from jobs import JobManager, JOBS_COLLECTION, STATO_COMPLETATO, STATO_IN_ESECUZIONE, STATO_INTERROTTO
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for name, condizione in query.items():
+        valore = doc.get(name)
+        if isinstance(condizione, dict):
+            if "$lt" in condizione and not (valore is not None and valore < condizione["$lt"]):
+                return False
+            if "$nin" in condizione and valore in condizione["$nin"]:
+                return False
+        elif valore != condizione:
+            return False
+    return True
+
+
+def update(doc: dict, modifiche: dict) -> None:
+    doc.update(modifiche.get("$set", {}))
+    for name in modifiche.get("$unset", {}):
+        doc.pop(name, None)
+
+
+class JobsCollection:
+    """Collection jobs in memoria (solo le operazioni usate da JobManager)"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc: dict):
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def update_one(self, query: dict, modifiche: dict):
+        trovati = [doc for doc in self.docs.values() if matches(doc, query)]
+        for doc in trovati[:1]:
+            update(doc, modifiche)
+        return SimpleNamespace(matched_count=len(trovati[:1]))
+
+    async def find_one(self, query: dict):
+        return next((dict(doc) for doc in self.docs.values() if matches(doc, query)), None)
+
+    def find(self, query: dict, projection=None):
+        async def cursor():
+            for doc in list(self.docs.values()):
+                if matches(doc, query):
+                    yield dict(doc)
+        return cursor()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.01)
+    return {JOBS_COLLECTION: JobsCollection()}
+
+
+def test_heartbeat_durante_passo_lungo(db):
+    async def scenario():
+        manager = JobManager()
+        passo = asyncio.Event()
+        stato = {}
+
+        async def handler(ctx):
+            stato["inizio"] = db[JOBS_COLLECTION].docs[ctx.job_id]["aggiornato_il"]
+            # Passo lungo senza chiamate a ctx.progress
+            await asyncio.sleep(0.1)
+            stato["durante"] = db[JOBS_COLLECTION].docs[ctx.job_id]["aggiornato_il"]
+            await passo.wait()
+            return {"ok": True}
+
+        manager.register("lungo", handler)
+        job = await manager.submit(db, "lungo", {}, "admin")
+        await asyncio.sleep(0.15)
+        assert stato["durante"] > stato["inizio"]
+        assert db[JOBS_COLLECTION].docs[job["_id"]]["stato"] == STATO_IN_ESECUZIONE
+
+        # Un altro worker non lo considera scaduto
+        altro = JobManager()
+        await altro._expire_stale(db)
+        assert db[JOBS_COLLECTION].docs[job["_id"]]["attivo"] is True
+
+        passo.set()
+        await asyncio.sleep(0.05)
+        assert db[JOBS_COLLECTION].docs[job["_id"]]["stato"] == STATO_COMPLETATO
+        assert not manager._tasks
+
+    asyncio.run(scenario())
+
+
+def test_job_scaduto_altrove_viene_interrotto(db, monkeypatch):
+    async def scenario():
+        manager = JobManager()
+        fermato = asyncio.Event()
+
+        async def handler(ctx):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                fermato.set()
+                raise
+
+        manager.register("lungo", handler)
+        job = await manager.submit(db, "lungo", {}, "admin")
+        await asyncio.sleep(0.02)
+
+        # Il job viene segnato come interrotto da un altro worker (es. dopo una pausa della rete)
+        monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", 0)
+        doc = db[JOBS_COLLECTION].docs[job["_id"]]
+        doc["aggiornato_il"] = datetime.utcnow() - timedelta(seconds=1)
+        await JobManager()._expire_stale(db)
+        assert doc["stato"] == STATO_INTERROTTO
+
+        await asyncio.wait_for(fermato.wait(), timeout=1)
+        await asyncio.sleep(0.01)
+        assert not manager._tasks
+        assert "attivo" not in doc
+
+    asyncio.run(scenario())
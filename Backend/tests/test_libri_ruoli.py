@@ -0,0 +1,132 @@
+"""
+Visibilità di affittato_da nelle letture dei libri.
+
+Per gli utenti non admin il campo deve essere escluso già dalla proiezione
+passata a MongoDB e non comparire mai nella risposta; gli admin lo ricevono.
+"""
+import orjson
+import pytest
+
+import auth
+from main import app
+from conftest import AFFITTUARIO, token_entry
+
+NDJSON = {"Accept": "application/x-ndjson"}
+
+
+def excludes_affittato_da(projection) -> bool:
+    """True se la proiezione MongoDB non restituisce affittato_da"""
+    if not projection:
+        return False
+    if any(projection.values()):
+        return not projection.get("affittato_da")
+    return "affittato_da" in projection
+
+
+def check_projection(fake_db, role: str) -> None:
+    calls = fake_db.libri.calls
+    assert calls, "nessuna lettura su MongoDB"
+    for metodo, _, projection in calls:
+        if role == "admin":
+            assert not excludes_affittato_da(projection), (metodo, projection)
+        else:
+            assert excludes_affittato_da(projection), (metodo, projection)
+
+
+def check_libri(response, libri: list, role: str) -> None:
+    assert libri
+    if role == "admin":
+        assert all(libro["affittato_da"] == AFFITTUARIO for libro in libri)
+    else:
+        assert all(libro.get("affittato_da") is None for libro in libri)
+        assert AFFITTUARIO not in response.text
+
+
+def ndjson_libri(response) -> list:
+    return [orjson.loads(riga) for riga in response.content.splitlines() if riga]
+
+
+@pytest.mark.parametrize("mode", ["text", "regex"])
+def test_search_pagina(client, fake_db, role, mode):
+    response = client.get("/libri/search", params={"q": "rosa", "mode": mode})
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, response.json(), role)
+
+
+@pytest.mark.parametrize("mode", ["text", "regex"])
+def test_search_ndjson(client, fake_db, role, mode):
+    response = client.get("/libri/search", params={"q": "rosa", "mode": mode}, headers=NDJSON)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    check_projection(fake_db, role)
+    check_libri(response, ndjson_libri(response), role)
+
+
+def test_search_fields(client, fake_db, role):
+    response = client.get("/libri/search", params={"q": "rosa", "fields": "titolo,affittato_da"})
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, response.json(), role)
+
+
+def test_search_facets(client, fake_db, role):
+    response = client.get("/libri/search", params={"q": "rosa", "facets": "language"})
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, response.json()["libri"], role)
+
+
+def test_search_cache_per_ruolo(client, fake_db, role):
+    """Una pagina in cache per un ruolo non viene servita all'altro"""
+    altro = "user" if role == "admin" else "admin"
+    app.dependency_overrides[auth.get_verified_token] = lambda: token_entry([altro])
+    assert client.get("/libri/search", params={"q": "rosa"}).status_code == 200
+
+    app.dependency_overrides[auth.get_verified_token] = lambda: token_entry([role])
+    fake_db.libri.calls.clear()
+    response = client.get("/libri/search", params={"q": "rosa"})
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, response.json(), role)
+
+
+def test_lista_pagina(client, fake_db, role):
+    response = client.get("/libri")
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, response.json(), role)
+
+
+def test_lista_ndjson(client, fake_db, role):
+    response = client.get("/libri", headers=NDJSON)
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, ndjson_libri(response), role)
+
+
+def test_libro_per_id(client, fake_db, libro, role):
+    response = client.get(f"/libri/{libro['_id']}")
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    check_libri(response, [response.json()], role)
+
+
+def test_libro_per_id_etag_per_ruolo(client, fake_db, libro, role):
+    """L'ETag dipende dal ruolo: un 304 non restituisce la rappresentazione dell'altro ruolo"""
+    response = client.get(f"/libri/{libro['_id']}")
+    etag = response.headers["ETag"]
+    assert client.get(f"/libri/{libro['_id']}", headers={"If-None-Match": etag}).status_code == 304
+
+    altro = '"1-u"' if role == "admin" else '"1-a"'
+    assert etag != altro
+    assert client.get(f"/libri/{libro['_id']}", headers={"If-None-Match": altro}).status_code == 200
+
+
+def test_batch(client, fake_db, libro, role):
+    response = client.post("/libri/batch", json={"ids": [str(libro["_id"]), str(libro["_id"])]})
+    assert response.status_code == 200
+    check_projection(fake_db, role)
+    body = response.json()
+    assert body["non_trovati"] == []
+    check_libri(response, body["libri"], role)
@@ -0,0 +1,55 @@
+"""Accesso a /metrics: token statico di Prometheus o token di un admin"""
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+from main import app
+from routes import metrics
+from conftest import token_entry
+
+
+@pytest.fixture
+def anonimo():
+    return TestClient(app)
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def token_in_cache(token: str, roles) -> str:
+    auth.token_cache.set(hashlib.sha256(token.encode()).digest(), token_entry(roles))
+    return token
+
+
+def test_senza_credenziali(anonimo):
+    assert anonimo.get("/metrics").status_code == 401
+
+
+def test_token_non_valido(anonimo, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "segreto")
+
+    async def rifiuta(token):
+        raise auth.HTTPException(status_code=401, detail="Token non valido o scaduto")
+
+    monkeypatch.setattr(auth, "decode_token", rifiuta)
+    assert anonimo.get("/metrics", headers=bearer("sbagliato")).status_code == 401
+
+
+def test_token_statico(anonimo, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "segreto")
+    response = anonimo.get("/metrics", headers=bearer("segreto"))
+    assert response.status_code == 200
+    assert "# HELP" in response.text
+
+
+def test_utente_non_admin(anonimo):
+    token = token_in_cache("token-utente-metriche", ["user"])
+    assert anonimo.get("/metrics", headers=bearer(token)).status_code == 403
+
+
+def test_admin(anonimo):
+    token = token_in_cache("token-admin-metriche", ["admin"])
+    assert anonimo.get("/metrics", headers=bearer(token)).status_code == 200
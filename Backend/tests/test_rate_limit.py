@@ -0,0 +1,46 @@
+"""Rate limit per utente in get_verified_token"""
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+from admission import RateLimiter
+from conftest import token_entry
+
+
+@pytest.fixture
+def limiter(monkeypatch) -> RateLimiter:
+    # Un solo gettone, ricaricato dopo molto tempo
+    limiter = RateLimiter(rate=0.001, burst=1)
+    monkeypatch.setattr(auth, "rate_limiter", limiter)
+    return limiter
+
+
+def richiesta(token: str, sub):
+    """Chiama get_verified_token con un token già in cache"""
+    auth.token_cache.set(hashlib.sha256(token.encode()).digest(), token_entry(["user"], sub=sub))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return asyncio.run(auth.get_verified_token(credentials))
+
+
+def test_bucket_per_sub(limiter):
+    richiesta("token-a", "utente-1")
+    with pytest.raises(HTTPException) as e:
+        # Token diverso, stesso utente: stesso bucket
+        richiesta("token-b", "utente-1")
+    assert e.value.status_code == 429
+    assert int(e.value.headers["Retry-After"]) >= 1
+
+    richiesta("token-c", "utente-2")
+
+
+def test_token_senza_sub_non_condividono_il_bucket(limiter):
+    richiesta("senza-sub-1", None)
+    richiesta("senza-sub-2", None)
+
+    with pytest.raises(HTTPException) as e:
+        richiesta("senza-sub-1", None)
+    assert e.value.status_code == 429
@@ -0,0 +1,92 @@
+"""Cache delle pagine di /libri/search: generazione e separazione per ruolo"""
+import pytest
+
+import auth
+from main import app
+
+from search import SEARCH_MODE_REGEX, SEARCH_MODE_TEXT
+from search_cache import SearchCache, search_cache
+from conftest import AFFITTUARIO, token_entry
+
+RICERCA = {"q": "rosa"}
+
+
+def cerca(client, mode: str):
+    response = client.get("/libri/search", params={**RICERCA, "mode": mode})
+    assert response.status_code == 200
+    return response.json()
+
+
+def letture(fake_db) -> int:
+    return sum(1 for metodo, *_ in fake_db.libri.calls if metodo in ("find", "aggregate"))
+
+
+def scrivi_durante_la_lettura(fake_db, libro, monkeypatch):
+    """
+    Alla prossima lettura dei libri la collezione restituisce lo stato corrente
+    e subito dopo arriva una scrittura (come fa PUT /libri/{id}), prima che la
+    ricerca salvi la pagina in cache.
+    """
+    scritto = []
+    for metodo in ("find", "aggregate"):
+        originale = getattr(fake_db.libri, metodo)
+
+        def lettura(*args, _originale=originale, **kwargs):
+            risultato = _originale(*args, **kwargs)
+            if not scritto:
+                scritto.append(True)
+                libro["stato_libro"] = "ottimo"
+                search_cache.invalidate()
+            return risultato
+
+        monkeypatch.setattr(fake_db.libri, metodo, lettura)
+
+
+@pytest.mark.parametrize("mode", [SEARCH_MODE_TEXT, SEARCH_MODE_REGEX])
+def test_pagina_servita_dalla_cache(client, fake_db, role, mode):
+    prima = cerca(client, mode)
+    fake_db.libri.calls.clear()
+    assert cerca(client, mode) == prima
+    assert letture(fake_db) == 0
+
+
+@pytest.mark.parametrize("mode", [SEARCH_MODE_TEXT, SEARCH_MODE_REGEX])
+def test_scrittura_tra_lettura_e_salvataggio(client, fake_db, libro, role, mode, monkeypatch):
+    """Una pagina letta prima di una scrittura non viene salvata: la ricerca successiva rilegge"""
+    scrivi_durante_la_lettura(fake_db, libro, monkeypatch)
+    assert cerca(client, mode)[0]["stato_libro"] == "buono"
+
+    fake_db.libri.calls.clear()
+    assert cerca(client, mode)[0]["stato_libro"] == "ottimo"
+    assert letture(fake_db) == 1
+
+
+@pytest.mark.parametrize("mode", [SEARCH_MODE_TEXT, SEARCH_MODE_REGEX])
+def test_pagina_admin_mai_servita_a_utente(client, fake_db, mode):
+    app.dependency_overrides[auth.get_verified_token] = lambda: token_entry(["admin"])
+    assert cerca(client, mode)[0]["affittato_da"] == AFFITTUARIO
+
+    app.dependency_overrides[auth.get_verified_token] = lambda: token_entry(["user"])
+    fake_db.libri.calls.clear()
+    response = client.get("/libri/search", params={**RICERCA, "mode": mode})
+    assert AFFITTUARIO.encode() not in response.content
+    assert response.json()[0].get("affittato_da") is None
+    assert letture(fake_db) == 1
+
+
+def test_set_con_generazione_superata():
+    cache = SearchCache()
+    chiave = SearchCache.key("rosa", SEARCH_MODE_TEXT, {}, 20, None, None, None, False)
+    generazione = cache.generation
+    cache.invalidate()
+    cache.set(chiave, generazione, b"[]", None)
+    assert cache.get(chiave) is None
+
+    cache.set(chiave, cache.generation, b"[]", None)
+    assert cache.get(chiave) == (b"[]", None)
+
+
+def test_chiave_per_ruolo():
+    admin = SearchCache.key("rosa", SEARCH_MODE_TEXT, {}, 20, None, None, None, True)
+    utente = SearchCache.key("rosa", SEARCH_MODE_TEXT, {}, 20, None, None, None, False)
+    assert admin != utente
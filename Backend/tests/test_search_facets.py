@@ -0,0 +1,60 @@
+"""Filtri e conteggi delle faccette coerenti con i default dei documenti senza il campo"""
+import auth
+from main import app
+from models import LibriFacetsResponse
+from search import build_facet_filters, build_facet_pipelines
+from serialization import LIBRO_DEFAULTS
+from conftest import token_entry
+
+
+def group_id(pipeline: list):
+    return next(stage["$group"]["_id"] for stage in pipeline if "$group" in stage)
+
+
+def test_faccette_con_default_raggruppano_i_campi_mancanti():
+    pipelines = build_facet_pipelines(["prenotazione", "stato_libro", "language"])
+    assert group_id(pipelines["prenotazione"]) == {"$ifNull": ["$prenotazione", LIBRO_DEFAULTS["prenotazione"]]}
+    assert group_id(pipelines["stato_libro"]) == {"$ifNull": ["$stato_libro", LIBRO_DEFAULTS["stato_libro"]]}
+    assert group_id(pipelines["language"]) == "$language"
+
+
+def test_faccetta_categories_espande_la_lista():
+    pipeline = build_facet_pipelines(["categories"])["categories"]
+    assert pipeline[0] == {"$unwind": "$categories"}
+    assert group_id(pipeline) == "$categories"
+
+
+def test_filtro_prenotazione():
+    # I documenti senza il campo sono disponibili (default True)
+    assert build_facet_filters(prenotazione=True) == {"prenotazione": {"$ne": False}}
+    assert build_facet_filters(prenotazione=False) == {"prenotazione": False}
+
+
+def test_filtro_stato_libro():
+    assert build_facet_filters(stato_libro=["buono"]) == {"stato_libro": {"$in": ["buono", None]}}
+    assert build_facet_filters(stato_libro=["pessimo"]) == {"stato_libro": "pessimo"}
+    assert build_facet_filters(stato_libro=["pessimo", "buono"]) == {
+        "stato_libro": {"$in": ["pessimo", "buono", None]}
+    }
+
+
+def test_filtri_senza_default():
+    assert build_facet_filters(language="it", categories=["Romanzo"], publisher=["A", "B"]) == {
+        "language": "it",
+        "categories": "Romanzo",
+        "publisher": {"$in": ["A", "B"]},
+    }
+    assert build_facet_filters() == {}
+
+
+def test_risposta_con_faccette_conforme_allo_schema(client, fake_db):
+    app.dependency_overrides[auth.get_verified_token] = lambda: token_entry(["user"])
+    response = client.get("/libri/search", params={"q": "rosa", "facets": "language,prenotazione"})
+    assert response.status_code == 200
+    risposta = LibriFacetsResponse.model_validate(response.json())
+    assert set(risposta.facets) == {"language", "prenotazione"}
+
+
+def test_schema_openapi_della_ricerca():
+    schema = app.openapi()["paths"]["/libri/search"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert {"$ref": "#/components/schemas/LibriFacetsResponse"} in schema["anyOf"]
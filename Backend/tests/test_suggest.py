@@ -0,0 +1,158 @@
+"""Costruzione dell'indice dei suggerimenti con scritture concorrenti"""
+import asyncio
+import copy
+
+from bson import ObjectId
+
+from suggest import SuggestIndex
+from conftest import FakeCollection, FakeCursor, FakeDatabase
+
+
+class ScanCursor(FakeCursor):
+    """Cursor della lettura completa: prima del documento i esegue scritture[i]"""
+
+    def __init__(self, docs, scritture):
+        super().__init__(docs)
+        self.scritture = scritture
+
+    async def _iter(self):
+        for i, doc in enumerate(self.docs):
+            for scrittura in self.scritture.pop(i, ()):
+                scrittura()
+            await asyncio.sleep(0)
+            yield copy.deepcopy(doc)
+
+
+class Libri(FakeCollection):
+    def __init__(self, docs):
+        super().__init__(docs)
+        self.scritture = {}
+        self.scansioni = 0
+
+    def find(self, query=None, projection=None):
+        if query:
+            return super().find(query, projection)
+        self.scansioni += 1
+        return ScanCursor(list(self.docs), self.scritture)
+
+
+def libro(titolo: str, autore: str = "Umberto Eco") -> dict:
+    return {"_id": ObjectId(), "titolo": titolo, "authors": [autore], "publisher": "Bompiani"}
+
+
+def db_con(libri) -> FakeDatabase:
+    db = FakeDatabase([])
+    db.libri = Libri(libri)
+    return db
+
+
+def conteggi(index: SuggestIndex) -> dict:
+    return {index.values[v]: n for v, n in index.counts.items()}
+
+
+def rinomina(index: SuggestIndex, doc: dict, titolo: str):
+    """Scrittura come la fa PUT /libri/{id}: prima il database, poi l'indice"""
+    def scrittura():
+        before = copy.deepcopy(doc)
+        doc["titolo"] = titolo
+        index.update(before, copy.deepcopy(doc))
+    return scrittura
+
+
+def inserisci(db, index: SuggestIndex, doc: dict):
+    def scrittura():
+        db.libri.docs.append(doc)
+        index.update(None, copy.deepcopy(doc))
+    return scrittura
+
+
+def elimina(db, index: SuggestIndex, doc: dict):
+    def scrittura():
+        db.libri.docs.remove(doc)
+        index.update(copy.deepcopy(doc), None)
+    return scrittura
+
+
+def atteso(libri) -> dict:
+    index = SuggestIndex()
+    index.ready = True
+    for doc in libri:
+        index.update(None, doc)
+    return conteggi(index)
+
+
+def test_costruzione_conta_i_valori():
+    libri = [libro("Il nome della rosa"), libro("Baudolino"), libro("Baudolino", "Altro")]
+    db = db_con(libri)
+    index = SuggestIndex()
+    asyncio.run(index.build(db))
+    assert index.ready
+    assert conteggi(index) == atteso(libri)
+    assert conteggi(index)[("titolo", "Baudolino")] == 2
+    assert [s["testo"] for s in index.suggest("baud", 5)] == ["Baudolino"]
+
+
+def test_scrittura_su_libro_gia_letto():
+    """Il cursor ha contato il documento prima della scrittura"""
+    libri = [libro("Il nome della rosa"), libro("Baudolino"), libro("Numero zero")]
+    db = db_con(libri)
+    index = SuggestIndex()
+    db.libri.scritture[2] = [rinomina(index, libri[0], "Il pendolo di Foucault")]
+    asyncio.run(index.build(db))
+    assert conteggi(index) == atteso(libri)
+    assert ("titolo", "Il nome della rosa") not in conteggi(index)
+
+
+def test_scrittura_su_libro_non_ancora_letto():
+    """Il cursor legge il documento dopo la scrittura: non va contato due volte"""
+    libri = [libro("Il nome della rosa"), libro("Baudolino"), libro("Numero zero")]
+    db = db_con(libri)
+    index = SuggestIndex()
+    db.libri.scritture[0] = [rinomina(index, libri[2], "Baudolino")]
+    asyncio.run(index.build(db))
+    assert conteggi(index) == atteso(libri)
+    assert conteggi(index)[("titolo", "Baudolino")] == 2
+
+
+def test_inserimenti_e_cancellazioni_durante_la_lettura():
+    libri = [libro("Il nome della rosa"), libro("Baudolino"), libro("Numero zero")]
+    db = db_con(libri)
+    index = SuggestIndex()
+    nuovo = libro("L'isola del giorno prima")
+    db.libri.scritture[1] = [
+        inserisci(db, index, nuovo),
+        elimina(db, index, libri[0]),
+        rinomina(index, libri[2], "Baudolino"),
+    ]
+    db.libri.scritture[2] = [rinomina(index, nuovo, "Il cimitero di Praga")]
+    asyncio.run(index.build(db))
+    assert conteggi(index) == atteso(db.libri.docs)
+
+
+def test_costruzioni_concorrenti_condividono_la_lettura():
+    libri = [libro("Il nome della rosa"), libro("Baudolino")]
+    db = db_con(libri)
+    index = SuggestIndex()
+
+    async def due_costruzioni():
+        await index.start(db)
+        await asyncio.gather(index.build(db), index.build(db))
+
+    asyncio.run(due_costruzioni())
+    assert db.libri.scansioni == 1
+    assert conteggi(index) == atteso(libri)
+
+
+def test_costruzione_fallita_applica_le_scritture_all_indice_precedente():
+    libri = [libro("Il nome della rosa")]
+    db = db_con(libri)
+    index = SuggestIndex()
+    asyncio.run(index.build(db))
+
+    def guasto():
+        raise RuntimeError("connessione persa")
+
+    nuovo = libro("Baudolino")
+    db.libri.scritture[0] = [inserisci(db, index, nuovo), guasto]
+    asyncio.run(index.build(db))
+    assert conteggi(index) == atteso(db.libri.docs)
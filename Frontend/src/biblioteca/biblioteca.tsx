@@ -1310,8 +1310,26 @@ function Biblioteca({ keycloak, handleLogout }: BibliotecaProps) {
                     throw new Error(errorData.detail || `Errore HTTP: ${response.status}`)
                   }
                   
-                  const result = await response.json()
-                  alert(`Cancellati ${result.libri_cancellati} libri dal database`)
+                  // La cancellazione prosegue in background: si segue il job fino alla fine
+                  let job = (await response.json()).job
+                  while (job.stato === 'in_coda' || job.stato === 'in_esecuzione') {
+                    await new Promise(resolve => setTimeout(resolve, 1000))
+                    await keycloak.updateToken(30)
+                    const jobResponse = await fetch(`/api/admin/jobs/${job.id}`, {
+                      headers: {
+                        'Authorization': `Bearer ${keycloak.token}`
+                      }
+                    })
+                    if (!jobResponse.ok) {
+                      throw new Error(`Errore HTTP: ${jobResponse.status}`)
+                    }
+                    job = await jobResponse.json()
+                  }
+
+                  if (job.stato !== 'completato') {
+                    throw new Error(`Cancellazione ${job.stato}: ${job.progresso.elaborati} libri cancellati${job.errore ? ` (${job.errore})` : ''}`)
+                  }
+                  alert(`Cancellati ${job.risultato.libri_cancellati} libri dal database`)
                   
                   // Pulisci la ricerca
                   setSearchQuery('')